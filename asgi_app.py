@@ -0,0 +1,295 @@
+"""
+ASGI route layer for the async pipeline (AsyncRAGAssistant).
+
+Exposes the same JSON/SSE API as main.py without a thread per request:
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 8001
+
+Evaluations queued with evaluation_async are processed by the same durable
+EvaluationJobQueue worker pool that main.py uses.
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from config import EVALUATION_MODE, EVALUATION_ASYNC
+from async_rag_assistant import AsyncRAGAssistant
+from client_registry import aclose_loop_clients
+from evaluation_model import EvaluationModel, EVALUATION_MODES
+from evaluation_jobs import EvaluationJobQueue
+from streaming import acoalesce_tokens
+from structured_logging import configure_logging, set_request_id, inbound_request_id
+from metrics import REGISTRY as METRICS
+from tracing import start_trace, span
+
+logger = logging.getLogger(__name__)
+
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+
+rag_assistant: Optional[AsyncRAGAssistant] = None
+evaluation_queue: Optional[EvaluationJobQueue] = None
+
+
+def _startup() -> None:
+    global rag_assistant, evaluation_queue
+    configure_logging()
+    rag_assistant = AsyncRAGAssistant()
+    try:
+        evaluation_queue = EvaluationJobQueue(handler=rag_assistant.run_evaluation_request)
+        evaluation_queue.start()
+        rag_assistant.evaluation_queue = evaluation_queue
+    except Exception as e:
+        logger.error(f"Failed to start evaluation queue: {e}")
+    logger.info("Async RAG Assistant initialized")
+
+
+async def _shutdown() -> None:
+    if evaluation_queue:
+        evaluation_queue.stop()
+    await aclose_loop_clients()
+
+
+# ───────────── HTTP helpers ─────────────
+async def _read_json(receive: Receive) -> Optional[Dict[str, Any]]:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    try:
+        return json.loads(body) if body else None
+    except ValueError:
+        return None
+
+
+async def _send_json(send: Send, status: int, payload: Dict[str, Any]) -> None:
+    with span("serialize"):
+        body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _wait_for_disconnect(receive: Receive) -> None:
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _run_until_disconnect(coro: Awaitable[None], receive: Receive) -> None:
+    """Run a response coroutine, cancelling it if the client disconnects first."""
+    task = asyncio.ensure_future(coro)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not task.done():
+            logger.info("Client disconnected; cancelling stream")
+            task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+def _sse(event: str, payload: Dict[str, Any]) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode("utf-8")
+
+
+def _format_sources(sources):
+    return [
+        {'title': s.get('title', f'Source {i}'), 'content': s.get('content', ''),
+         'score': s.get('score', 0), 'tokens': s.get('tokens')}
+        for i, s in enumerate(sources or [], 1)
+    ]
+
+
+def _settings_from_request(data: Dict[str, Any]):
+    model = data.get('model', 'gpt-4o')
+    # Omit temperature and top_p for o3, o4-mini, and gpt-4o
+    if model in ['o3', 'o4-mini', 'gpt-4o']:
+        temperature, top_p = None, None
+    else:
+        temperature, top_p = data.get('temperature', 0.7), data.get('top_p', 0.9)
+    return model, rag_assistant.default_settings().with_overrides(
+        deployment=model,
+        temperature=temperature,
+        top_p=top_p,
+        max_tokens=data.get('max_tokens', 1000),
+        top_k=data.get('top_k', 50),
+        casefile_system_prompt=data.get('system_prompt'),
+    )
+
+
+def _validate(data: Optional[Dict[str, Any]]) -> Optional[str]:
+    if not data or 'query' not in data:
+        return 'Query is required'
+    if data.get('evaluation_mode') and data['evaluation_mode'] not in EVALUATION_MODES:
+        return f"evaluation_mode must be one of {list(EVALUATION_MODES)}"
+    return None
+
+
+# ───────────── routes ─────────────
+async def query(receive: Receive, send: Send) -> None:
+    data = await _read_json(receive)
+    error = _validate(data)
+    if error:
+        return await _send_json(send, 400, {'error': error})
+    model, settings = _settings_from_request(data)
+    try:
+        answer, sources, _, evaluation, _ = await rag_assistant.generate_rag_response(
+            data['query'],
+            appended_prompt=data.get('appended_prompt', ''),
+            settings=settings,
+            evaluation_mode=data.get('evaluation_mode', EVALUATION_MODE),
+            evaluation_async=bool(data.get('evaluation_async', EVALUATION_ASYNC)),
+        )
+    except Exception as e:
+        logger.error(f"Error in /api/query: {e}")
+        return await _send_json(send, 500, {
+            'error': str(e), 'status': 'error', 'timestamp': datetime.now().isoformat()
+        })
+    await _send_json(send, 200, {
+        'answer': answer,
+        'sources': _format_sources(sources),
+        'model': model,
+        'temperature': settings.temperature,
+        'top_k': settings.top_k,
+        'top_p': settings.top_p,
+        'max_tokens': settings.max_tokens,
+        'status': 'success',
+        'timestamp': datetime.now().isoformat(),
+        'evaluation': EvaluationModel.primary_report(evaluation),
+        'evaluations': evaluation,
+        'evaluation_job_id': evaluation.get('job_id'),
+    })
+
+
+async def query_stream(receive: Receive, send: Send) -> None:
+    data = await _read_json(receive)
+    error = _validate(data)
+    if error:
+        return await _send_json(send, 400, {'error': error})
+    model, settings = _settings_from_request(data)
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ],
+    })
+
+    async def emit(event: str, payload: Dict[str, Any]) -> None:
+        await send({"type": "http.response.body", "body": _sse(event, payload), "more_body": True})
+
+    async def pump() -> None:
+        await emit('meta', {'model': model, 'timestamp': datetime.now().isoformat()})
+        items = rag_assistant.stream_rag_response(
+            data['query'],
+            appended_prompt=data.get('appended_prompt', ''),
+            settings=settings,
+            evaluation_mode=data.get('evaluation_mode', EVALUATION_MODE),
+            evaluation_async=bool(data.get('evaluation_async', EVALUATION_ASYNC)),
+        )
+        try:
+            async for item in acoalesce_tokens(items):
+                if isinstance(item, str):
+                    await emit('token', {'text': item})
+                elif 'source' in item:
+                    source = item['source']
+                    await emit('source', {'source': dict(_format_sources([source])[0], id=source['id'])})
+                elif 'sources' in item:
+                    await emit('sources', {'sources': _format_sources(item['sources']), 'answer': item.get('answer')})
+                elif 'evaluation' in item:
+                    evaluation = item['evaluation'] or {}
+                    await emit('evaluation', {
+                        'evaluation': EvaluationModel.primary_report(evaluation),
+                        'evaluations': evaluation,
+                        'evaluation_job_id': evaluation.get('job_id'),
+                    })
+                elif 'error' in item:
+                    await emit('error', {'error': item['error']})
+        finally:
+            await items.aclose()
+        await emit('done', {'status': 'success', 'timestamp': datetime.now().isoformat()})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    await _run_until_disconnect(pump(), receive)
+
+
+async def evaluation_job(job_id: str, send: Send) -> None:
+    if not evaluation_queue:
+        return await _send_json(send, 503, {'error': 'Evaluation queue unavailable'})
+    job = evaluation_queue.get(job_id)
+    if job is None:
+        return await _send_json(send, 404, {'error': 'Evaluation job not found'})
+    await _send_json(send, 200, {
+        'id': job['id'],
+        'status': job['status'],
+        'attempts': job['attempts'],
+        'error': job['error'],
+        'evaluation': EvaluationModel.primary_report(job['result']),
+        'evaluations': job['result'],
+    })
+
+
+async def app(scope: Dict[str, Any], receive: Receive, send: Send) -> None:
+    """ASGI application callable."""
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                _startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await _shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+    # Each ASGI request runs in its own task, so this binding is per request
+    request_id = set_request_id(inbound_request_id(
+        dict(scope.get("headers") or []).get(b"x-request-id", b"").decode("latin-1")
+    ))
+    if rag_assistant is None:
+        _startup()
+
+    method, path = scope["method"], scope["path"]
+    with start_trace(f"{method} {path}", trace_id=request_id):
+        await _route(method, path, receive, send)
+
+
+async def _route(method: str, path: str, receive: Receive, send: Send) -> None:
+    if method == "POST" and path == "/api/query":
+        return await query(receive, send)
+    if method == "POST" and path == "/api/query/stream":
+        return await query_stream(receive, send)
+    if method == "GET" and path.startswith("/api/evaluations/"):
+        return await evaluation_job(path[len("/api/evaluations/"):], send)
+    if method == "GET" and path == "/api/system_prompt":
+        return await _send_json(send, 200, {'system_prompt': rag_assistant.system_prompt})
+    if method == "GET" and path == "/api/metrics":
+        body = METRICS.render().encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/plain; version=0.0.4"), (b"content-length", str(len(body)).encode())],
+        })
+        return await send({"type": "http.response.body", "body": body})
+    if method == "GET" and path == "/api/health":
+        return await _send_json(send, 200, {
+            'status': 'healthy',
+            'rag_assistant': 'available',
+            'mode': 'async',
+            'timestamp': datetime.now().isoformat(),
+        })
+    await _send_json(send, 404, {'error': 'Endpoint not found'})
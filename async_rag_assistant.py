@@ -0,0 +1,278 @@
+"""
+asyncio-native variant of FlaskRAGAssistant.
+
+Same interface as FlaskRAGAssistant (query / generate_rag_response /
+stream_rag_response), but every remote call is awaited on AsyncAzureOpenAI
+and the aio SearchClient, so one process can keep hundreds of requests in
+flight instead of tying up a worker thread per request. Prompt building,
+parameters and cache keys come from RAGAssistantBase, shared with the sync
+assistant; blocking work (the SQLite embedding tier, embedding-based
+context stages, queue writes) runs on worker threads. Served by asgi_app.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple, Union
+
+from rag_assistant import RAGAssistantBase, GenerationSettings
+from evaluation_model import normalize_evaluation_mode
+from citations import StreamingCitationTracker
+from streaming import aclose_upstream
+from metrics import observe, record_usage
+from tracing import span, usage_attributes
+from client_registry import get_async_deployment_client
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRAGAssistant(RAGAssistantBase):
+    """RAG assistant whose request path is made of coroutines."""
+
+    # ───────────── embeddings ─────────────
+    async def generate_embedding(self, text: str) -> Optional[List[float]]:
+        if not text:
+            return None
+        with span("embedding", deployment=self.embedding_deployment) as sp:
+            cache = self.embedding_cache
+            if cache is not None:
+                # The disk tier is SQLite; keep it off the event loop
+                cached = await asyncio.to_thread(cache.get, self.embedding_deployment, text)
+                if cached is not None:
+                    sp.set(cache_hit=True)
+                    return cached
+            sp.set(cache_hit=False)
+            client, _ = get_async_deployment_client(None)
+            try:
+                started = time.perf_counter()
+                with observe("embedding", self.embedding_deployment):
+                    resp = await client.embeddings.create(
+                        model=self.embedding_deployment,
+                        input=text.strip(),
+                    )
+                embedding = resp.data[0].embedding
+            except Exception as exc:
+                logger.error("Embedding error: %s", exc)
+                sp.set(error=str(exc))
+                return None
+            if cache is not None:
+                cache.record_miss_latency(time.perf_counter() - started)
+                await asyncio.to_thread(cache.put, self.embedding_deployment, text, embedding)
+            return embedding
+
+    # ───────────── retrieval ───────────
+    async def search_knowledge_base(
+        self, query: str, settings: GenerationSettings = None, q_vec: Optional[List[float]] = None
+    ) -> List[Dict]:
+        search_index = (settings.search_index if settings else None) or self.search_index
+        try:
+            q_vec = q_vec or await self.generate_embedding(query)
+            if not q_vec:
+                return []
+            retriever = self._retriever(search_index)
+            with observe("search", search_index), span("search", backend=retriever.name, index=search_index) as sp:
+                hits = await retriever.asearch(query, q_vec)
+                sp.set(hits=len(hits))
+                return hits
+        except Exception as exc:
+            logger.error("Search error: %s", exc)
+            return []
+
+    async def _aprepare_context(self, results: List[Dict], settings: GenerationSettings, query: str):
+        # Embedding-based dedupe or compression makes blocking embedding calls; keep them off the loop
+        if any(stage is not None and stage.needs_embeddings
+               for stage in (self.diversifier, self.compressor)):
+            return await asyncio.to_thread(self._prepare_context, results, settings, query)
+        return self._prepare_context(results, settings, query)
+
+    # ───────────── chat ─────────────
+    async def _chat_answer(
+        self, query: str, context: str, src_map: Dict, appended_prompt: str = None,
+        settings: GenerationSettings = None
+    ) -> str:
+        settings = settings or self.default_settings()
+        messages = self._build_messages(query, context, settings, appended_prompt)
+        client, deployment_name = get_async_deployment_client(settings.deployment)
+        self._log_chat_request(deployment_name, settings, messages)
+        with observe("chat", deployment_name), span("chat", deployment=deployment_name) as sp:
+            resp = await client.chat.completions.create(
+                **self._completion_params(deployment_name, messages, settings)
+            )
+            usage = getattr(resp, "usage", None)
+            sp.set(**usage_attributes(usage))
+        answer = resp.choices[0].message.content
+        self._record_chat_response(deployment_name, answer, usage)
+        return answer
+
+    # ───────────── evaluation ─────────────
+    async def _evaluate(
+        self, mode: str, query: str, answer: str, cited: List[Dict], context: str,
+        settings: GenerationSettings, appended_prompt: str = None, evaluate_async: bool = False
+    ) -> Dict[str, Any]:
+        mode = normalize_evaluation_mode(mode)
+        if mode == "none":
+            return {"mode": mode}
+        request = self._evaluation_request(
+            mode, query, answer, cited, context, settings, appended_prompt
+        )
+        if evaluate_async and self.evaluation_queue is not None:
+            job_id = await asyncio.to_thread(self.evaluation_queue.enqueue, request)
+            logger.info("Queued %s evaluation job %s", mode, job_id)
+            return {"mode": mode, "job_id": job_id, "status": "queued"}
+        return await self.arun_evaluation_request(request)
+
+    async def arun_evaluation_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Async counterpart of run_evaluation_request."""
+        self._log_evaluation_request(request)
+        evaluator = self._evaluator(request.get("deployment"))
+        client, _ = get_async_deployment_client(request.get("deployment"))
+        return await evaluator.arun(
+            client,
+            request["mode"],
+            user_query=request["user_query"],
+            system_prompt=request["system_prompt"],
+            model_response=request["model_response"],
+            sources=request["sources"],
+            casefile=request.get("casefile"),
+        )
+
+    # ─────────── public API ───────────────
+    async def query(
+        self, query: str, deployment: str = None, temperature: float = None,
+        top_p: float = None, max_tokens: int = None, appended_prompt: str = None,
+        top_k: int = None, evaluation_mode: str = None, evaluation_async: bool = False,
+        casefile_system_prompt: str = None
+    ) -> Tuple[str, List[Dict], Dict[str, Any]]:
+        settings = self.default_settings().with_overrides(
+            deployment=deployment or None,
+            temperature=temperature,
+            top_p=top_p,
+            max_tokens=max_tokens,
+            top_k=top_k,
+            casefile_system_prompt=casefile_system_prompt,
+        )
+        answer, sources, _, evaluation, _ = await self.generate_rag_response(
+            query, appended_prompt=appended_prompt, settings=settings,
+            evaluation_mode=evaluation_mode, evaluation_async=evaluation_async,
+        )
+        return answer, sources, evaluation
+
+    async def generate_rag_response(
+        self, query: str, appended_prompt: str = None, settings: GenerationSettings = None,
+        evaluation_mode: str = None, evaluation_async: bool = False
+    ) -> Tuple[str, List[Dict], List[Dict], Dict[str, Any], str]:
+        settings = settings or self.default_settings()
+        cache_ns = q_vec = None
+        if self.response_cache is not None:
+            cache_ns = self._response_cache_namespace(settings, appended_prompt)
+            q_vec = await self.generate_embedding(query)
+            hit = self._lookup_response(cache_ns, q_vec, query)
+            if hit is not None:
+                evaluation = self._cached_evaluation(hit, evaluation_mode)
+                if evaluation is None:
+                    evaluation = await self._evaluate(
+                        evaluation_mode, query, hit["answer"], hit["sources"], hit["context"],
+                        settings, appended_prompt, evaluate_async=evaluation_async,
+                    )
+                return hit["answer"], hit["sources"], [], evaluation, hit["context"]
+        kb_results = await self.search_knowledge_base(query, settings=settings, q_vec=q_vec)
+        if not kb_results:
+            ans = await self._chat_answer(query, "", {}, appended_prompt=appended_prompt, settings=settings)
+            evaluation = await self._evaluate(
+                evaluation_mode, query, ans, [], "", settings, appended_prompt,
+                evaluate_async=evaluation_async,
+            )
+            return ans, [], [], evaluation, ""
+        context, src_map = await self._aprepare_context(kb_results, settings, query)
+        ans = await self._chat_answer(
+            query, context, src_map, appended_prompt=appended_prompt, settings=settings
+        )
+        ans, cited = self._renumber_citations(ans, src_map)
+        evaluation = await self._evaluate(
+            evaluation_mode, query, ans, cited, context, settings, appended_prompt,
+            evaluate_async=evaluation_async,
+        )
+        if cache_ns is not None:
+            self._store_response(cache_ns, q_vec, ans, cited, context, evaluation)
+        self._log_response(query, ans, cited, context)
+        return ans, cited, [], evaluation, context
+
+    async def stream_rag_response(
+        self, query: str, appended_prompt: str = None, settings: GenerationSettings = None,
+        evaluation_mode: str = None, evaluation_async: bool = False
+    ) -> AsyncGenerator[Union[str, Dict], None]:
+        """Async generator with the same item protocol as FlaskRAGAssistant.stream_rag_response."""
+        settings = settings or self.default_settings()
+        try:
+            cache_ns = q_vec = None
+            if self.response_cache is not None:
+                cache_ns = self._response_cache_namespace(settings, appended_prompt)
+                q_vec = await self.generate_embedding(query)
+                hit = self._lookup_response(cache_ns, q_vec, query)
+                if hit is not None:
+                    yield hit["answer"]
+                    yield {"sources": hit["sources"], "answer": hit["answer"]}
+                    evaluation = self._cached_evaluation(hit, evaluation_mode)
+                    if evaluation is None:
+                        evaluation = await self._evaluate(
+                            evaluation_mode, query, hit["answer"], hit["sources"], hit["context"],
+                            settings, appended_prompt, evaluate_async=evaluation_async,
+                        )
+                    yield {"evaluation": evaluation}
+                    return
+            kb_results = await self.search_knowledge_base(query, settings=settings, q_vec=q_vec)
+            if not kb_results:
+                # Same answer and evaluation as generate_rag_response without context
+                ans = await self._chat_answer(query, "", {}, appended_prompt=appended_prompt, settings=settings)
+                yield ans
+                yield {"sources": [], "answer": ans}
+                yield {"evaluation": await self._evaluate(
+                    evaluation_mode, query, ans, [], "", settings, appended_prompt,
+                    evaluate_async=evaluation_async,
+                )}
+                return
+            context, src_map = await self._aprepare_context(kb_results, settings, query)
+            messages = self._build_messages(query, context, settings, appended_prompt)
+            client, deployment_name = get_async_deployment_client(settings.deployment)
+            params = self._completion_params(deployment_name, messages, settings)
+            stream_span = span("chat_stream", deployment=deployment_name)
+            tracker = StreamingCitationTracker(src_map)
+            usage = None
+            with observe("chat", deployment_name):
+                try:
+                    stream = await client.chat.completions.create(
+                        stream=True, stream_options={"include_usage": True}, **params
+                    )
+                except Exception as exc:
+                    stream_span.fail(exc).finish()
+                    raise
+                try:
+                    async for chunk in stream:
+                        usage = getattr(chunk, "usage", None) or usage
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            for item in self._tracked(tracker.feed(chunk.choices[0].delta.content)):
+                                yield item
+                except (GeneratorExit, asyncio.CancelledError):
+                    logger.info("Stream consumer went away after %d chars; closing upstream", len(tracker.answer))
+                    raise
+                finally:
+                    await aclose_upstream(stream)
+                    stream_span.set(
+                        chars=len(tracker.answer), cited=len(tracker.cited), **usage_attributes(usage)
+                    ).finish()
+            record_usage(deployment_name, usage)
+            for item in self._tracked(tracker.flush()):
+                yield item
+            collected, cited = tracker.answer, tracker.cited
+            self._log_response(query, collected, cited, context)
+            yield {"sources": cited, "answer": collected}
+            evaluation = await self._evaluate(
+                evaluation_mode, query, collected, cited, context, settings, appended_prompt,
+                evaluate_async=evaluation_async,
+            )
+            if cache_ns is not None:
+                self._store_response(cache_ns, q_vec, collected, cited, context, evaluation)
+            yield {"evaluation": evaluation}
+        except Exception as exc:
+            logger.error("RAG stream error: %s", exc)
+            yield "I encountered an error while streaming the response."
+            yield {"error": str(exc)}
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Batch evaluation runner: retrieval, answer and casefile evaluation for a question set.
+
+Reads questions from JSONL or CSV (a ``query`` or ``question`` field; the
+optional fields are ``id``, ``model``, ``appended_prompt``, ``temperature``,
+``top_p``, ``top_k`` and ``max_tokens``). Each item goes through
+FlaskRAGAssistant.generate_rag_response in a bounded worker pool, and
+chat calls are rate-limited per deployment. Every finished item is appended
+to ``<out>/results.jsonl``, which doubles as the checkpoint: a rerun with
+the same --out skips items that already succeeded with the same effective
+settings and retries the rest. An item whose retrieval came back empty is
+recorded as an error, not a result.
+Each success is also exported as ``<out>/markdown/rag-session-*.md`` in
+the same format as the UI session export (see evals/).
+
+    python batch_eval.py questions.jsonl --out evals/batch-prompt-v2 --workers 8 --rpm gpt-4o=300
+
+Under CASSETTE_MODE=auto (see cassette.py) a rerun replays the recorded
+embedding, search, answer and casefile-evaluation calls instead of
+calling Azure again.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import sys
+import textwrap
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from structured_logging import set_request_id
+
+logger = logging.getLogger(__name__)
+
+ITEM_FIELDS = ("id", "query", "model", "appended_prompt", "temperature", "top_p", "top_k", "max_tokens")
+# One answer plus one evaluator completion per item
+CALLS_PER_ITEM = 2
+SOURCE_PREVIEW_CHARS = 200
+
+
+# ───────────── input ─────────────
+def _item_id(item: Dict[str, Any]) -> str:
+    """Stable id, so a reordered or extended question file still resumes correctly."""
+    key = json.dumps([item.get(k) for k in ITEM_FIELDS if k != "id"])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+
+def _normalize(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    query = (row.get("query") or row.get("question") or "").strip()
+    if not query:
+        return None
+    item = {k: row[k] for k in ITEM_FIELDS if row.get(k) not in (None, "")}
+    item["query"] = query
+    for name, cast in (("temperature", float), ("top_p", float), ("top_k", int), ("max_tokens", int)):
+        if name in item:
+            item[name] = cast(item[name])
+    item["id"] = str(item.get("id") or _item_id(item))
+    return item
+
+
+def load_questions(path: str) -> List[Dict[str, Any]]:
+    """Questions from a .jsonl or .csv file; rows without a query are skipped."""
+    with open(path, encoding="utf-8", newline="") as fh:
+        if path.lower().endswith(".csv"):
+            rows: Iterable[Dict[str, Any]] = csv.DictReader(fh)
+        else:
+            rows = (json.loads(line) for line in fh if line.strip())
+        items = [item for item in map(_normalize, rows) if item is not None]
+    seen: Set[str] = set()
+    unique = []
+    for item in items:
+        if item["id"] in seen:
+            logger.warning("Skipping duplicate question id %s", item["id"])
+            continue
+        seen.add(item["id"])
+        unique.append(item)
+    return unique
+
+
+def completed_ids(results_path: str) -> Set[str]:
+    """Run keys (see run_key) answered successfully in an earlier, possibly interrupted, run."""
+    done: Set[str] = set()
+    if not os.path.exists(results_path):
+        return done
+    with open(results_path, encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by the interruption
+            if record.get("status") == "ok" and record.get("key"):
+                done.add(record["key"])
+    return done
+
+
+# ───────────── rate limiting ─────────────
+class RateLimiter:
+    """Token bucket: ``per_minute`` calls on average, bursts up to ``burst``."""
+
+    def __init__(self, per_minute: float, burst: Optional[float] = None) -> None:
+        if per_minute <= 0:
+            raise ValueError("per_minute must be positive")
+        self.rate = per_minute / 60.0
+        self.capacity = burst if burst is not None else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Block until ``tokens`` are available; returns the seconds waited."""
+        if tokens > self.capacity:
+            # The bucket never holds more than its capacity, so this would wait forever
+            raise ValueError(f"cannot acquire {tokens} tokens from a bucket of {self.capacity}")
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class DeploymentLimits:
+    """One RateLimiter per deployment; deployments without a limit pass through."""
+
+    def __init__(self, per_minute: Dict[str, float], default: Optional[float] = None) -> None:
+        self.per_minute = per_minute
+        self.default = default
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, specs: List[str]) -> "DeploymentLimits":
+        """From ``["gpt-4o=300", "o3=60", "120"]``; a bare number applies to every other deployment."""
+        per_minute: Dict[str, float] = {}
+        default = None
+        for spec in specs or []:
+            name, sep, value = spec.rpartition("=")
+            if sep:
+                per_minute[name] = float(value)
+            else:
+                default = float(value)
+        return cls(per_minute, default)
+
+    def acquire(self, deployment: str, tokens: float = 1.0) -> float:
+        rate = self.per_minute.get(deployment, self.default)
+        if not rate:
+            return 0.0
+        with self._lock:
+            limiter = self._limiters.get(deployment)
+            if limiter is None:
+                # Below 60 * tokens per minute, a one-second bucket could never hold a whole request
+                limiter = self._limiters[deployment] = RateLimiter(rate, burst=max(tokens, rate / 60.0))
+        return limiter.acquire(tokens)
+
+
+# ───────────── output ─────────────
+def session_markdown(record: Dict[str, Any]) -> str:
+    """An item in the UI's rag-session export format."""
+    params = record["parameters"]
+    lines = [
+        "# RAG Assistant Session Export",
+        "",
+        "## Session Information",
+        f"- **Timestamp**: {record['finished_at'].replace('T', ' ')}",
+        f"- **Model**: {record['model']}",
+        "",
+        "## Query", "```", record["query"], "```",
+        "",
+        "## System Prompt", "```", textwrap.dedent(record["system_prompt"]).strip(), "```",
+        "",
+        "## Appended Prompt", "```", record.get("appended_prompt") or "", "```",
+        "",
+        "## Model Parameters",
+        f"- **Temperature**: {params.get('temperature')}",
+        f"- **Top K**: {params.get('top_k')}",
+        f"- **Top P**: {params.get('top_p')}",
+        "",
+        "## Response", "```", record["answer"], "```",
+        "",
+        "## Sources",
+    ]
+    for source in record["sources"]:
+        content = source.get("content", "")
+        preview = content[:SOURCE_PREVIEW_CHARS] + ("..." if len(content) > SOURCE_PREVIEW_CHARS else "")
+        lines += ["", f"### {source.get('title', 'Untitled')}", "```", preview, "```"]
+    report = record.get("evaluation") or ""
+    metrics = [line.strip() for line in report.splitlines() if line.strip().startswith("- **")]
+    if metrics:
+        lines += ["", "## Evaluation Metrics", ""] + metrics
+    lines += ["", "## Full Evaluation", report, ""]
+    return "\n".join(lines)
+
+
+class ResultWriter:
+    """Appends one JSON line per finished item (and its markdown export) from any worker."""
+
+    def __init__(self, out_dir: str, markdown: bool = True) -> None:
+        self.results_path = os.path.join(out_dir, "results.jsonl")
+        self.markdown_dir = os.path.join(out_dir, "markdown") if markdown else None
+        os.makedirs(self.markdown_dir or out_dir, exist_ok=True)
+        self._fh = open(self.results_path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        if self.markdown_dir and record["status"] == "ok":
+            stamp = record["finished_at"].replace("-", "").replace(":", "").replace("T", "-")[:15]
+            path = os.path.join(self.markdown_dir, f"rag-session-{stamp}-{record['id']}.md")
+            with open(path, "w", encoding="utf-8") as fh:
+                fh.write(session_markdown(record))
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            self._fh.write(line)
+            self._fh.flush()
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+# ───────────── run ─────────────
+def effective_settings(item: Dict[str, Any], defaults: Dict[str, Any]) -> Dict[str, Any]:
+    """The model, appended prompt and sampling overrides an item runs with."""
+    effective = {
+        "model": item.get("model") or defaults["model"],
+        "appended_prompt": item.get("appended_prompt", defaults.get("appended_prompt", "")),
+    }
+    for name in ("temperature", "top_p", "top_k", "max_tokens"):
+        effective[name] = item.get(name, defaults.get(name))
+    # Reasoning deployments reject sampling parameters (as in main.py)
+    if effective["model"] in ("o3", "o4-mini", "gpt-4o"):
+        effective["temperature"] = effective["top_p"] = None
+    return effective
+
+
+def run_key(item: Dict[str, Any], effective: Dict[str, Any]) -> str:
+    """Checkpoint key: an item only counts as done under the settings it ran with."""
+    key = json.dumps([item["id"], effective], sort_keys=True)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def evaluate_item(assistant, item: Dict[str, Any], effective: Dict[str, Any], limits: DeploymentLimits) -> Dict[str, Any]:
+    """Retrieve, answer and casefile-evaluate one question; returns its result record."""
+    model = effective["model"]
+    overrides = {name: effective[name] for name in ("temperature", "top_p", "top_k", "max_tokens")}
+    settings = assistant.default_settings().with_overrides(deployment=model, **overrides)
+
+    set_request_id(f"batch-{item['id']}")
+    started = time.perf_counter()
+    # search_knowledge_base returns [] on errors; fail before paying for the answer and the evaluator
+    # (the repeat inside generate_rag_response is served by the embedding cache)
+    if not assistant.search_knowledge_base(item["query"], settings=settings):
+        raise RuntimeError("retrieval returned no results")
+    limits.acquire(model, CALLS_PER_ITEM)
+    answer, sources, _, evaluation, context = assistant.generate_rag_response(
+        item["query"], appended_prompt=effective["appended_prompt"], settings=settings,
+        evaluation_mode="casefile", evaluation_async=False,
+    )
+    if not context:
+        # An answer without context is not a result
+        raise RuntimeError("retrieval returned no context")
+    return {
+        "id": item["id"],
+        "status": "ok",
+        "query": item["query"],
+        "model": model,
+        "appended_prompt": effective["appended_prompt"],
+        "system_prompt": assistant.system_prompt,
+        "parameters": {
+            "temperature": settings.temperature, "top_p": settings.top_p,
+            "top_k": settings.top_k, "max_tokens": settings.max_tokens,
+        },
+        "answer": answer,
+        "sources": [{"title": s.get("title"), "content": s.get("content")} for s in sources],
+        "evaluation": (evaluation or {}).get("casefile"),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def run_batch(
+    items: List[Dict[str, Any]], assistant, out_dir: str, workers: int = 4,
+    limits: Optional[DeploymentLimits] = None, defaults: Optional[Dict[str, Any]] = None,
+    retries: int = 1, markdown: bool = True, progress_every: int = 10,
+) -> Dict[str, int]:
+    """Run every item not already completed under ``out_dir``; returns counts."""
+    limits = limits or DeploymentLimits({})
+    defaults = dict({"model": "gpt-4o"}, **(defaults or {}))
+    writer = ResultWriter(out_dir, markdown)
+    done = completed_ids(writer.results_path)
+    pending = []
+    for item in items:
+        effective = effective_settings(item, defaults)
+        key = run_key(item, effective)
+        if key not in done:
+            pending.append((item, effective, key))
+    counts = {"total": len(items), "skipped": len(items) - len(pending), "ok": 0, "failed": 0}
+    lock = threading.Lock()
+    started = time.monotonic()
+
+    def work(task) -> None:
+        item, effective, key = task
+        for attempt in range(1, retries + 2):
+            try:
+                record = evaluate_item(assistant, item, effective, limits)
+                break
+            except Exception as exc:
+                logger.warning("Item %s attempt %d failed: %s", item["id"], attempt, exc)
+                record = {"id": item["id"], "status": "error", "query": item["query"], "error": repr(exc)}
+                if attempt <= retries:
+                    time.sleep(min(2 ** attempt, 30))
+        record["key"] = key
+        record["attempts"] = attempt
+        record["finished_at"] = datetime.now().isoformat(timespec="seconds")
+        writer.write(record)
+        with lock:
+            counts["ok" if record["status"] == "ok" else "failed"] += 1
+            finished = counts["ok"] + counts["failed"]
+            if progress_every and (finished % progress_every == 0 or finished == len(pending)):
+                elapsed = time.monotonic() - started
+                eta = elapsed / finished * (len(pending) - finished)
+                print(
+                    f"[{finished}/{len(pending)}] ok={counts['ok']} failed={counts['failed']} "
+                    f"{finished / elapsed * 60:.1f}/min eta {eta:.0f}s",
+                    file=sys.stderr,
+                )
+
+    try:
+        with ThreadPoolExecutor(max(1, workers)) as pool:
+            list(pool.map(work, pending))
+    finally:
+        writer.close()
+    return counts
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("questions", help=".jsonl or .csv question set")
+    parser.add_argument("--out", required=True, help="output directory; reuse it to resume")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rpm", action="append", default=[], metavar="[DEPLOYMENT=]N",
+                        help="chat calls per minute for a deployment (repeatable); a bare N limits all")
+    parser.add_argument("--model", default="gpt-4o", help="deployment for items without a model")
+    parser.add_argument("--appended-prompt", default="")
+    parser.add_argument("--temperature", type=float)
+    parser.add_argument("--top-p", type=float)
+    parser.add_argument("--top-k", type=int)
+    parser.add_argument("--max-tokens", type=int)
+    parser.add_argument("--retries", type=int, default=1)
+    parser.add_argument("--no-markdown", action="store_true")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    from rag_assistant import FlaskRAGAssistant
+
+    items = load_questions(args.questions)
+    defaults = {
+        "model": args.model, "appended_prompt": args.appended_prompt, "temperature": args.temperature,
+        "top_p": args.top_p, "top_k": args.top_k, "max_tokens": args.max_tokens,
+    }
+    counts = run_batch(
+        items, FlaskRAGAssistant(), args.out, workers=args.workers,
+        limits=DeploymentLimits.parse(args.rpm), defaults=defaults,
+        retries=args.retries, markdown=not args.no_markdown,
+    )
+    print(
+        f"{counts['ok']} ok, {counts['failed']} failed, {counts['skipped']} already done "
+        f"of {counts['total']}; results in {os.path.join(args.out, 'results.jsonl')}"
+    )
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Compare threaded FlaskRAGAssistant throughput with AsyncRAGAssistant.
+
+Both pipelines run against in-process fake search and chat clients that
+sleep for a fixed latency, so no Azure tokens are spent:
+
+    python benchmarks/bench_async.py --requests 500 --threads 32 --latency-ms 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rag_assistant
+import async_rag_assistant
+from rag_assistant import FlaskRAGAssistant
+from async_rag_assistant import AsyncRAGAssistant
+
+HITS = [{"chunk": f"Passage {i} about lab funds.", "title": f"Doc {i}"} for i in range(5)]
+
+
+def _completion():
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content="Funds are edited in the grid [1]."))],
+        usage=SimpleNamespace(prompt_tokens=1, completion_tokens=1),
+    )
+
+
+def _sync_assistant(latency: float) -> FlaskRAGAssistant:
+    def create(**params):
+        time.sleep(latency)
+        return _completion()
+
+    def search(query, settings=None, q_vec=None):
+        time.sleep(latency)
+        return list(HITS)
+
+    chat = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    rag_assistant.get_deployment_client = lambda model: (chat, model)
+    assistant = FlaskRAGAssistant()
+    assistant.search_knowledge_base = search
+    return assistant
+
+
+def _async_assistant(latency: float) -> AsyncRAGAssistant:
+    async def create(**params):
+        await asyncio.sleep(latency)
+        return _completion()
+
+    async def search(query, settings=None, q_vec=None):
+        await asyncio.sleep(latency)
+        return list(HITS)
+
+    chat = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    async_rag_assistant.get_async_deployment_client = lambda model: (chat, model)
+    assistant = AsyncRAGAssistant()
+    assistant.search_knowledge_base = search
+    return assistant
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    args = parser.parse_args()
+    latency = args.latency_ms / 1000.0
+
+    sync_assistant = _sync_assistant(latency)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(lambda i: sync_assistant.query(f"q{i}", evaluation_mode="none"), range(args.requests)))
+    threaded = time.perf_counter() - started
+
+    async_assistant = _async_assistant(latency)
+
+    async def run():
+        await asyncio.gather(*[
+            async_assistant.query(f"q{i}", evaluation_mode="none") for i in range(args.requests)
+        ])
+
+    started = time.perf_counter()
+    asyncio.run(run())
+    concurrent = time.perf_counter() - started
+
+    print(f"requests:     {args.requests}")
+    print(f"threaded:     {threaded:.2f}s  ({args.requests / threaded:.1f} req/s, {args.threads} threads)")
+    print(f"asyncio:      {concurrent:.2f}s  ({args.requests / concurrent:.1f} req/s, 1 thread)")
+    print(f"speedup:      {threaded / concurrent:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Compare one-at-a-time embedding calls with FlaskRAGAssistant.generate_embeddings.
+
+Runs against an in-process fake embeddings client whose latency is a fixed
+round-trip cost plus a small per-input cost, so no Azure tokens are spent:
+
+    python benchmarks/bench_embeddings.py --texts 200 --rtt-ms 120
+"""
+import argparse
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rag_assistant import FlaskRAGAssistant
+
+
+class FakeEmbeddings:
+    def __init__(self, rtt_ms: float, per_item_ms: float, dim: int) -> None:
+        self.rtt = rtt_ms / 1000.0
+        self.per_item = per_item_ms / 1000.0
+        self.dim = dim
+        self.requests = 0
+
+    def create(self, model, input):
+        inputs = input if isinstance(input, list) else [input]
+        self.requests += 1
+        time.sleep(self.rtt + self.per_item * len(inputs))
+        data = [
+            SimpleNamespace(index=i, embedding=[float(len(text) % 7)] * self.dim)
+            for i, text in enumerate(inputs)
+        ]
+        return SimpleNamespace(data=data)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--texts", type=int, default=200)
+    parser.add_argument("--rtt-ms", type=float, default=120.0)
+    parser.add_argument("--per-item-ms", type=float, default=1.0)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--concurrency", type=int, default=None)
+    args = parser.parse_args()
+
+    texts = [f"benchmark question number {i} about lab funds" for i in range(args.texts)]
+
+    assistant = FlaskRAGAssistant()
+    assistant.embedding_cache = None  # measure the transport path only
+    fake = FakeEmbeddings(args.rtt_ms, args.per_item_ms, args.dim)
+    assistant.openai_client = SimpleNamespace(embeddings=fake)
+
+    started = time.perf_counter()
+    for text in texts:
+        assistant.generate_embedding(text)
+    sequential = time.perf_counter() - started
+    sequential_requests = fake.requests
+
+    fake.requests = 0
+    started = time.perf_counter()
+    vectors, errors = assistant.generate_embeddings(texts, concurrency=args.concurrency)
+    batched = time.perf_counter() - started
+
+    print(f"texts:        {len(texts)}")
+    print(f"sequential:   {sequential:.2f}s  ({sequential_requests} requests)")
+    print(f"batched:      {batched:.2f}s  ({fake.requests} requests, {len(errors)} errors)")
+    print(f"speedup:      {sequential / batched:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
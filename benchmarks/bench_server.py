@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test of main.py against the local mock Azure endpoints.
+
+Starts benchmarks/mock_azure.py, points the app's OpenAI and Search
+settings at it, serves main.app on a local port and drives /api/query,
+/api/query/stream and /api/evaluate over HTTP at each concurrency level.
+Reports p50/p95/p99 latency, throughput, time to first token (streaming)
+and the per-stage breakdown from /api/metrics, and writes everything to a
+JSON file that a later run can be compared against:
+
+    python benchmarks/bench_server.py --concurrency 1,8,32 --requests 200
+    python benchmarks/bench_server.py --compare benchmarks/results/<baseline>.json
+
+Caches are off unless --caches is given, so every request takes the full
+path. Mock latencies, streaming rate and error injection take the
+mock_azure.py options.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import mock_azure
+
+SCENARIOS = ("query", "stream", "evaluate")
+QUESTIONS = [
+    "How do I edit lab funds?",
+    "Who approves a funding change?",
+    "Can past allocations be changed?",
+    "How many accounts can a lab have?",
+]
+STAGE_SAMPLE = re.compile(
+    r'^rag_stage_latency_seconds_(sum|count)\{stage="([^"]+)",deployment="[^"]*"\} (\S+)$', re.M
+)
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Linear-interpolated percentile (q in 0-100)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100
+    lo = math.floor(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def summarize(values_ms: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "p50": percentile(values_ms, 50),
+        "p95": percentile(values_ms, 95),
+        "p99": percentile(values_ms, 99),
+        "mean": sum(values_ms) / len(values_ms) if values_ms else None,
+        "max": max(values_ms) if values_ms else None,
+    }
+
+
+# ───────────── app under test ─────────────
+def mock_environment(url: str, workdir: str, caches: bool, log_level: str) -> Dict[str, str]:
+    """Settings that route every Azure call of the app to the mock at ``url``."""
+    env = {
+        "DOTENV_OVERRIDE": "false",
+        "OPENAI_ENDPOINT": url,
+        "OPENAI_KEY": "mock",
+        "AZURE_OPENAI_API_KEY": "mock",
+        "OPENAI_API_VERSION": "2024-06-01",
+        "EMBEDDING_DEPLOYMENT": "mock-embedding",
+        "CHAT_DEPLOYMENT": "gpt-4o",
+        "SEARCH_ENDPOINT": url,
+        "SEARCH_INDEX": "mock-index",
+        "SEARCH_KEY": "mock",
+        "VECTOR_FIELD": "vector",
+        "RETRIEVER_BACKEND": "azure",
+        "LEXICAL_FUSION": "false",
+        "EMBEDDING_CACHE_ENABLED": str(caches).lower(),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embeddings.sqlite3"),
+        "SEMANTIC_CACHE_ENABLED": str(caches).lower(),
+        "EVALUATION_JOBS_DB": os.path.join(workdir, "evaluation_jobs.sqlite3"),
+        "LOG_FILE": os.path.join(workdir, "app.log"),
+        "LOG_LEVEL": log_level,
+        "METRICS_ENABLED": "true",
+        "TRACING_ENABLED": "false",
+        "PROFILING_ENABLED": "false",
+    }
+    for prefix, deployment, name_var in (
+        ("O3", "o3", "O3_DEPLOYMENT_NAME"),
+        ("O4_MINI", "o4-mini", "O4_MINI_DEPLOYMENT_NAME"),
+        ("GPT4O", "gpt-4o", "GPT4O_DEPLOYMENT"),
+    ):
+        env.update({
+            f"{prefix}_ENDPOINT": url,
+            f"{prefix}_KEY": "mock",
+            f"{prefix}_API_VERSION": "2024-06-01",
+            name_var: deployment,
+        })
+    return env
+
+
+def serve_app() -> Tuple[str, Callable[[], None]]:
+    """Import main (after the environment is set) and serve it on a free port."""
+    from werkzeug.serving import make_server
+    import main
+
+    # werkzeug sets its own logger to INFO, which would log every benchmark request
+    logging.getLogger("werkzeug").setLevel(os.environ.get("LOG_LEVEL", "WARNING"))
+
+    if main.rag_assistant is None:
+        raise SystemExit("RAG assistant failed to initialise; see the log above")
+    server = make_server("127.0.0.1", 0, main.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-app", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server.shutdown
+
+
+# ───────────── scenarios ─────────────
+def _query(client: httpx.Client, i: int, args) -> Dict:
+    resp = client.post("/api/query", json={
+        "query": QUESTIONS[i % len(QUESTIONS)], "model": args.model, "evaluation_mode": args.evaluation_mode,
+    })
+    return {"ok": resp.status_code == 200 and resp.json().get("status") == "success"}
+
+
+def _stream(client: httpx.Client, i: int, args) -> Dict:
+    started = time.perf_counter()
+    first_token = None
+    ok = False
+    with client.stream("POST", "/api/query/stream", json={
+        "query": QUESTIONS[i % len(QUESTIONS)], "model": args.model, "evaluation_mode": args.evaluation_mode,
+    }) as resp:
+        for line in resp.iter_lines():
+            if line == "event: token" and first_token is None:
+                first_token = (time.perf_counter() - started) * 1000
+            elif line == "event: error":
+                break
+            elif line == "event: done":
+                ok = True
+    return {"ok": ok and resp.status_code == 200, "ttft_ms": first_token}
+
+
+def _evaluate(client: httpx.Client, i: int, args) -> Dict:
+    resp = client.post("/api/evaluate", json={
+        "user_query": QUESTIONS[i % len(QUESTIONS)],
+        "system_prompt": "Answer from the sources and cite them.",
+        "model_response": mock_azure.ANSWER,
+        "sources": [{"title": t, "content": c} for t, c in mock_azure.PASSAGES[:3]],
+        "model": args.model,
+    })
+    return {"ok": resp.status_code == 200 and "diagnostic" in resp.json()}
+
+
+RUNNERS = {"query": _query, "stream": _stream, "evaluate": _evaluate}
+
+
+def stage_totals(client: httpx.Client) -> Dict[str, List[float]]:
+    """stage -> [seconds, count] summed over deployments, from /api/metrics."""
+    totals: Dict[str, List[float]] = {}
+    for kind, stage, value in STAGE_SAMPLE.findall(client.get("/api/metrics").text):
+        totals.setdefault(stage, [0.0, 0.0])[0 if kind == "sum" else 1] += float(value)
+    return totals
+
+
+def run_level(client: httpx.Client, scenario: str, concurrency: int, args) -> Dict:
+    runner = RUNNERS[scenario]
+
+    def timed(i: int) -> Dict:
+        started = time.perf_counter()
+        try:
+            outcome = runner(client, i, args)
+        except httpx.HTTPError as exc:
+            outcome = {"ok": False, "error": repr(exc)}
+        outcome["latency_ms"] = (time.perf_counter() - started) * 1000
+        return outcome
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(timed, range(args.warmup)))
+        before = stage_totals(client)
+        started = time.perf_counter()
+        outcomes = list(pool.map(timed, range(args.requests)))
+        wall = time.perf_counter() - started
+    after = stage_totals(client)
+
+    stages = {}
+    for stage, (seconds, count) in sorted(after.items()):
+        d_seconds = seconds - before.get(stage, [0.0, 0.0])[0]
+        d_count = count - before.get(stage, [0.0, 0.0])[1]
+        if d_count:
+            stages[stage] = {
+                "calls_per_request": round(d_count / args.requests, 3),
+                "mean_ms": round(d_seconds / d_count * 1000, 3),
+            }
+    ok = [o for o in outcomes if o["ok"]]
+    result = {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(outcomes),
+        "errors": len(outcomes) - len(ok),
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(ok) / wall, 3) if wall else None,
+        "latency_ms": summarize([o["latency_ms"] for o in ok]),
+        "stages": stages,
+    }
+    if scenario == "stream":
+        result["ttft_ms"] = summarize([o["ttft_ms"] for o in ok if o.get("ttft_ms") is not None])
+    return result
+
+
+# ───────────── reporting ─────────────
+def _fmt(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+def print_table(results: List[Dict]) -> None:
+    print(f"{'scenario':<9} {'conc':>4} {'ok':>5} {'err':>4} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'ttft p50':>9}")
+    for r in results:
+        lat = r["latency_ms"]
+        ttft = r.get("ttft_ms", {}).get("p50")
+        print(
+            f"{r['scenario']:<9} {r['concurrency']:>4} {r['requests'] - r['errors']:>5} {r['errors']:>4} "
+            f"{_fmt(r['throughput_rps']):>7} {_fmt(lat['p50']):>8} {_fmt(lat['p95']):>8} {_fmt(lat['p99']):>8} "
+            f"{_fmt(ttft):>9}"
+        )
+        print("          stages: " + "  ".join(
+            f"{stage}={s['mean_ms']:.1f}ms x{s['calls_per_request']:g}" for stage, s in r["stages"].items()
+        ))
+
+
+def compare(results: List[Dict], baseline: Dict, threshold: float) -> List[str]:
+    """Regressions beyond ``threshold`` (fraction) in p95/p99 latency or throughput."""
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"\nAgainst baseline from {baseline.get('created')} ({baseline.get('git') or 'unknown rev'}):")
+    for r in results:
+        old = previous.get((r["scenario"], r["concurrency"]))
+        if old is None:
+            continue
+        checks = [(f"latency {p}", old["latency_ms"][p], r["latency_ms"][p], 1) for p in ("p50", "p95", "p99")]
+        checks.append(("throughput", old["throughput_rps"], r["throughput_rps"], -1))
+        parts = []
+        for name, before, now, direction in checks:
+            if not before or now is None:
+                continue
+            change = (now - before) / before
+            parts.append(f"{name} {change:+.1%}")
+            if name != "latency p50" and change * direction > threshold:
+                regressions.append(f"{r['scenario']}@{r['concurrency']}: {name} {before:.1f} -> {now:.1f}")
+        print(f"  {r['scenario']:<9} {r['concurrency']:>4}  " + ", ".join(parts))
+    return regressions
+
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=100, help="per scenario and concurrency level")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--evaluation-mode", default="none", help="evaluation_mode sent with query/stream")
+    parser.add_argument("--caches", action="store_true", help="keep the embedding and semantic caches on")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", default=None, help="default: benchmarks/results/<timestamp>.json")
+    parser.add_argument("--compare", default=None, help="baseline JSON from an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed regression fraction")
+    mock_azure.add_arguments(parser)
+    args = parser.parse_args()
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {sorted(unknown)}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    mock = mock_azure.from_args(args)
+    url = mock.start()
+    workdir = tempfile.mkdtemp(prefix="bench-server-")
+    os.environ.update(mock_environment(url, workdir, args.caches, args.log_level))
+    app_url, stop_app = serve_app()
+    print(f"mock Azure on {url}, app on {app_url}")
+
+    results = []
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    with httpx.Client(base_url=app_url, timeout=300, limits=limits) as client:
+        for scenario in scenarios:
+            for concurrency in levels:
+                results.append(run_level(client, scenario, concurrency, args))
+    stop_app()
+    mock.stop()
+
+    print_table(results)
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "git": _git_rev(),
+        "config": {k: (repr(v) if isinstance(v, mock_azure.Latency) else v) for k, v in vars(args).items()},
+        "mock": mock.stats(),
+        "results": results,
+    }
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"{datetime.now():%Y%m%dT%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"\nresults written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            regressions = compare(results, json.load(fh), args.threshold)
+        if regressions:
+            print("\nREGRESSIONS:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
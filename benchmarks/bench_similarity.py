@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Compare FlaskRAGAssistant.cosine_similarity loops with the similarity module.
+
+Scores one query against N candidate embeddings and keeps the top k, the
+shape of a local rerank / dedupe / cache lookup:
+
+    python benchmarks/bench_similarity.py --candidates 50,200,1000 --dim 1536
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import similarity
+
+
+def python_top_k(query, candidates, k):
+    dot = lambda a, b: sum(x * y for x, y in zip(a, b))
+    norm = lambda a: sum(x * x for x in a) ** 0.5
+    q_norm = norm(query)
+    scores = [dot(query, c) / (q_norm * norm(c)) for c in candidates]
+    return sorted(range(len(scores)), key=scores.__getitem__, reverse=True)[:k]
+
+
+def _timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - started) / repeat, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--candidates", default="50,200,1000")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'candidates':>10} {'python ms':>10} {'numpy ms':>9} {'stored ms':>10} {'speedup':>8}")
+    for n in (int(x) for x in args.candidates.split(",")):
+        matrix = rng.standard_normal((n, args.dim)).astype(np.float32)
+        query = rng.standard_normal(args.dim).astype(np.float32)
+        as_lists, q_list = matrix.tolist(), query.tolist()
+        store = similarity.NormalizedMatrix.from_vectors(matrix)
+
+        py_s, py_idx = _timed(lambda: python_top_k(q_list, as_lists, args.k), args.repeat)
+        np_s, (np_idx, _) = _timed(
+            lambda: similarity.top_k(similarity.cosine(query, matrix), args.k), args.repeat
+        )
+        st_s, (st_idx, _) = _timed(lambda: store.search(query, args.k), args.repeat)
+        assert list(py_idx) == list(np_idx) == list(st_idx)
+        print(f"{n:>10} {py_s * 1000:>10.2f} {np_s * 1000:>9.3f} {st_s * 1000:>10.3f} {py_s / st_s:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
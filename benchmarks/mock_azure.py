@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Azure OpenAI and Azure AI Search REST endpoints.
+
+Serves what the app calls, so benchmarks drive the real clients, connection
+pools and parsing code without spending tokens:
+
+    POST /openai/deployments/<name>/chat/completions   (plain and stream=True)
+    POST /openai/deployments/<name>/embeddings
+    POST /indexes('<name>')/docs/search.post.search    (and /indexes/<name>/docs/search)
+
+Each endpoint sleeps for a latency drawn from a log-normal distribution
+(``median_ms:sigma``; sigma 0 is a fixed delay). Streamed answers are sent
+token by token at ``--tokens-per-second``. ``--error-rate`` of the requests
+fail with ``--error-status`` (429 carries ``Retry-After: 0``), which the
+OpenAI client retries like real throttling. Standalone:
+
+    python benchmarks/mock_azure.py --port 8900 --chat-latency 400:0.4 --error-rate 0.01
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+ANSWER = (
+    "Lab funds are edited in the funding grid [1]. Changes apply to new requests only, "
+    "and approvers are notified by email [2]. Historical allocations stay read-only [1]."
+)
+PASSAGES = [
+    ("Funding grid", "Open the funding grid from the lab page and edit the amount per account."),
+    ("Approvals", "Approvers receive an email whenever a lab's funding changes."),
+    ("Allocations", "Past allocations are read-only and kept for audit."),
+    ("Accounts", "Each lab can hold several accounts with separate budgets."),
+    ("Requests", "New requests use the funding in effect when they are submitted."),
+]
+
+
+class Latency:
+    """Log-normal delay around a median; parsed from ``"median_ms"`` or ``"median_ms:sigma"``."""
+
+    def __init__(self, median_ms: float, sigma: float = 0.0) -> None:
+        self.median_ms = median_ms
+        self.sigma = sigma
+
+    @classmethod
+    def parse(cls, spec: str) -> "Latency":
+        median, _, sigma = str(spec).partition(":")
+        return cls(float(median), float(sigma or 0))
+
+    def sample(self) -> float:
+        """Seconds."""
+        if self.median_ms <= 0:
+            return 0.0
+        if self.sigma <= 0:
+            return self.median_ms / 1000
+        return random.lognormvariate(math.log(self.median_ms), self.sigma) / 1000
+
+    def __repr__(self) -> str:
+        return f"{self.median_ms:g}:{self.sigma:g}"
+
+
+def _embedding(text: str, dim: int) -> List[float]:
+    """Deterministic unit vector per text, so caches and dedup behave realistically."""
+    rng = random.Random(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest())
+    vec = [rng.gauss(0, 1) for _ in range(dim)]
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+class MockAzureServer:
+    """Threaded HTTP server; ``start()`` returns its base URL."""
+
+    def __init__(
+        self, host: str = "127.0.0.1", port: int = 0,
+        chat_latency: Latency = Latency(300, 0.3), embedding_latency: Latency = Latency(40, 0.2),
+        search_latency: Latency = Latency(80, 0.3), tokens_per_second: float = 60.0,
+        error_rate: float = 0.0, error_status: int = 429, dim: int = 1536, hits: int = 5,
+        answer: str = ANSWER,
+    ) -> None:
+        self.latency = {"chat": chat_latency, "embeddings": embedding_latency, "search": search_latency}
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.dim = dim
+        self.hits = hits
+        self.answer = answer
+        self.requests: Counter = Counter()
+        self.errors: Counter = Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-azure", daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {"requests": dict(self.requests), "errors": dict(self.errors)}
+
+    def _count(self, endpoint: str, failed: bool) -> None:
+        with self._lock:
+            self.requests[endpoint] += 1
+            if failed:
+                self.errors[endpoint] += 1
+
+    # ───────────── responses ─────────────
+    def _tokens(self) -> List[str]:
+        return re.findall(r"\S+\s*", self.answer)
+
+    def _usage(self, prompt: str) -> Dict[str, int]:
+        prompt_tokens = max(1, len(prompt) // 4)
+        completion_tokens = len(self._tokens())
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    def chat_completion(self, body: Dict) -> Dict:
+        prompt = json.dumps(body.get("messages", []))
+        return {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": self.answer},
+            }],
+            "usage": self._usage(prompt),
+        }
+
+    def chat_chunks(self, body: Dict):
+        """Yield (delay_seconds, chunk) pairs for a streamed completion."""
+        base = {"id": "chatcmpl-mock", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": body.get("model", "mock")}
+        interval = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        yield 0.0, dict(base, choices=[{"index": 0, "delta": {"role": "assistant", "content": ""}}])
+        for token in self._tokens():
+            yield interval, dict(base, choices=[{"index": 0, "delta": {"content": token}}])
+        yield 0.0, dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield 0.0, dict(base, choices=[], usage=self._usage(json.dumps(body.get("messages", []))))
+
+    def embeddings(self, body: Dict) -> Dict:
+        inputs = body.get("input")
+        inputs = inputs if isinstance(inputs, list) else [inputs]
+        return {
+            "object": "list",
+            "model": body.get("model", "mock"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": _embedding(str(text), self.dim)}
+                for i, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": sum(len(str(t)) // 4 for t in inputs), "total_tokens": 0},
+        }
+
+    def search(self, body: Dict) -> Dict:
+        top = min(int(body.get("top") or self.hits), self.hits)
+        value = []
+        for i in range(top):
+            title, text = PASSAGES[i % len(PASSAGES)]
+            value.append({"@search.score": round(1.0 / (i + 1), 4), "title": title, "chunk": text})
+        return {"value": value}
+
+    # ───────────── HTTP ─────────────
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without this, Nagle plus delayed ACKs add ~40 ms
+            disable_nagle_algorithm = True
+
+            def log_message(self, fmt, *args):  # keep benchmark output clean
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                path = self.path.split("?", 1)[0]
+                if path.endswith("/chat/completions"):
+                    endpoint = "chat"
+                elif path.endswith("/embeddings"):
+                    endpoint = "embeddings"
+                elif "/docs/search" in path:
+                    endpoint = "search"
+                else:
+                    return self._json(404, {"error": {"code": "NotFound", "message": path}})
+
+                time.sleep(mock.latency[endpoint].sample())
+                failed = random.random() < mock.error_rate
+                mock._count(endpoint, failed)
+                if failed:
+                    headers = {"Retry-After": "0"} if mock.error_status == 429 else {}
+                    return self._json(mock.error_status, {"error": {"code": "Injected", "message": "mock failure"}}, headers)
+                if endpoint == "chat" and body.get("stream"):
+                    return self._stream(mock.chat_chunks(body))
+                if endpoint == "chat":
+                    return self._json(200, mock.chat_completion(body))
+                if endpoint == "embeddings":
+                    return self._json(200, mock.embeddings(body))
+                return self._json(200, mock.search(body))
+
+            def _json(self, status, payload, headers=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, chunks):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for delay, chunk in chunks:
+                        if delay:
+                            time.sleep(delay)
+                        self._chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self._chunk(b"data: [DONE]\n\n")
+                    self._chunk(b"")
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+
+            def _chunk(self, data: bytes) -> None:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+        return Handler
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--chat-latency", type=Latency.parse, default=Latency(300, 0.3), help="median_ms[:sigma]")
+    parser.add_argument("--embedding-latency", type=Latency.parse, default=Latency(40, 0.2), help="median_ms[:sigma]")
+    parser.add_argument("--search-latency", type=Latency.parse, default=Latency(80, 0.3), help="median_ms[:sigma]")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--dim", type=int, default=1536)
+
+
+def from_args(args: argparse.Namespace, port: int = 0) -> MockAzureServer:
+    return MockAzureServer(
+        port=port, chat_latency=args.chat_latency, embedding_latency=args.embedding_latency,
+        search_latency=args.search_latency, tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate, error_status=args.error_status, dim=args.dim,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=8900)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = from_args(args, args.port)
+    print(f"Mock Azure endpoints on {server.start()} (Ctrl-C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Local BM25 lexical index.
+
+Postings are stored in CSR form — one contiguous array of document ids and
+one of term frequencies, sliced per term by an offsets array — so a query
+touches only the postings of its own terms and scores them with NumPy.
+The index can be built from any list of {"chunk", "title"} records and is
+saved next to a local_index bundle as bm25.npz.
+"""
+import logging
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+import similarity
+from retrievers import Retriever
+
+logger = logging.getLogger(__name__)
+
+BM25_FILE = "bm25.npz"
+
+_TOKEN = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by do does for from how i in is it of on or that the this "
+    "to was what when where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+
+class BM25Index(Retriever):
+    """Okapi BM25 over compact CSR postings; implements the Retriever interface."""
+
+    name = "bm25"
+
+    def __init__(
+        self,
+        records: Sequence[Dict],
+        vocab: Dict[str, int],
+        offsets: np.ndarray,
+        doc_ids: np.ndarray,
+        tfs: np.ndarray,
+        doc_lengths: np.ndarray,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ) -> None:
+        self.records = records
+        self.vocab = vocab
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        n = len(doc_lengths)
+        df = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avgdl = float(doc_lengths.mean()) if n else 1.0
+        # Per-document part of the BM25 denominator, precomputed once
+        self._norm = (k1 * (1 - b + b * doc_lengths / max(avgdl, 1e-9))).astype(np.float32)
+
+    # ───────────── build / persist ─────────────
+    @classmethod
+    def from_records(cls, records: Sequence[Dict], k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        vocab: Dict[str, int] = {}
+        postings: List[List[tuple]] = []
+        lengths = np.zeros(len(records), dtype=np.float32)
+        for doc, record in enumerate(records):
+            tokens = tokenize(f"{record.get('title', '')} {record.get('chunk', '')}")
+            lengths[doc] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                term_id = vocab.setdefault(term, len(vocab))
+                if term_id == len(postings):
+                    postings.append([])
+                postings[term_id].append((doc, tf))
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(p) for p in postings])
+        doc_ids = np.fromiter((d for p in postings for d, _ in p), dtype=np.int32, count=offsets[-1])
+        tfs = np.fromiter((t for p in postings for _, t in p), dtype=np.float32, count=offsets[-1])
+        return cls(records, vocab, offsets, doc_ids, tfs, lengths, k1=k1, b=b)
+
+    def save(self, path: str) -> None:
+        terms = sorted(self.vocab, key=self.vocab.get)
+        np.savez(
+            os.path.join(path, BM25_FILE),
+            terms=np.array(terms, dtype=str),
+            offsets=self.offsets,
+            doc_ids=self.doc_ids,
+            tfs=self.tfs,
+            doc_lengths=self.doc_lengths,
+            params=np.array([self.k1, self.b], dtype=np.float32),
+        )
+
+    @classmethod
+    def load(cls, path: str, records: Optional[Sequence[Dict]] = None) -> "BM25Index":
+        """Load bm25.npz from a bundle directory, or build it from the bundle's chunks."""
+        if records is None:
+            from local_index import read_records
+
+            records = read_records(path)
+        npz_path = os.path.join(path, BM25_FILE)
+        if not os.path.exists(npz_path):
+            logger.info("%s has no %s; building BM25 index in memory", path, BM25_FILE)
+            return cls.from_records(records)
+        with np.load(npz_path) as data:
+            vocab = {str(t): i for i, t in enumerate(data["terms"])}
+            k1, b = (float(x) for x in data["params"])
+            return cls(
+                records, vocab, data["offsets"], data["doc_ids"], data["tfs"],
+                data["doc_lengths"], k1=k1, b=b,
+            )
+
+    # ───────────── query ─────────────
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.doc_lengths), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs, tf = self.doc_ids[start:end], self.tfs[start:end]
+            # Each document appears once per term, so plain fancy-index add is safe
+            scores[docs] += self.idf[term_id] * tf * (self.k1 + 1) / (tf + self._norm[docs])
+        return scores
+
+    def search(self, query: str, q_vec: Optional[List[float]] = None, top: int = 10) -> List[Dict]:
+        scores = self.scores(query)
+        idx, best = similarity.top_k(scores, top)
+        hits = []
+        for i, score in zip(idx, best):
+            if score <= 0:
+                break
+            record = self.records[int(i)]
+            hit = {
+                "chunk": record.get("chunk", ""),
+                "title": record.get("title", "Untitled"),
+                "relevance": float(score),
+            }
+            if "url" in record:
+                hit["url"] = record["url"]
+            hits.append(hit)
+        return hits
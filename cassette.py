@@ -0,0 +1,337 @@
+"""
+Transport-level record/replay of Azure OpenAI and Azure Search traffic.
+
+With CASSETTE_MODE set, client_registry wraps the HTTP transports of the
+shared clients: the httpx transport under AzureOpenAI/AsyncAzureOpenAI and
+the requests adapter under the sync SearchClient. Each request is keyed by
+a canonical hash of its method, path, sorted query and JSON body (host and
+headers such as api-key are left out, so recordings made against one
+endpoint replay against any other). Values that differ on every call but
+do not change the answer, such as the casefile's session timestamp, are
+masked before hashing (see _VOLATILE). Modes:
+
+    record  call the service and store every successful response
+    replay  serve responses from disk only; a miss raises CassetteMiss
+    auto    replay hits, record misses
+
+Storage is content-addressed under CASSETTE_DIR: ``entries/<request
+hash>.json`` holds status, headers and chunk sizes and points at
+``blobs/<sha256 of body>.gz``, so identical responses are stored once.
+Streamed responses are teed through as they arrive and replayed with the
+original chunk boundaries. The aio SearchClient (ASGI app) is not wrapped.
+"""
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from http import HTTPStatus
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import httpx
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.response import HTTPResponse
+
+from config import CASSETTE_MODE, CASSETTE_DIR
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_MODES = ("off", "record", "replay", "auto")
+# Never written to disk
+_DROP_HEADERS = {"set-cookie"}
+# Masked in request bodies before hashing; evaluation_model.build_case_file stamps each casefile
+_VOLATILE = [
+    (re.compile(rb"(- Timestamp: )\d{4}-\d{2}-\d{2}T[\d:.]+"), rb"\1<volatile>"),
+]
+
+
+class CassetteMiss(LookupError):
+    """Replay mode found no recording for a request."""
+
+
+def request_key(method: str, url: str, body: Optional[bytes]) -> str:
+    """Canonical hash of a request; independent of host, header order, JSON key order and volatile values."""
+    parts = urlsplit(str(url))
+    query = sorted(parse_qsl(parts.query, keep_blank_values=True))
+    if body:
+        try:
+            body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode("utf-8")
+        except ValueError:
+            pass
+        for pattern, replacement in _VOLATILE:
+            body = pattern.sub(replacement, body)
+    canonical = json.dumps([method.upper(), parts.path, query], separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(canonical + b"\n" + (body or b"")).hexdigest()
+
+
+class CassetteStore:
+    """Gzip'd, content-addressed response store shared by every wrapped transport."""
+
+    def __init__(self, root: str = CASSETTE_DIR, mode: str = CASSETTE_MODE) -> None:
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"CASSETTE_MODE must be one of {CASSETTE_MODES}, got {mode!r}")
+        self.root = root
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._lock = threading.Lock()
+
+    @property
+    def replays(self) -> bool:
+        return self.mode in ("replay", "auto")
+
+    @property
+    def records(self) -> bool:
+        return self.mode in ("record", "auto")
+
+    def _path(self, kind: str, name: str) -> str:
+        return os.path.join(self.root, kind, name[:2], name)
+
+    def _write(self, path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+
+    def load(self, key: str) -> Optional[Tuple[Dict, bytes]]:
+        """(entry, body) for a request key, or None."""
+        try:
+            with open(self._path("entries", key + ".json"), encoding="utf-8") as fh:
+                entry = json.load(fh)
+            with open(self._path("blobs", entry["blob"] + ".gz"), "rb") as fh:
+                body = gzip.decompress(fh.read())
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry, body
+
+    def save(self, key: str, request: Dict, status: int, headers: List[Tuple[str, str]],
+             body: bytes, chunks: Optional[List[int]] = None) -> None:
+        blob = hashlib.sha256(body).hexdigest()
+        blob_path = self._path("blobs", blob + ".gz")
+        if not os.path.exists(blob_path):
+            self._write(blob_path, gzip.compress(body, mtime=0))
+        entry = {
+            "request": request,
+            "status": status,
+            "headers": [[k, v] for k, v in headers if k.lower() not in _DROP_HEADERS],
+            "blob": blob,
+            "chunks": chunks or [len(body)],
+        }
+        self._write(self._path("entries", key + ".json"), json.dumps(entry, indent=1).encode("utf-8"))
+        with self._lock:
+            self.recorded += 1
+
+    def stats(self) -> Dict:
+        return {"mode": self.mode, "hits": self.hits, "misses": self.misses, "recorded": self.recorded}
+
+
+def _split(body: bytes, chunks: List[int]) -> Iterator[bytes]:
+    offset = 0
+    for size in chunks:
+        yield body[offset:offset + size]
+        offset += size
+
+
+def _describe(method: str, url: str) -> Dict[str, str]:
+    parts = urlsplit(str(url))
+    return {"method": method, "path": parts.path, "query": parts.query}
+
+
+# ───────────── httpx (Azure OpenAI) ─────────────
+class _ReplayStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    def __init__(self, body: bytes, chunks: List[int]) -> None:
+        self.body = body
+        self.chunks = chunks
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield from _split(self.body, self.chunks)
+
+    async def __aiter__(self):
+        for chunk in _split(self.body, self.chunks):
+            yield chunk
+
+
+class _RecordingStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    """Passes chunks through as they arrive and saves the response once fully read."""
+
+    def __init__(self, stream, on_complete) -> None:
+        self.stream = stream
+        self.on_complete = on_complete
+        self.parts: List[bytes] = []
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self.stream:
+            self.parts.append(chunk)
+            yield chunk
+        self.on_complete(self.parts)
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            self.parts.append(chunk)
+            yield chunk
+        self.on_complete(self.parts)
+
+    def close(self) -> None:
+        self.stream.close()
+
+    async def aclose(self) -> None:
+        await self.stream.aclose()
+
+
+class _HttpxCassette:
+    def __init__(self, inner, store: CassetteStore) -> None:
+        self.inner = inner
+        self.store = store
+
+    def _replay(self, request: httpx.Request, key: str) -> Optional[httpx.Response]:
+        if not self.store.replays:
+            return None
+        found = self.store.load(key)
+        if found is None:
+            if not self.store.records:
+                raise CassetteMiss(f"No recording for {request.method} {request.url.path} ({key[:12]})")
+            return None
+        entry, body = found
+        return httpx.Response(entry["status"], headers=entry["headers"], stream=_ReplayStream(body, entry["chunks"]))
+
+    def _recorder(self, request: httpx.Request, key: str, response: httpx.Response) -> httpx.Response:
+        if not self.store.records or not response.is_success:
+            return response
+
+        def save(parts: List[bytes]) -> None:
+            # Raw transport bytes: content-encoding, if any, is replayed as received
+            self.store.save(
+                key, _describe(request.method, request.url), response.status_code,
+                list(response.headers.multi_items()), b"".join(parts), [len(p) for p in parts],
+            )
+
+        return httpx.Response(
+            response.status_code, headers=response.headers,
+            stream=_RecordingStream(response.stream, save), extensions=response.extensions,
+        )
+
+
+class CassetteTransport(_HttpxCassette, httpx.BaseTransport):
+    """httpx transport that records or replays through a CassetteStore."""
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        key = request_key(request.method, request.url, request.read())
+        replayed = self._replay(request, key)
+        if replayed is not None:
+            return replayed
+        response = self.inner.handle_request(request)
+        return self._recorder(request, key, response)
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+class AsyncCassetteTransport(_HttpxCassette, httpx.AsyncBaseTransport):
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key = request_key(request.method, request.url, await request.aread())
+        replayed = self._replay(request, key)
+        if replayed is not None:
+            return replayed
+        response = await self.inner.handle_async_request(request)
+        return self._recorder(request, key, response)
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+# ───────────── requests (Azure Search) ─────────────
+class CassetteAdapter(BaseAdapter):
+    """requests adapter that records or replays through a CassetteStore."""
+
+    def __init__(self, inner: BaseAdapter, store: CassetteStore) -> None:
+        super().__init__()
+        self.inner = inner
+        self.store = store
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        body = request.body.encode("utf-8") if isinstance(request.body, str) else request.body
+        key = request_key(request.method, request.url, body)
+        if self.store.replays:
+            found = self.store.load(key)
+            if found is not None:
+                entry, content = found
+                return self._build(request, entry["status"], entry["headers"], content)
+            if not self.store.records:
+                raise CassetteMiss(f"No recording for {request.method} {urlsplit(request.url).path} ({key[:12]})")
+        response = self.inner.send(request, **kwargs)
+        if not self.store.records or not response.ok:
+            return response
+        # requests decodes content-encoding, so the decoded body is stored without it
+        content = response.content
+        headers = [
+            (k, v) for k, v in response.headers.items()
+            if k.lower() not in ("content-encoding", "content-length", "transfer-encoding")
+        ]
+        self.store.save(key, _describe(request.method, request.url), response.status_code, headers, content)
+        return self._build(request, response.status_code, headers, content)
+
+    @staticmethod
+    def _build(request: requests.PreparedRequest, status: int, headers: Iterable, content: bytes) -> requests.Response:
+        headers = CaseInsensitiveDict(headers)
+        headers["Content-Length"] = str(len(content))
+        response = requests.Response()
+        response.status_code = status
+        response.headers = headers
+        # azure-core reads the body from .raw, so it must be a fresh stream
+        response.raw = HTTPResponse(
+            body=io.BytesIO(content), headers=dict(headers), status=status, preload_content=False,
+        )
+        response.url = request.url
+        response.request = request
+        try:
+            response.reason = HTTPStatus(status).phrase
+        except ValueError:
+            response.reason = ""
+        response.encoding = requests.utils.get_encoding_from_headers(headers)
+        return response
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+# ───────────── wiring ─────────────
+_store: Optional[CassetteStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> Optional[CassetteStore]:
+    """The process-wide store, or None when CASSETTE_MODE is off."""
+    global _store
+    if _store is None and CASSETTE_MODE != "off":
+        with _store_lock:
+            if _store is None:
+                _store = CassetteStore()
+                logger.info("Cassette %s mode, store at %s", _store.mode, _store.root)
+    return _store
+
+
+def wrap_httpx(transport):
+    store = get_store()
+    if store is None:
+        return transport
+    if isinstance(transport, httpx.AsyncBaseTransport):
+        return AsyncCassetteTransport(transport, store)
+    return CassetteTransport(transport, store)
+
+
+def wrap_adapter(adapter: BaseAdapter) -> BaseAdapter:
+    store = get_store()
+    return adapter if store is None else CassetteAdapter(adapter, store)
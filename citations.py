@@ -0,0 +1,92 @@
+"""
+Citation rewriting for generated answers.
+
+The model cites packed sources as [id]. Answers are rewritten in a single
+pass of one compiled pattern: cited sources are renumbered 1..n in order of
+first appearance and citations of unknown ids are left as written. Because
+every match is resolved against the original ids, rewrites cannot chain
+(e.g. [3]→[1] followed by [1]→[2]).
+
+StreamingCitationTracker applies the same rewrite to a token stream,
+holding back only a possibly incomplete trailing "[12" so each citation is
+renumbered — and its source reported — as soon as it has fully arrived.
+"""
+import re
+from typing import Dict, List, Tuple
+
+CITATION = re.compile(r"\[(\d+)\]")
+# A chunk ending in "[" or "[12" may be the start of a citation split across pieces
+_PARTIAL = re.compile(r"\[\d{0,6}$")
+
+
+class CitationRewriter:
+    """Renumbers citations against one src_map; state persists across calls."""
+
+    def __init__(self, src_map: Dict) -> None:
+        self.src_map = src_map
+        self.renumbered: Dict[str, str] = {}
+        self.cited: List[Dict] = []
+        self._new: List[Dict] = []
+
+    def _replace(self, match: re.Match) -> str:
+        sid = match.group(1)
+        new = self.renumbered.get(sid)
+        if new is None:
+            sinfo = self.src_map.get(sid)
+            if sinfo is None:
+                return match.group(0)
+            new = self.renumbered[sid] = str(len(self.cited) + 1)
+            source = dict(sinfo, id=new)
+            self.cited.append(source)
+            self._new.append(source)
+        return f"[{new}]"
+
+    def rewrite(self, text: str) -> str:
+        return CITATION.sub(self._replace, text)
+
+    def take_new(self) -> List[Dict]:
+        """Sources first cited since the previous call."""
+        new, self._new = self._new, []
+        return new
+
+
+def renumber_citations(answer: str, src_map: Dict) -> Tuple[str, List[Dict]]:
+    """Keep only cited sources, renumber them 1..n and rewrite the answer."""
+    rewriter = CitationRewriter(src_map)
+    return rewriter.rewrite(answer), rewriter.cited
+
+
+class StreamingCitationTracker:
+    """Incremental CitationRewriter for streamed answers."""
+
+    def __init__(self, src_map: Dict) -> None:
+        self.rewriter = CitationRewriter(src_map)
+        self._pending = ""
+        self._parts: List[str] = []
+
+    def feed(self, piece: str) -> Tuple[str, List[Dict]]:
+        """Return (rewritten text safe to emit now, sources first cited in it)."""
+        text = self._pending + piece
+        partial = _PARTIAL.search(text)
+        cut = partial.start() if partial else len(text)
+        self._pending = text[cut:]
+        return self._emit(text[:cut])
+
+    def flush(self) -> Tuple[str, List[Dict]]:
+        """Emit whatever is still held back at the end of the stream."""
+        text, self._pending = self._pending, ""
+        return self._emit(text)
+
+    def _emit(self, text: str) -> Tuple[str, List[Dict]]:
+        out = self.rewriter.rewrite(text) if text else ""
+        if out:
+            self._parts.append(out)
+        return out, self.rewriter.take_new()
+
+    @property
+    def answer(self) -> str:
+        return "".join(self._parts)
+
+    @property
+    def cited(self) -> List[Dict]:
+        return self.rewriter.cited
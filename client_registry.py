@@ -0,0 +1,253 @@
+"""
+Process-wide registry of long-lived Azure OpenAI and Azure Search clients.
+
+Deployments are resolved once against MODEL_ENDPOINTS / MODEL_KEYS /
+MODEL_API_VERSIONS / MODEL_DEPLOYMENTS, and clients are shared per
+(endpoint, key, api version) so every caller reuses the same keep-alive
+connection pool instead of paying TLS setup on each request. Search
+clients are shared per (endpoint, index) on top of one pooled
+requests.Session.
+
+Async clients (AsyncAzureOpenAI, aio SearchClient) are bound to the event
+loop that created them, so they are shared per running loop.
+"""
+import asyncio
+import logging
+import threading
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from openai import AzureOpenAI, AsyncAzureOpenAI
+from azure.core.credentials import AzureKeyCredential
+from azure.core.pipeline.transport import RequestsTransport
+from azure.search.documents import SearchClient
+
+from config import (
+    MODEL_DEPLOYMENTS,
+    MODEL_ENDPOINTS,
+    MODEL_KEYS,
+    MODEL_API_VERSIONS,
+    AZURE_OPENAI_API_KEY,
+    OPENAI_ENDPOINT,
+    OPENAI_KEY,
+    OPENAI_API_VERSION,
+    OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_KEEPALIVE,
+    OPENAI_KEEPALIVE_EXPIRY,
+    OPENAI_TIMEOUT,
+    OPENAI_CONNECT_TIMEOUT,
+    SEARCH_POOL_CONNECTIONS,
+    SEARCH_POOL_MAXSIZE,
+    SEARCH_CONNECT_TIMEOUT,
+    SEARCH_READ_TIMEOUT,
+)
+from cassette import wrap_httpx, wrap_adapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_VERSION = "2023-05-15"
+
+
+class DeploymentConfig(NamedTuple):
+    endpoint: Optional[str]
+    api_key: Optional[str]
+    api_version: str
+    deployment: Optional[str]
+
+
+_lock = threading.Lock()
+_deployments: Dict[Optional[str], DeploymentConfig] = {}
+_clients: Dict[Tuple[Optional[str], Optional[str], str], AzureOpenAI] = {}
+_search_clients: Dict[Tuple[str, str, Optional[str]], SearchClient] = {}
+_search_session: Optional[requests.Session] = None
+_async_clients: Dict[tuple, object] = {}
+
+
+def resolve_deployment(model: Optional[str] = None) -> DeploymentConfig:
+    """Resolve a model identifier (e.g. "o3") to its Azure configuration."""
+    cfg = _deployments.get(model)
+    if cfg is not None:
+        return cfg
+    endpoint = OPENAI_ENDPOINT
+    api_key = AZURE_OPENAI_API_KEY or OPENAI_KEY
+    api_version = OPENAI_API_VERSION
+    deployment = model
+    if model in MODEL_ENDPOINTS and MODEL_ENDPOINTS[model]:
+        endpoint = MODEL_ENDPOINTS[model]
+    if model in MODEL_KEYS and MODEL_KEYS[model]:
+        api_key = MODEL_KEYS[model]
+    if model in MODEL_API_VERSIONS and MODEL_API_VERSIONS[model]:
+        api_version = MODEL_API_VERSIONS[model]
+    if model in MODEL_DEPLOYMENTS and MODEL_DEPLOYMENTS[model]:
+        deployment = MODEL_DEPLOYMENTS[model]
+    cfg = DeploymentConfig(endpoint, api_key, api_version or DEFAULT_API_VERSION, deployment)
+    with _lock:
+        _deployments[model] = cfg
+    return cfg
+
+
+def _openai_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+    )
+
+
+def _build_http_client() -> httpx.Client:
+    return httpx.Client(
+        transport=wrap_httpx(httpx.HTTPTransport(limits=_openai_limits())),
+        timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+    )
+
+
+def get_openai_client(
+    endpoint: Optional[str], api_key: Optional[str], api_version: Optional[str] = None
+) -> AzureOpenAI:
+    """Return the shared client for an endpoint/key/version, creating it once."""
+    key = (endpoint, api_key, api_version or DEFAULT_API_VERSION)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = AzureOpenAI(
+                azure_endpoint=endpoint,
+                api_key=api_key,
+                api_version=key[2],
+                http_client=_build_http_client(),
+            )
+            _clients[key] = client
+            logger.info("Created shared Azure OpenAI client for %s (api %s)", endpoint, key[2])
+    return client
+
+
+def get_deployment_client(model: Optional[str] = None) -> Tuple[AzureOpenAI, str]:
+    """Return (shared client, Azure deployment name) for a model identifier."""
+    cfg = resolve_deployment(model)
+    return get_openai_client(cfg.endpoint, cfg.api_key, cfg.api_version), cfg.deployment
+
+
+def _pooled_search_session() -> requests.Session:
+    # Caller holds _lock
+    global _search_session
+    if _search_session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=SEARCH_POOL_CONNECTIONS,
+            pool_maxsize=SEARCH_POOL_MAXSIZE,
+        )
+        # Pass-through unless CASSETTE_MODE records/replays search traffic
+        adapter = wrap_adapter(adapter)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _search_session = session
+    return _search_session
+
+
+def get_search_client(endpoint: str, index_name: str, api_key: Optional[str]) -> SearchClient:
+    """Return the shared SearchClient for an index, creating it once."""
+    key = (endpoint, index_name, api_key)
+    client = _search_clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _search_clients.get(key)
+        if client is None:
+            transport = RequestsTransport(
+                session=_pooled_search_session(),
+                session_owner=False,
+                connection_timeout=SEARCH_CONNECT_TIMEOUT,
+                read_timeout=SEARCH_READ_TIMEOUT,
+            )
+            client = SearchClient(
+                endpoint=endpoint,
+                index_name=index_name,
+                credential=AzureKeyCredential(api_key),
+                transport=transport,
+            )
+            _search_clients[key] = client
+            logger.info("Created shared SearchClient for index %s", index_name)
+    return client
+
+
+def _build_async_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        transport=wrap_httpx(httpx.AsyncHTTPTransport(limits=_openai_limits())),
+        timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+    )
+
+
+def get_async_deployment_client(model: Optional[str] = None) -> Tuple[AsyncAzureOpenAI, str]:
+    """Return (AsyncAzureOpenAI shared on the running loop, deployment name)."""
+    cfg = resolve_deployment(model)
+    key = (id(asyncio.get_running_loop()), "openai", cfg.endpoint, cfg.api_key, cfg.api_version)
+    client = _async_clients.get(key)
+    if client is None:
+        with _lock:
+            client = _async_clients.get(key)
+            if client is None:
+                client = AsyncAzureOpenAI(
+                    azure_endpoint=cfg.endpoint,
+                    api_key=cfg.api_key,
+                    api_version=cfg.api_version,
+                    http_client=_build_async_http_client(),
+                )
+                _async_clients[key] = client
+    return client, cfg.deployment
+
+
+def get_async_search_client(endpoint: str, index_name: str, api_key: Optional[str]):
+    """Return the aio SearchClient for an index, shared on the running loop."""
+    # Imported lazily: the aio transport needs aiohttp, which the sync app does not
+    from azure.search.documents.aio import SearchClient as AsyncSearchClient
+
+    key = (id(asyncio.get_running_loop()), "search", endpoint, index_name, api_key)
+    client = _async_clients.get(key)
+    if client is None:
+        with _lock:
+            client = _async_clients.get(key)
+            if client is None:
+                client = AsyncSearchClient(
+                    endpoint=endpoint,
+                    index_name=index_name,
+                    credential=AzureKeyCredential(api_key),
+                    connection_timeout=SEARCH_CONNECT_TIMEOUT,
+                    read_timeout=SEARCH_READ_TIMEOUT,
+                )
+                _async_clients[key] = client
+    return client
+
+
+async def aclose_loop_clients() -> None:
+    """Close the async clients owned by the running event loop."""
+    loop_id = id(asyncio.get_running_loop())
+    with _lock:
+        keys = [k for k in _async_clients if k[0] == loop_id]
+        clients = [_async_clients.pop(k) for k in keys]
+    for client in clients:
+        try:
+            await client.close()
+        except Exception as exc:
+            logger.warning("Error closing async client: %s", exc)
+
+
+def close_all() -> None:
+    """Close every pooled client (used on shutdown and in tests)."""
+    global _search_session
+    with _lock:
+        clients = list(_clients.values()) + list(_search_clients.values())
+        _clients.clear()
+        _search_clients.clear()
+        _deployments.clear()
+        session, _search_session = _search_session, None
+    if session is not None:
+        clients.append(session)
+    for client in clients:
+        try:
+            client.close()
+        except Exception as exc:
+            logger.warning("Error closing pooled client: %s", exc)
@@ -0,0 +1,135 @@
+"""
+Query-relevant extractive compression of retrieved chunks.
+
+Each chunk is split into sentences, every sentence is scored against the
+query — by IDF-weighted term overlap, or by cosine similarity of cached
+sentence embeddings — and only the best sentences are kept, in their
+original order, up to a fraction of the chunk's tokens. Compression runs
+before sources are numbered, so citations and the evaluator's view of the
+context stay consistent with what the chat model saw.
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import similarity
+from bm25 import tokenize
+from context_packing import split_sentences
+from config import (
+    CONTEXT_COMPRESSION_METHOD,
+    CONTEXT_COMPRESSION_RATIO,
+    CONTEXT_COMPRESSION_MIN_SENTENCES,
+)
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_METHODS = ("lexical", "embedding")
+
+
+class ExtractiveCompressor:
+    """Keeps the query-relevant sentences of each chunk; tracks tokens saved and latency."""
+
+    def __init__(
+        self,
+        method: str = CONTEXT_COMPRESSION_METHOD,
+        ratio: float = CONTEXT_COMPRESSION_RATIO,
+        min_sentences: int = CONTEXT_COMPRESSION_MIN_SENTENCES,
+        embed: Optional[Callable[[List[str]], List[Optional[List[float]]]]] = None,
+    ) -> None:
+        if method not in COMPRESSION_METHODS:
+            raise ValueError(f"method must be one of {COMPRESSION_METHODS}, got {method!r}")
+        if method == "embedding" and embed is None:
+            raise ValueError("embedding compression needs an embed function")
+        self.method = method
+        self.ratio = ratio
+        self.min_sentences = max(1, int(min_sentences))
+        self.embed = embed
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "tokens_before": 0, "tokens_after": 0, "elapsed_ms": 0.0}
+
+    @property
+    def needs_embeddings(self) -> bool:
+        return self.method == "embedding"
+
+    def compress(
+        self, query: str, results: List[Dict], count_tokens: Callable[[str], int]
+    ) -> Tuple[List[Dict], Dict]:
+        """Return (results with compressed "chunk" text, per-request report)."""
+        started = time.perf_counter()
+        split = [split_sentences(r["chunk"]) for r in results]
+        scores = self._score(query, [s for sentences in split for s in sentences])
+        compressed, before, after, offset = [], 0, 0, 0
+        for res, sentences in zip(results, split):
+            sentence_scores = scores[offset:offset + len(sentences)]
+            offset += len(sentences)
+            tokens = count_tokens(res["chunk"])
+            before += tokens
+            text = self._select(sentences, sentence_scores, tokens, count_tokens)
+            if text is None:
+                compressed.append(res)
+                after += tokens
+                continue
+            kept = count_tokens(text)
+            compressed.append(dict(res, chunk=text, original_tokens=tokens))
+            after += kept
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        report = {
+            "tokens_before": before,
+            "tokens_after": after,
+            "tokens_saved": before - after,
+            "elapsed_ms": round(elapsed_ms, 2),
+        }
+        with self._lock:
+            self._counters["requests"] += 1
+            self._counters["tokens_before"] += before
+            self._counters["tokens_after"] += after
+            self._counters["elapsed_ms"] += elapsed_ms
+        return compressed, report
+
+    def _select(
+        self, sentences: List[str], scores: np.ndarray, tokens: int, count_tokens: Callable[[str], int]
+    ) -> Optional[str]:
+        """Joined top sentences within the ratio, or None to keep the chunk as is."""
+        if len(sentences) <= self.min_sentences or not np.any(scores > 0):
+            return None
+        target = max(self.ratio * tokens, 1)
+        keep, used = [], 0
+        for i in np.argsort(-scores, kind="stable"):
+            if scores[i] <= 0:
+                break
+            cost = count_tokens(sentences[i])
+            if keep and used + cost > target:
+                continue
+            keep.append(int(i))
+            used += cost
+        if len(keep) == len(sentences):
+            return None
+        return " ".join(sentences[i] for i in sorted(keep))
+
+    def _score(self, query: str, sentences: List[str]) -> np.ndarray:
+        if not sentences:
+            return np.zeros(0)
+        if self.method == "embedding":
+            vectors = self.embed([query] + sentences)
+            if all(v is not None for v in vectors):
+                unit = similarity.normalize(vectors)
+                return np.clip(unit[1:] @ unit[0], 0.0, None)
+            logger.warning("Sentence embeddings unavailable for this request; using lexical scores")
+        terms = [set(tokenize(s)) for s in sentences]
+        query_terms = set(tokenize(query))
+        # IDF over this request's sentences: terms shared by every sentence carry no signal
+        df = {t: sum(t in s for s in terms) for t in query_terms}
+        n = len(sentences)
+        idf = {t: np.log1p((n - d + 0.5) / (d + 0.5)) for t, d in df.items() if d}
+        return np.array([sum(idf.get(t, 0.0) for t in s & query_terms) for s in terms])
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._counters)
+        requests = stats["requests"]
+        stats["tokens_saved"] = stats["tokens_before"] - stats["tokens_after"]
+        stats["avg_elapsed_ms"] = round(stats.pop("elapsed_ms") / requests, 2) if requests else 0.0
+        return stats
@@ -1,6 +1,8 @@
 import os
 from dotenv import load_dotenv
-load_dotenv(override=True)
+# .env wins over the process environment unless DOTENV_OVERRIDE=false (benchmarks point
+# the endpoints at a local mock this way)
+load_dotenv(override=os.getenv("DOTENV_OVERRIDE", "true").lower() == "true")
 
 # Load environment variables from .env file
 # This is useful for local development
@@ -26,6 +28,76 @@ VECTOR_FIELD = os.getenv("VECTOR_FIELD")
 LOG_FORMAT = os.getenv("LOG_FORMAT", "%(asctime)s - %(levelname)s - %(message)s")
 LOG_FILE = os.getenv("LOG_FILE", "app.log")
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# JSON lines with a request id (false = plain LOG_FORMAT text)
+LOG_JSON = os.getenv("LOG_JSON", "true").lower() == "true"
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+# Prompts, answers and contexts longer than this are truncated or hashed in logs
+LOG_FIELD_MAX_CHARS = int(os.getenv("LOG_FIELD_MAX_CHARS", "2000"))
+# truncate | hash | full
+LOG_FIELD_MODE = os.getenv("LOG_FIELD_MODE", "truncate")
+# Fraction of requests whose payloads are logged in full regardless of LOG_FIELD_MODE
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.0"))
+
+# Embedding Cache Configuration
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "cache/embeddings.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "2048"))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "3600"))
+# The SQLite tier is pruned by age (seconds) and row count; 0 disables either bound
+EMBEDDING_CACHE_DISK_TTL = float(os.getenv("EMBEDDING_CACHE_DISK_TTL", "2592000"))
+EMBEDDING_CACHE_DISK_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_DISK_MAX_ROWS", "200000"))
+
+# Batched Embedding Configuration
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "16"))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "32000"))
+EMBEDDING_MAX_INPUT_TOKENS = int(os.getenv("EMBEDDING_MAX_INPUT_TOKENS", "8191"))
+EMBEDDING_BATCH_CONCURRENCY = int(os.getenv("EMBEDDING_BATCH_CONCURRENCY", "4"))
+
+# HTTP Connection Pool Configuration (shared Azure OpenAI clients)
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "50"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "120"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10"))
+
+# Azure Search Connection Pool Configuration
+SEARCH_POOL_CONNECTIONS = int(os.getenv("SEARCH_POOL_CONNECTIONS", "10"))
+SEARCH_POOL_MAXSIZE = int(os.getenv("SEARCH_POOL_MAXSIZE", "20"))
+SEARCH_CONNECT_TIMEOUT = float(os.getenv("SEARCH_CONNECT_TIMEOUT", "10"))
+SEARCH_READ_TIMEOUT = float(os.getenv("SEARCH_READ_TIMEOUT", "30"))
+
+# Retriever Configuration
+# azure | local (local reads a bundle written by local_index.py)
+RETRIEVER_BACKEND = os.getenv("RETRIEVER_BACKEND", "azure")
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", "data/local_index")
+# exact | graph
+LOCAL_INDEX_MODE = os.getenv("LOCAL_INDEX_MODE", "exact")
+LOCAL_INDEX_EF = int(os.getenv("LOCAL_INDEX_EF", "64"))
+# Fuse the retriever above with a local BM25 index over LOCAL_INDEX_PATH chunks
+LEXICAL_FUSION = os.getenv("LEXICAL_FUSION", "false").lower() == "true"
+RRF_K = int(os.getenv("RRF_K", "60"))
+RRF_CANDIDATES = int(os.getenv("RRF_CANDIDATES", "50"))
+RRF_VECTOR_WEIGHT = float(os.getenv("RRF_VECTOR_WEIGHT", "1.0"))
+RRF_LEXICAL_WEIGHT = float(os.getenv("RRF_LEXICAL_WEIGHT", "1.0"))
+
+# Semantic Response Cache Configuration
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+# Minimum cosine similarity between query embeddings for a cached answer to be reused
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1024"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+
+# Evaluation Configuration
+# none | inline | casefile | both
+EVALUATION_MODE = os.getenv("EVALUATION_MODE", "casefile")
+# Queue evaluations on a durable SQLite-backed job queue instead of blocking /api/query
+EVALUATION_ASYNC = os.getenv("EVALUATION_ASYNC", "true").lower() == "true"
+EVALUATION_JOBS_DB = os.getenv("EVALUATION_JOBS_DB", "cache/evaluation_jobs.sqlite3")
+EVALUATION_WORKERS = int(os.getenv("EVALUATION_WORKERS", "2"))
+EVALUATION_MAX_ATTEMPTS = int(os.getenv("EVALUATION_MAX_ATTEMPTS", "3"))
+EVALUATION_RETRY_BACKOFF = float(os.getenv("EVALUATION_RETRY_BACKOFF", "2"))
+EVALUATION_JOB_LEASE = float(os.getenv("EVALUATION_JOB_LEASE", "300"))
 
 # Feedback Configuration
 FEEDBACK_DIR = os.getenv("FEEDBACK_DIR", "feedback_data")
@@ -77,3 +149,64 @@ MODEL_DEPLOYMENTS = {
     "o4-mini": O4_MINI_DEPLOYMENT_NAME,
     "gpt-4o": GPT4O_DEPLOYMENT
 }
+
+# Context Packing Configuration
+# Token budget for retrieved sources in the chat prompt; per-model overrides below
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_MAX_SOURCES = int(os.getenv("CONTEXT_MAX_SOURCES", "10"))
+CONTEXT_TOKEN_CACHE_SIZE = int(os.getenv("CONTEXT_TOKEN_CACHE_SIZE", "4096"))
+# Drop near-duplicate chunks and reorder by maximal marginal relevance before packing
+CONTEXT_DEDUP_ENABLED = os.getenv("CONTEXT_DEDUP_ENABLED", "true").lower() == "true"
+# minhash (word shingles, no API calls) | embedding (cached chunk embeddings)
+CONTEXT_DEDUP_METHOD = os.getenv("CONTEXT_DEDUP_METHOD", "minhash")
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+# 1.0 = pure relevance order, lower values favour diversity
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+# Keep only the query-relevant sentences of each chunk before packing
+CONTEXT_COMPRESSION_ENABLED = os.getenv("CONTEXT_COMPRESSION_ENABLED", "false").lower() == "true"
+# lexical (IDF-weighted term overlap) | embedding (cached sentence embeddings)
+CONTEXT_COMPRESSION_METHOD = os.getenv("CONTEXT_COMPRESSION_METHOD", "lexical")
+# Fraction of each chunk's tokens to keep; chunks this short in sentences are left whole
+CONTEXT_COMPRESSION_RATIO = float(os.getenv("CONTEXT_COMPRESSION_RATIO", "0.5"))
+CONTEXT_COMPRESSION_MIN_SENTENCES = int(os.getenv("CONTEXT_COMPRESSION_MIN_SENTENCES", "2"))
+MODEL_CONTEXT_BUDGETS = {
+    "o3": os.getenv("O3_CONTEXT_TOKEN_BUDGET"),
+    "o4-mini": os.getenv("O4_MINI_CONTEXT_TOKEN_BUDGET"),
+    "gpt-4o": os.getenv("GPT4O_CONTEXT_TOKEN_BUDGET")
+}
+
+# Streaming Configuration
+# Merge answer tokens into one SSE event per window; 0 sends every token as it arrives
+STREAM_COALESCE_MS = float(os.getenv("STREAM_COALESCE_MS", "0"))
+# Flush early once this many characters are buffered (0 = no limit)
+STREAM_COALESCE_CHARS = int(os.getenv("STREAM_COALESCE_CHARS", "256"))
+
+# Metrics Configuration
+# Per-stage latency histograms and token counters served on /api/metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Tracing Configuration
+# Per-request span trees appended to TRACE_FILE; inspect with `python tracing.py waterfall <request_id>`
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+TRACE_FILE = os.getenv("TRACE_FILE", "traces/traces.jsonl")
+TRACE_BATCH_SIZE = int(os.getenv("TRACE_BATCH_SIZE", "64"))
+TRACE_FLUSH_SECONDS = float(os.getenv("TRACE_FLUSH_SECONDS", "2"))
+
+# Profiling Configuration
+# Opt-in CPU/memory profiling of /api/query requests; no hooks are installed unless enabled.
+# A request is profiled when it sends X-Profile: sample|cpu with X-Admin-Token, or falls in
+# PROFILE_SAMPLE_RATE (adjustable at runtime via /api/admin/profiling). The admin token also
+# guards /api/cache/invalidate.
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILING_ADMIN_TOKEN = os.getenv("PROFILING_ADMIN_TOKEN", "")
+PROFILE_MODE = os.getenv("PROFILE_MODE", "sample")  # sample | cpu
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MEMORY = os.getenv("PROFILE_MEMORY", "true").lower() == "true"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "100"))
+
+# Cassette Configuration
+# Record/replay Azure OpenAI and Search HTTP traffic: off | record | replay | auto
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off")
+CASSETTE_DIR = os.getenv("CASSETTE_DIR", "cassettes")
@@ -0,0 +1,24 @@
+import os
+import shutil
+import tempfile
+
+# config.py reads these at import time, and importing main opens the log
+# file and starts the evaluation job queue, so point every on-disk path at
+# a scratch directory before any test module imports them. The tracked .env
+# must not override them.
+_workdir = tempfile.mkdtemp(prefix="rag-tests-")
+os.environ["DOTENV_OVERRIDE"] = "false"
+for _name, _path in {
+    "LOG_FILE": "app.log",
+    "EVALUATION_JOBS_DB": "evaluation_jobs.sqlite3",
+    "EMBEDDING_CACHE_PATH": "embeddings.sqlite3",
+    "FEEDBACK_DIR": "feedback_data",
+    "PROFILE_DIR": "profiles",
+    "TRACE_FILE": "traces.jsonl",
+    "CASSETTE_DIR": "cassettes",
+}.items():
+    os.environ[_name] = os.path.join(_workdir, _path)
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_workdir, ignore_errors=True)
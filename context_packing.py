@@ -0,0 +1,159 @@
+"""
+Token-budget-aware context packing.
+
+Retrieved chunks are added to the prompt best first until the deployment's
+token budget is spent; the chunk that crosses the budget is cut at a
+sentence boundary instead of being dropped or sent whole. Token counts come
+from tiktoken when it is installed (a close approximation otherwise) and are
+cached per chunk, since the same chunks come back query after query.
+"""
+import logging
+import re
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import (
+    CONTEXT_TOKEN_BUDGET,
+    CONTEXT_MAX_SOURCES,
+    CONTEXT_TOKEN_CACHE_SIZE,
+    MODEL_CONTEXT_BUDGETS,
+)
+
+try:
+    import tiktoken
+except ImportError:  # optional dependency
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENCODING = "o200k_base"
+# <source id="n"> ... </source> wrapper plus the blank line between sources
+SOURCE_OVERHEAD_TOKENS = 12
+# Don't bother appending a truncated source shorter than this
+MIN_TRUNCATED_TOKENS = 32
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+_APPROX_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s for s in _SENTENCE_END.split(text) if s.strip()]
+
+
+def _approx_count(text: str) -> int:
+    # Words and punctuation, with long words costing extra — within ~10% of
+    # cl100k/o200k on English prose
+    return sum(1 + len(tok) // 8 for tok in _APPROX_TOKEN.findall(text))
+
+
+class TokenCounter:
+    """Cached token counting for one encoding."""
+
+    def __init__(self, encoding: str = DEFAULT_ENCODING, cache_size: int = CONTEXT_TOKEN_CACHE_SIZE):
+        raw: Callable[[str], int] = _approx_count
+        self.encoding_name = "approx"
+        if tiktoken is not None:
+            try:
+                enc = tiktoken.get_encoding(encoding)
+                raw = lambda text: len(enc.encode(text, disallowed_special=()))
+                self.encoding_name = encoding
+            except Exception as exc:  # encodings are downloaded on first use
+                logger.warning("tiktoken encoding %s unavailable, approximating: %s", encoding, exc)
+        self.count = lru_cache(maxsize=cache_size)(raw)
+
+    def cache_info(self):
+        return self.count.cache_info()
+
+
+_counters: Dict[str, TokenCounter] = {}
+# model id -> counter, including models tiktoken doesn't know (they get the default)
+_model_counters: Dict[Optional[str], TokenCounter] = {}
+
+
+def counter_for(model: Optional[str]) -> TokenCounter:
+    """Shared TokenCounter for the encoding a model id uses."""
+    counter = _model_counters.get(model)
+    if counter is not None:
+        return counter
+    encoding = DEFAULT_ENCODING
+    if tiktoken is not None and model:
+        try:
+            # Name lookup only; encoding_for_model would load the encoding too
+            encoding = tiktoken.encoding_name_for_model(model)
+        except Exception:
+            pass
+    counter = _counters.get(encoding)
+    if counter is None:
+        counter = _counters.setdefault(encoding, TokenCounter(encoding))
+    return _model_counters.setdefault(model, counter)
+
+
+def budget_for(model: Optional[str]) -> int:
+    budget = MODEL_CONTEXT_BUDGETS.get(model)
+    return int(budget) if budget else CONTEXT_TOKEN_BUDGET
+
+
+def truncate_to_tokens(text: str, max_tokens: int, count: Callable[[str], int]) -> str:
+    """Longest prefix of whole sentences that fits in max_tokens ("" if none)."""
+    kept, used = [], 0
+    for sentence in split_sentences(text):
+        cost = count(sentence) + 1
+        if used + cost > max_tokens:
+            break
+        kept.append(sentence)
+        used += cost
+    return " ".join(kept)
+
+
+def pack_context(
+    results: List[Dict],
+    budget: int,
+    counter: TokenCounter,
+    max_sources: int = CONTEXT_MAX_SOURCES,
+) -> Tuple[str, Dict, Dict]:
+    """
+    Pack ranked hits into <source> blocks within ``budget`` tokens.
+    Returns (context, src_map, report); each src_map entry carries the
+    "tokens" it used and whether it was "truncated".
+    """
+    entries, src_map = [], {}
+    used = dropped = 0
+    for res in results:
+        chunk = res["chunk"].strip()
+        if not chunk:
+            continue
+        if len(src_map) >= max_sources:
+            dropped += 1
+            continue
+        remaining = budget - used - SOURCE_OVERHEAD_TOKENS
+        tokens = counter.count(chunk)
+        truncated = False
+        if tokens > remaining:
+            if remaining < MIN_TRUNCATED_TOKENS:
+                dropped += 1
+                continue
+            chunk = truncate_to_tokens(chunk, remaining, counter.count)
+            if not chunk:
+                dropped += 1
+                continue
+            tokens, truncated = counter.count(chunk), True
+        sid = str(len(src_map) + 1)
+        entries.append(f'<source id="{sid}">{chunk}</source>')
+        src_map[sid] = {
+            "title": res["title"],
+            "content": chunk,
+            "score": res.get("relevance", 0.0),
+            "tokens": tokens,
+            "truncated": truncated,
+        }
+        if "url" in res:
+            src_map[sid]["url"] = res["url"]
+        used += tokens + SOURCE_OVERHEAD_TOKENS
+    report = {
+        "budget": budget,
+        "context_tokens": used,
+        "sources": len(src_map),
+        "dropped": dropped,
+        "encoding": counter.encoding_name,
+    }
+    return "\n\n".join(entries), src_map, report
@@ -0,0 +1,159 @@
+"""
+Post-retrieval near-duplicate removal and MMR diversification.
+
+Search often returns overlapping chunks of the same document. Before
+context packing, candidates are compared pairwise — by MinHash estimates of
+word-shingle Jaccard similarity (no API calls), or by cosine similarity of
+their embeddings — and near-duplicates of a better-ranked chunk are
+dropped. The survivors are reordered by maximal marginal relevance so the
+token budget is spent on distinct information. All pairwise math is done
+on NumPy matrices.
+"""
+import logging
+import re
+import threading
+import zlib
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import similarity
+from config import (
+    CONTEXT_DEDUP_METHOD,
+    CONTEXT_DEDUP_THRESHOLD,
+    CONTEXT_MMR_LAMBDA,
+)
+
+logger = logging.getLogger(__name__)
+
+DEDUP_METHODS = ("minhash", "embedding")
+
+_WORD = re.compile(r"\w+")
+_MERSENNE = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+class MinHasher:
+    """MinHash signatures over word shingles."""
+
+    def __init__(self, num_perm: int = 128, shingle: int = 3, seed: int = 1) -> None:
+        rng = np.random.default_rng(seed)
+        # Coefficients < 2**29 keep a * h (h < 2**32) well inside uint64
+        self.a = rng.integers(1, 1 << 29, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 29, size=num_perm, dtype=np.uint64)
+        self.shingle = shingle
+
+    def shingles(self, text: str) -> np.ndarray:
+        words = _WORD.findall(text.lower())
+        n = self.shingle if len(words) >= self.shingle else 1
+        grams = {" ".join(words[i:i + n]) for i in range(max(len(words) - n + 1, 0))}
+        return np.fromiter(
+            (zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams)
+        )
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = self.shingles(text)
+        if not hashes.size:
+            return np.full(self.a.shape[0], _MAX_HASH, dtype=np.uint64)
+        permuted = (self.a[:, None] * hashes[None, :] + self.b[:, None]) % _MERSENNE
+        return (permuted & _MAX_HASH).min(axis=1)
+
+    def similarity_matrix(self, texts: Sequence[str]) -> np.ndarray:
+        """Pairwise estimated Jaccard similarity, shape (n, n)."""
+        sigs = np.stack([self.signature(t) for t in texts]) if texts else np.empty((0, 0))
+        return (sigs[:, None, :] == sigs[None, :, :]).mean(axis=2)
+
+
+def mmr_order(relevance: np.ndarray, sim: np.ndarray, lam: float) -> List[int]:
+    """
+    Greedy maximal marginal relevance: repeatedly pick the candidate
+    maximizing lam * relevance - (1 - lam) * max similarity to those picked.
+    """
+    n = relevance.shape[0]
+    order: List[int] = []
+    if not n:
+        return order
+    max_sim = np.zeros(n, dtype=np.float64)
+    available = np.ones(n, dtype=bool)
+    for _ in range(n):
+        scores = np.where(available, lam * relevance - (1 - lam) * max_sim, -np.inf)
+        best = int(np.argmax(scores))
+        order.append(best)
+        available[best] = False
+        np.maximum(max_sim, sim[:, best], out=max_sim)
+    return order
+
+
+class ContextDiversifier:
+    """Dedupe + MMR stage with cumulative tokens-saved counters."""
+
+    def __init__(
+        self,
+        method: str = CONTEXT_DEDUP_METHOD,
+        threshold: float = CONTEXT_DEDUP_THRESHOLD,
+        mmr_lambda: float = CONTEXT_MMR_LAMBDA,
+        embed: Optional[Callable[[List[str]], List[Optional[List[float]]]]] = None,
+    ) -> None:
+        if method not in DEDUP_METHODS:
+            raise ValueError(f"method must be one of {DEDUP_METHODS}, got {method!r}")
+        if method == "embedding" and embed is None:
+            raise ValueError("embedding dedupe needs an embed function")
+        self.method = method
+        self.threshold = threshold
+        self.mmr_lambda = mmr_lambda
+        self.embed = embed
+        self.minhasher = MinHasher()
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "duplicates_dropped": 0, "tokens_saved": 0}
+
+    @property
+    def needs_embeddings(self) -> bool:
+        return self.method == "embedding"
+
+    def apply(
+        self, results: List[Dict], query: str = "", count_tokens: Callable[[str], int] = len
+    ) -> Tuple[List[Dict], Dict]:
+        """Return (deduped, MMR-ordered results, per-request report)."""
+        report = {"candidates": len(results), "duplicates_dropped": 0, "tokens_saved": 0}
+        if len(results) < 2:
+            return results, report
+        relevance, sim = self._relevance_and_similarity(results, query)
+
+        # Walk best-first; drop anything too similar to a chunk already kept
+        ranked = np.argsort(-relevance, kind="stable")
+        kept: List[int] = []
+        for i in ranked:
+            if kept and sim[i, kept].max() >= self.threshold:
+                report["duplicates_dropped"] += 1
+                report["tokens_saved"] += count_tokens(results[i]["chunk"])
+                continue
+            kept.append(int(i))
+        keep = np.array(kept)
+        order = mmr_order(relevance[keep], sim[np.ix_(keep, keep)], self.mmr_lambda)
+        with self._lock:
+            self._counters["requests"] += 1
+            self._counters["duplicates_dropped"] += report["duplicates_dropped"]
+            self._counters["tokens_saved"] += report["tokens_saved"]
+        return [results[keep[j]] for j in order], report
+
+    def _relevance_and_similarity(self, results: List[Dict], query: str) -> Tuple[np.ndarray, np.ndarray]:
+        texts = [r["chunk"] for r in results]
+        if self.method == "embedding":
+            vectors = self.embed([query] + texts)
+            if all(v is not None for v in vectors):
+                unit = similarity.normalize(vectors)
+                return unit[1:] @ unit[0], unit[1:] @ unit[1:].T
+            logger.warning("Embedding dedupe unavailable for this request; using MinHash")
+        # Retriever scores, min-max scaled so MMR's trade-off is scale free
+        scores = np.array([r.get("relevance", 0.0) for r in results], dtype=np.float64)
+        spread = scores.max() - scores.min()
+        relevance = (scores - scores.min()) / spread if spread else np.ones_like(scores)
+        return relevance, self.minhasher.similarity_matrix(texts)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._counters)
+        stats["avg_tokens_saved"] = (
+            round(stats["tokens_saved"] / stats["requests"], 1) if stats["requests"] else 0.0
+        )
+        return stats
@@ -0,0 +1,253 @@
+"""
+Two-tier cache for embedding vectors.
+
+An in-process LRU (bounded by entry count and TTL) sits in front of an
+on-disk SQLite store (bounded by age and row count, pruned on open and
+every PRUNE_EVERY stores). Entries are keyed by (embedding deployment,
+normalized text) and vectors are stored as packed float32 arrays.
+"""
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from config import (
+    EMBEDDING_CACHE_DISK_MAX_ROWS,
+    EMBEDDING_CACHE_DISK_TTL,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_TTL,
+)
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+PRUNE_EVERY = 256
+
+
+def approx_tokens(text: str) -> int:
+    # ~4 characters per token; conservative enough for request packing and spend estimates
+    return max(1, (len(text) + 3) // 4)
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text so trivially different inputs share a cache entry."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(deployment: str, text: str) -> str:
+    raw = f"{deployment or ''}\x00{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Thread-safe LRU + SQLite cache for embeddings.
+
+    Pass ``path=None`` to keep the cache purely in memory. The memory tier
+    and the SQLite connection have separate locks, so a slow disk read or
+    write never blocks memory hits on other threads.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = EMBEDDING_CACHE_PATH,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = EMBEDDING_CACHE_TTL,
+        disk_ttl_seconds: float = EMBEDDING_CACHE_DISK_TTL,
+        disk_max_rows: int = EMBEDDING_CACHE_DISK_MAX_ROWS,
+    ) -> None:
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = ttl_seconds
+        self.disk_ttl_seconds = disk_ttl_seconds
+        self.disk_max_rows = disk_max_rows
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._stores_since_prune = 0
+        self._memory: "OrderedDict[str, Tuple[float, array]]" = OrderedDict()
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "disk_pruned": 0,
+            "approx_tokens_saved": 0,
+        }
+        self._miss_seconds = 0.0
+        self._miss_samples = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._open_db(path)
+            self.prune()
+
+    def _open_db(self, path: str) -> None:
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY,"
+                " deployment TEXT,"
+                " dim INTEGER,"
+                " vector BLOB,"
+                " created_at REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_created_at ON embeddings (created_at)")
+            self._db.commit()
+        except sqlite3.Error as exc:
+            logger.error("Embedding cache disk store unavailable (%s): %s", path, exc)
+            self._db = None
+
+    # ───────────── lookup / store ─────────────
+    def get(self, deployment: str, text: str) -> Optional[List[float]]:
+        key = cache_key(deployment, text)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, vector = entry
+                if self.ttl_seconds and now - stored_at > self.ttl_seconds:
+                    del self._memory[key]
+                else:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    self._counters["approx_tokens_saved"] += approx_tokens(text)
+                    return vector.tolist()
+
+        vector = self._disk_get(key)
+        with self._lock:
+            if vector is not None:
+                self._remember(key, vector, now)
+                self._counters["disk_hits"] += 1
+                self._counters["approx_tokens_saved"] += approx_tokens(text)
+                return vector.tolist()
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, deployment: str, text: str, vector: List[float]) -> None:
+        if not vector:
+            return
+        key = cache_key(deployment, text)
+        packed = array("f", vector)
+        with self._lock:
+            self._remember(key, packed, time.monotonic())
+            self._counters["stores"] += 1
+        self._disk_put(key, deployment, packed)
+
+    def prune(self) -> int:
+        """Drop disk rows past the disk TTL, then the oldest beyond the row cap; returns rows removed."""
+        if self._db is None:
+            return 0
+        removed = 0
+        with self._db_lock:
+            self._stores_since_prune = 0
+            try:
+                if self.disk_ttl_seconds:
+                    cur = self._db.execute(
+                        "DELETE FROM embeddings WHERE created_at < ?", (time.time() - self.disk_ttl_seconds,)
+                    )
+                    removed += max(cur.rowcount, 0)
+                if self.disk_max_rows:
+                    cur = self._db.execute(
+                        "DELETE FROM embeddings WHERE key IN ("
+                        " SELECT key FROM embeddings ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                        (self.disk_max_rows,),
+                    )
+                    removed += max(cur.rowcount, 0)
+                self._db.commit()
+            except sqlite3.Error as exc:
+                logger.error("Embedding cache prune error: %s", exc)
+        if removed:
+            with self._lock:
+                self._counters["disk_pruned"] += removed
+            logger.info("Pruned %d embedding cache rows", removed)
+        return removed
+
+    def record_miss_latency(self, seconds: float) -> None:
+        """Record how long an uncached embedding call took."""
+        with self._lock:
+            self._miss_seconds += seconds
+            self._miss_samples += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._counters)
+            hits = stats["memory_hits"] + stats["disk_hits"]
+            lookups = hits + stats["misses"]
+            avg_miss = self._miss_seconds / self._miss_samples if self._miss_samples else 0.0
+            stats.update(
+                {
+                    "memory_entries": len(self._memory),
+                    "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                    "avg_miss_latency_ms": round(avg_miss * 1000, 2),
+                    "estimated_seconds_saved": round(hits * avg_miss, 3),
+                    "disk_enabled": self._db is not None,
+                }
+            )
+            return stats
+
+    # ───────────── internals ─────────────
+    def _remember(self, key: str, vector: array, now: float) -> None:
+        # Memory lock held
+        self._memory[key] = (now, vector)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def _disk_get(self, key: str) -> Optional[array]:
+        if self._db is None:
+            return None
+        oldest = time.time() - self.disk_ttl_seconds if self.disk_ttl_seconds else 0.0
+        try:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT vector FROM embeddings WHERE key = ? AND created_at >= ?", (key, oldest)
+                ).fetchone()
+        except sqlite3.Error as exc:
+            logger.error("Embedding cache read error: %s", exc)
+            return None
+        if row is None:
+            return None
+        vector = array("f")
+        vector.frombytes(row[0])
+        return vector
+
+    def _disk_put(self, key: str, deployment: str, vector: array) -> None:
+        if self._db is None:
+            return
+        try:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, deployment, dim, vector, created_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (key, deployment, len(vector), vector.tobytes(), time.time()),
+                )
+                self._db.commit()
+                self._stores_since_prune += 1
+                due = self._stores_since_prune >= PRUNE_EVERY
+        except sqlite3.Error as exc:
+            logger.error("Embedding cache write error: %s", exc)
+            return
+        if due:
+            self.prune()
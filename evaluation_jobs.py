@@ -0,0 +1,225 @@
+"""
+Durable evaluation job queue.
+
+Evaluation requests are persisted to SQLite and processed by a pool of
+worker threads, so /api/query can return the answer immediately and the
+evaluator result is fetched later from /api/evaluations/<id>. Jobs survive
+restarts; failed attempts are retried with exponential backoff and jobs
+left "running" by a crashed worker are re-queued once their lease expires.
+Several processes (e.g. gunicorn workers) may share one database file.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from config import (
+    EVALUATION_JOBS_DB,
+    EVALUATION_WORKERS,
+    EVALUATION_MAX_ATTEMPTS,
+    EVALUATION_RETRY_BACKOFF,
+    EVALUATION_JOB_LEASE,
+)
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class EvaluationJobQueue:
+    """SQLite-backed job queue with a worker thread pool and retries."""
+
+    def __init__(
+        self,
+        handler: Callable[[Dict[str, Any]], Any],
+        path: str = EVALUATION_JOBS_DB,
+        workers: int = EVALUATION_WORKERS,
+        max_attempts: int = EVALUATION_MAX_ATTEMPTS,
+        retry_backoff: float = EVALUATION_RETRY_BACKOFF,
+        lease_seconds: float = EVALUATION_JOB_LEASE,
+        poll_interval: float = 0.5,
+    ) -> None:
+        self.handler = handler
+        self.path = path
+        self.workers = max(1, int(workers))
+        self.max_attempts = max(1, int(max_attempts))
+        self.retry_backoff = retry_backoff
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._threads: List[threading.Thread] = []
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._init_schema()
+
+    # ───────────── storage ─────────────
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self) -> None:
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS evaluation_jobs ("
+            " id TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " result TEXT,"
+            " error TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " available_at REAL NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn().execute(
+            "CREATE INDEX IF NOT EXISTS evaluation_jobs_ready"
+            " ON evaluation_jobs (status, available_at)"
+        )
+
+    # ───────────── public API ─────────────
+    def enqueue(self, payload: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO evaluation_jobs (id, status, payload, available_at, created_at, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, QUEUED, json.dumps(payload), now, now, now),
+        )
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT id, status, result, error, attempts, created_at, updated_at"
+            " FROM evaluation_jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def stats(self) -> Dict[str, int]:
+        rows = self._conn().execute(
+            "SELECT status, COUNT(*) FROM evaluation_jobs GROUP BY status"
+        ).fetchall()
+        return {status: count for status, count in rows}
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker_loop, name=f"evaluation-worker-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info("Started %d evaluation workers on %s", self.workers, self.path)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def run_pending(self) -> int:
+        """Process ready jobs on the calling thread until none are left."""
+        processed = 0
+        while self._process_one():
+            processed += 1
+        return processed
+
+    # ───────────── workers ─────────────
+    def _worker_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self._process_one():
+                    continue
+            except Exception as exc:
+                logger.error("Evaluation worker error: %s", exc)
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Jobs whose worker died mid-run: give up on those that used every attempt
+            # (they may be what kills the worker), re-queue the rest
+            expired = now - self.lease_seconds
+            conn.execute(
+                "UPDATE evaluation_jobs SET status = ?, error = ?, updated_at = ?"
+                " WHERE status = ? AND updated_at < ? AND attempts >= ?",
+                (FAILED, "lease expired on final attempt", now, RUNNING, expired, self.max_attempts),
+            )
+            conn.execute(
+                "UPDATE evaluation_jobs SET status = ?, updated_at = ?"
+                " WHERE status = ? AND updated_at < ?",
+                (QUEUED, now, RUNNING, expired),
+            )
+            row = conn.execute(
+                "SELECT id, payload, attempts FROM evaluation_jobs"
+                " WHERE status = ? AND available_at <= ?"
+                " ORDER BY available_at LIMIT 1",
+                (QUEUED, now),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE evaluation_jobs SET status = ?, attempts = attempts + 1, updated_at = ?"
+                    " WHERE id = ?",
+                    (RUNNING, now, row["id"]),
+                )
+            conn.execute("COMMIT")
+            return row
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _process_one(self) -> bool:
+        row = self._claim()
+        if row is None:
+            return False
+        job_id, attempts = row["id"], row["attempts"] + 1
+        try:
+            result = json.dumps(self.handler(json.loads(row["payload"])))
+        except Exception as exc:
+            now = time.time()
+            if attempts < self.max_attempts:
+                delay = self.retry_backoff * (2 ** (attempts - 1))
+                logger.warning(
+                    "Evaluation job %s failed (attempt %d/%d), retrying in %.1fs: %s",
+                    job_id, attempts, self.max_attempts, delay, exc,
+                )
+                self._conn().execute(
+                    "UPDATE evaluation_jobs SET status = ?, error = ?, available_at = ?, updated_at = ?"
+                    " WHERE id = ?",
+                    (QUEUED, str(exc), now + delay, now, job_id),
+                )
+            else:
+                logger.error("Evaluation job %s failed permanently: %s", job_id, exc)
+                self._conn().execute(
+                    "UPDATE evaluation_jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                    (FAILED, str(exc), now, job_id),
+                )
+            return True
+        self._conn().execute(
+            "UPDATE evaluation_jobs SET status = ?, result = ?, error = NULL, updated_at = ?"
+            " WHERE id = ?",
+            (DONE, result, time.time(), job_id),
+        )
+        return True
@@ -1,17 +1,73 @@
+import asyncio
 import logging
-from openai import AzureOpenAI
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
-from config import (
-    MODEL_DEPLOYMENTS,
-    MODEL_ENDPOINTS,
-    MODEL_KEYS,
-    MODEL_API_VERSIONS,
-    AZURE_OPENAI_API_KEY,
-    OPENAI_ENDPOINT,
-    OPENAI_KEY,
-    OPENAI_API_VERSION,
-)
+from config import MODEL_DEPLOYMENTS, EVALUATION_MODE
+from client_registry import get_deployment_client
+from metrics import observe, record_usage
+from tracing import span, usage_attributes
+
+# Which evaluators a request runs:
+#   none     - skip evaluation entirely
+#   inline   - EvaluationModel.evaluate on the raw retrieved context
+#   casefile - EvaluationModel.evaluate_case_file on the exported casefile
+#   both     - inline + casefile
+EVALUATION_MODES = ("none", "inline", "casefile", "both")
+
+
+def normalize_evaluation_mode(mode: Optional[str]) -> str:
+    mode = (mode or EVALUATION_MODE or "casefile").strip().lower()
+    if mode not in EVALUATION_MODES:
+        raise ValueError(f"Unknown evaluation mode {mode!r}; expected one of {EVALUATION_MODES}")
+    return mode
+
+
+def build_case_file(
+    query: str,
+    answer: str,
+    sources: List[Dict],
+    model: str,
+    system_prompt: str,
+    appended_prompt: str = "",
+    parameters: Optional[Dict[str, Any]] = None,
+) -> str:
+    """Render an interaction as the markdown casefile evaluate_case_file expects."""
+    parameters = parameters or {}
+    params = ", ".join(
+        f"{name}={parameters.get(name)}" for name in ("temperature", "top_k", "top_p", "max_tokens")
+    )
+    full_context = ""
+    for i, source in enumerate(sources or [], 1):
+        content = source.get('content', '') if isinstance(source, dict) else str(source)
+        title = source.get('title', f'Source {i}') if isinstance(source, dict) else f'Source {i}'
+        full_context += f"\n### Source {i}: {title}\n{content}\n"
+    return f"""
+## Session Information
+- Timestamp: {datetime.now().isoformat()}
+- Model: {model}
+- Parameters: {params}
+
+## Query
+{query}
+
+## System Prompt
+{system_prompt}
+
+## Appended Prompt
+{appended_prompt or ''}
+
+## Model Parameters
+{params}
+
+## Response
+{answer}
+
+## Sources
+{full_context}
+"""
+
 
 class EvaluationModel:
     """
@@ -20,32 +76,77 @@ class EvaluationModel:
     """
     def __init__(self, model: str = None):
         # Configure Azure OpenAI client
-        endpoint = OPENAI_ENDPOINT
-        api_key = AZURE_OPENAI_API_KEY or OPENAI_KEY
-        api_version = OPENAI_API_VERSION
         deployment = model or MODEL_DEPLOYMENTS.get("gpt-4o")
-        # Allow overrides from MODEL_ENDPOINTS/MODEL_KEYS/MODEL_API_VERSIONS
-        if deployment in MODEL_ENDPOINTS and MODEL_ENDPOINTS[deployment]:
-            endpoint = MODEL_ENDPOINTS[deployment]
-        if deployment in MODEL_KEYS and MODEL_KEYS[deployment]:
-            api_key = MODEL_KEYS[deployment]
-        if deployment in MODEL_API_VERSIONS and MODEL_API_VERSIONS[deployment]:
-            api_version = MODEL_API_VERSIONS[deployment]
-        self.client = AzureOpenAI(
-            azure_endpoint=endpoint,
-            api_key=api_key,
-            api_version=api_version or "2023-05-15",
-        )
+        # Shared, pooled client resolved from MODEL_ENDPOINTS/MODEL_KEYS/MODEL_API_VERSIONS
+        self.client, deployment = get_deployment_client(deployment)
         self.deployment = deployment
         logger.info("EvaluationModel initialized with deployment: %s", deployment)
 
 
+    def run(
+        self,
+        mode: str,
+        user_query: str,
+        system_prompt: str,
+        model_response: str,
+        sources,
+        casefile: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Run exactly the evaluators selected by ``mode`` (see EVALUATION_MODES).
+        Returns {"mode": mode, "inline": {...}, "casefile": "..."} with only the
+        keys for evaluators that ran.
+        """
+        mode = normalize_evaluation_mode(mode)
+        result: Dict[str, Any] = {"mode": mode}
+        if mode in ("inline", "both"):
+            result["inline"] = self.evaluate(user_query, system_prompt, model_response, sources)
+        if mode in ("casefile", "both"):
+            if casefile is None:
+                raise ValueError("casefile evaluation requested without a casefile")
+            result["casefile"] = self.evaluate_case_file(casefile)
+        return result
+
+    @staticmethod
+    def primary_report(result: Dict[str, Any]) -> Any:
+        """The single report shown to users: casefile if it ran, else inline."""
+        if not result:
+            return None
+        if result.get("casefile") is not None:
+            return result["casefile"]
+        inline = result.get("inline")
+        if isinstance(inline, dict) and "report" in inline:
+            return inline["report"]
+        return inline
+
     def evaluate(self, user_query: str, system_prompt: str, model_response: str, sources) -> dict:
     
         """
         Perform evaluation of four inputs: user_query, system_prompt, model_response, and sources.
         Returns a markdown-formatted diagnostic report or input errors.
         """
+        messages, error = self._evaluate_messages(user_query, system_prompt, model_response, sources)
+        if error:
+            return error
+
+        logger.info("EvaluationModel: invoking LLM with deployment: %s", self.deployment)
+        with observe("evaluate_inline", self.deployment), span("evaluate_inline", deployment=self.deployment) as sp:
+            resp = self.client.chat.completions.create(
+                model=self.deployment,
+                messages=messages,
+                max_completion_tokens=1000,
+                temperature=0.0
+            )
+            sp.set(**usage_attributes(getattr(resp, "usage", None)))
+        record_usage(self.deployment, getattr(resp, "usage", None))
+        content = resp.choices[0].message.content
+        # Return raw markdown report
+        return {"report": content.strip()}
+
+    def _evaluate_messages(
+        self, user_query: str, system_prompt: str, model_response: str, sources
+    ) -> Tuple[Optional[List[Dict[str, str]]], Optional[Dict[str, Any]]]:
+        """Validate inputs and build the diagnostic prompt; returns (messages, error)."""
         missing_fields = []
         if not user_query or not user_query.strip():
             missing_fields.append("user_query")
@@ -56,7 +157,7 @@ class EvaluationModel:
         if not sources or (isinstance(sources, str) and not sources.strip()) or (isinstance(sources, list) and len(sources) == 0):
             missing_fields.append("sources")
         if missing_fields:
-            return {
+            return None, {
                 "error": "Input Error",
                 "missing_fields": missing_fields
             }
@@ -101,18 +202,79 @@ class EvaluationModel:
             {"role": "system", "content": prompt_to_use},
             {"role": "user", "content": ""}
         ]
+        return messages, None
 
-        logger.info("EvaluationModel: invoking LLM with deployment: %s", self.deployment)
-        resp = self.client.chat.completions.create(
-            model=self.deployment,
-            messages=messages,
-            max_completion_tokens=1000,
-            temperature=0.0
-        )
-        content = resp.choices[0].message.content
-        # Return raw markdown report
-        return {"report": content.strip()}
     def evaluate_case_file(self, casefile_markdown: str) -> str:
+        with observe("evaluate_casefile", self.deployment), span("evaluate_casefile", deployment=self.deployment) as sp:
+            response = self.client.chat.completions.create(
+                model=self.deployment,
+                messages=self._case_file_messages(casefile_markdown),
+                max_completion_tokens=1200,
+                temperature=0.0,
+            )
+            sp.set(**usage_attributes(getattr(response, "usage", None)))
+        record_usage(self.deployment, getattr(response, "usage", None))
+        return response.choices[0].message.content
+
+    # ───────────── asyncio variants (AsyncAzureOpenAI client) ─────────────
+    async def aevaluate(
+        self, client, user_query: str, system_prompt: str, model_response: str, sources
+    ) -> dict:
+        """Async evaluate() using the given AsyncAzureOpenAI client."""
+        messages, error = self._evaluate_messages(user_query, system_prompt, model_response, sources)
+        if error:
+            return error
+        with observe("evaluate_inline", self.deployment), span("evaluate_inline", deployment=self.deployment) as sp:
+            resp = await client.chat.completions.create(
+                model=self.deployment,
+                messages=messages,
+                max_completion_tokens=1000,
+                temperature=0.0
+            )
+            sp.set(**usage_attributes(getattr(resp, "usage", None)))
+        record_usage(self.deployment, getattr(resp, "usage", None))
+        return {"report": resp.choices[0].message.content.strip()}
+
+    async def aevaluate_case_file(self, client, casefile_markdown: str) -> str:
+        """Async evaluate_case_file() using the given AsyncAzureOpenAI client."""
+        with observe("evaluate_casefile", self.deployment), span("evaluate_casefile", deployment=self.deployment) as sp:
+            response = await client.chat.completions.create(
+                model=self.deployment,
+                messages=self._case_file_messages(casefile_markdown),
+                max_completion_tokens=1200,
+                temperature=0.0,
+            )
+            sp.set(**usage_attributes(getattr(response, "usage", None)))
+        record_usage(self.deployment, getattr(response, "usage", None))
+        return response.choices[0].message.content
+
+    async def arun(
+        self,
+        client,
+        mode: str,
+        user_query: str,
+        system_prompt: str,
+        model_response: str,
+        sources,
+        casefile: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Async run(); inline and casefile evaluators execute concurrently."""
+        mode = normalize_evaluation_mode(mode)
+        result: Dict[str, Any] = {"mode": mode}
+        tasks = {}
+        if mode in ("inline", "both"):
+            tasks["inline"] = self.aevaluate(client, user_query, system_prompt, model_response, sources)
+        if mode in ("casefile", "both"):
+            if casefile is None:
+                raise ValueError("casefile evaluation requested without a casefile")
+            tasks["casefile"] = self.aevaluate_case_file(client, casefile)
+        if tasks:
+            for key, value in zip(tasks, await asyncio.gather(*tasks.values())):
+                result[key] = value
+        return result
+
+    @staticmethod
+    def _case_file_messages(casefile_markdown: str) -> List[Dict[str, str]]:
         rubric_prompt = """
 # Evaluation Rubric for RAG Chatbot System Prompt
 The Prompt Diagnostician’s Mandate: Prompt for Evaluation LLM
@@ -211,14 +373,7 @@ You will always receive a single document  or text from input, representing a f
         
     *   If you encounter missing, malformed, or contradictory sections, flag these as input errors at the top of your output.
 """
-        messages = [
+        return [
             {"role": "system", "content": rubric_prompt.strip()},
             {"role": "user", "content": casefile_markdown.strip()}
         ]
-        response = self.client.chat.completions.create(
-            model=self.deployment,
-            messages=messages,
-            max_completion_tokens=1200,
-            temperature=0.0,
-        )
-        return response.choices[0].message.content
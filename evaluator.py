@@ -1,16 +1,7 @@
 import logging
 import re
-from openai import AzureOpenAI
-from config import (
-    MODEL_DEPLOYMENTS,
-    MODEL_ENDPOINTS,
-    MODEL_KEYS,
-    MODEL_API_VERSIONS,
-    AZURE_OPENAI_API_KEY,
-    OPENAI_ENDPOINT,
-    OPENAI_KEY,
-    OPENAI_API_VERSION,
-)
+from config import MODEL_DEPLOYMENTS
+from client_registry import get_deployment_client
 
 logger = logging.getLogger(__name__)
 
@@ -30,21 +21,9 @@ class PromptEvaluator:
     ]
 
     def __init__(self, model: str = None):
-        endpoint = OPENAI_ENDPOINT
-        api_key = AZURE_OPENAI_API_KEY or OPENAI_KEY
-        api_version = OPENAI_API_VERSION
         deployment = model or MODEL_DEPLOYMENTS.get("gpt-4o")
-        if deployment in MODEL_ENDPOINTS and MODEL_ENDPOINTS[deployment]:
-            endpoint = MODEL_ENDPOINTS[deployment]
-        if deployment in MODEL_KEYS and MODEL_KEYS[deployment]:
-            api_key = MODEL_KEYS[deployment]
-        if deployment in MODEL_API_VERSIONS and MODEL_API_VERSIONS[deployment]:
-            api_version = MODEL_API_VERSIONS[deployment]
-        self.client = AzureOpenAI(
-            azure_endpoint=endpoint,
-            api_key=api_key,
-            api_version=api_version or "2023-05-15",
-        )
+        # Shared, pooled client resolved from MODEL_ENDPOINTS/MODEL_KEYS/MODEL_API_VERSIONS
+        self.client, deployment = get_deployment_client(deployment)
         self.deployment = deployment
         logger.info("PromptEvaluator initialized with deployment: %s", deployment)
 
@@ -0,0 +1,206 @@
+"""
+Local in-process vector index, an offline stand-in for Azure Search.
+
+A bundle is a directory holding:
+
+    embeddings.npy   float32 (n, dim) with L2-normalized rows (memory-mapped)
+    chunks.jsonl     one {"chunk": ..., "title": ..., ...} object per row
+    graph.npy        optional int32 (n, degree) nearest-neighbour lists
+    bm25.npz         BM25 postings over the same chunks (see bm25.py)
+
+Queries are answered with an exact vectorized scan, or with a greedy beam
+search over the neighbour graph ("graph" mode) for large bundles. Build a
+bundle from a JSONL file of chunks (embedded with EMBEDDING_DEPLOYMENT
+unless each record already carries an "embedding"):
+
+    python local_index.py build chunks.jsonl data/local_index --graph-degree 16
+"""
+import argparse
+import heapq
+import json
+import logging
+import os
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import similarity
+from config import LOCAL_INDEX_PATH, LOCAL_INDEX_MODE, LOCAL_INDEX_EF
+from retrievers import Retriever
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_FILE = "embeddings.npy"
+CHUNKS_FILE = "chunks.jsonl"
+GRAPH_FILE = "graph.npy"
+SEARCH_MODES = ("exact", "graph")
+
+
+def build_knn_graph(rows: np.ndarray, degree: int, block: int = 1024) -> np.ndarray:
+    """Exact k-nearest-neighbour lists for unit rows, computed block by block."""
+    n = rows.shape[0]
+    degree = min(int(degree), n - 1)
+    graph = np.zeros((n, max(degree, 0)), dtype=np.int32)
+    if degree <= 0:
+        return graph
+    for start in range(0, n, block):
+        scores = rows[start:start + block] @ rows.T
+        for i in range(scores.shape[0]):
+            scores[i, start + i] = -np.inf  # no self-loops
+        idx = np.argpartition(-scores, degree - 1, axis=1)[:, :degree]
+        order = np.argsort(-np.take_along_axis(scores, idx, axis=1), axis=1)
+        graph[start:start + block] = np.take_along_axis(idx, order, axis=1)
+    return graph
+
+
+def read_records(path: str) -> List[Dict]:
+    with open(os.path.join(path, CHUNKS_FILE), encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def write_bundle(
+    path: str, records: Sequence[Dict], vectors: Iterable[Sequence[float]], graph_degree: int = 0
+) -> None:
+    """Write records and their embeddings as a bundle LocalVectorIndex can load."""
+    rows = similarity.normalize(np.asarray(list(vectors), dtype=np.float32))
+    if rows.shape[0] != len(records):
+        raise ValueError(f"{len(records)} records but {rows.shape[0]} vectors")
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, EMBEDDINGS_FILE), rows)
+    with open(os.path.join(path, CHUNKS_FILE), "w", encoding="utf-8") as fh:
+        for record in records:
+            fh.write(json.dumps({k: v for k, v in record.items() if k != "embedding"}) + "\n")
+    graph_path = os.path.join(path, GRAPH_FILE)
+    if graph_degree:
+        np.save(graph_path, build_knn_graph(rows, graph_degree))
+    elif os.path.exists(graph_path):
+        os.remove(graph_path)
+    from bm25 import BM25Index
+
+    BM25Index.from_records(records).save(path)
+
+
+class LocalVectorIndex(Retriever):
+    """k-NN retriever over a memory-mapped bundle; see the module docstring."""
+
+    name = "local"
+
+    def __init__(
+        self, path: str = LOCAL_INDEX_PATH, mode: str = LOCAL_INDEX_MODE, ef: int = LOCAL_INDEX_EF
+    ) -> None:
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"mode must be one of {SEARCH_MODES}, got {mode!r}")
+        self.path = path
+        self.ef = max(1, int(ef))
+        self.rows = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r")
+        self.records = read_records(path)
+        if len(self.records) != self.rows.shape[0]:
+            raise ValueError(
+                f"{path}: {len(self.records)} chunks but {self.rows.shape[0]} embeddings"
+            )
+        self.graph: Optional[np.ndarray] = None
+        graph_path = os.path.join(path, GRAPH_FILE)
+        if mode == "graph":
+            if os.path.exists(graph_path):
+                self.graph = np.load(graph_path, mmap_mode="r")
+            else:
+                logger.warning("%s has no %s; falling back to exact search", path, GRAPH_FILE)
+        self.mode = "graph" if self.graph is not None else "exact"
+        # Fixed, evenly spaced entry sample (~4·sqrt(n)) scored exactly before the
+        # beam search, so queries start inside the right cluster deterministically
+        n = len(self.records)
+        num = min(n, max(32, int(4 * np.sqrt(n))))
+        self._entries = np.unique(np.linspace(0, n - 1, num=num, dtype=np.int64)) if n else None
+        logger.info("Loaded local index %s (%d chunks, %s search)", path, n, self.mode)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def search(self, query: str, q_vec: List[float], top: int = 10) -> List[Dict]:
+        if not len(self) or not q_vec:
+            return []
+        q = similarity.normalize(q_vec)[0]
+        if self.mode == "graph":
+            idx, scores = self._graph_search(q, top)
+        else:
+            idx, scores = similarity.top_k(similarity.dot(q, self.rows), top)
+        return [self._hit(int(i), float(s)) for i, s in zip(idx, scores)]
+
+    def _hit(self, i: int, score: float) -> Dict:
+        record = self.records[i]
+        hit = {
+            "chunk": record.get("chunk", ""),
+            "title": record.get("title", "Untitled"),
+            "relevance": score,
+        }
+        if "url" in record:
+            hit["url"] = record["url"]
+        return hit
+
+    def _graph_search(self, q: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Best-first beam search (beam width ef) from the fixed entry points."""
+        ef = max(self.ef, k)
+        visited = np.zeros(len(self), dtype=bool)
+        visited[self._entries] = True
+        entry_idx, entry_scores = similarity.top_k(self.rows[self._entries] @ q, ef)
+        entries = self._entries[entry_idx]
+        frontier = [(-s, int(i)) for s, i in zip(entry_scores, entries)]
+        heapq.heapify(frontier)
+        best = [(s, int(i)) for s, i in zip(entry_scores, entries)]
+        heapq.heapify(best)  # min-heap of the ef best found so far
+        while frontier:
+            neg, node = heapq.heappop(frontier)
+            if len(best) >= ef and -neg < best[0][0]:
+                break
+            nbrs = np.asarray(self.graph[node])
+            nbrs = nbrs[~visited[nbrs]]
+            if not nbrs.size:
+                continue
+            visited[nbrs] = True
+            for s, i in zip(self.rows[nbrs] @ q, nbrs):
+                if len(best) < ef or s > best[0][0]:
+                    heapq.heappush(frontier, (-s, int(i)))
+                    heapq.heappush(best, (s, int(i)))
+                    if len(best) > ef:
+                        heapq.heappop(best)
+        top = heapq.nlargest(k, best)
+        return (
+            np.array([i for _, i in top], dtype=np.int64),
+            np.array([s for s, _ in top], dtype=np.float32),
+        )
+
+
+def _build(args: argparse.Namespace) -> None:
+    with open(args.input, encoding="utf-8") as fh:
+        records = [json.loads(line) for line in fh if line.strip()]
+    vectors = [r.get("embedding") for r in records]
+    missing = [i for i, v in enumerate(vectors) if not v]
+    if missing:
+        from rag_assistant import FlaskRAGAssistant
+
+        embedded, errors = FlaskRAGAssistant().generate_embeddings(
+            [records[i].get("chunk", "") for i in missing]
+        )
+        if errors:
+            raise SystemExit(f"embedding failed for {len(errors)} chunks")
+        for i, vector in zip(missing, embedded):
+            vectors[i] = vector
+    write_bundle(args.output, records, vectors, graph_degree=args.graph_degree)
+    print(f"wrote {len(records)} chunks to {args.output}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local vector index bundles")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="build a bundle from a JSONL file of chunks")
+    build.add_argument("input")
+    build.add_argument("output")
+    build.add_argument("--graph-degree", type=int, default=0,
+                       help="neighbours per node for graph search (0 = exact only)")
+    build.set_defaults(func=_build)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,10 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, request, jsonify, render_template, send_from_directory, Response, stream_with_context, g
+import hmac
 import json
 import logging
-import sys
 import os
 import time
+from contextlib import closing
 from datetime import datetime
 
 # Import the RAG assistant
@@ -13,21 +14,18 @@ except ImportError:
     FlaskRAGAssistant = None
 
 from config import *
-
-# Configure logging
+from evaluation_model import EvaluationModel, EVALUATION_MODES
+from evaluation_jobs import EvaluationJobQueue
+from streaming import coalesce_tokens
+from structured_logging import configure_logging, set_request_id, get_request_id, inbound_request_id
+from metrics import REGISTRY as METRICS
+from tracing import start_trace, span
+from profiling import ProfilingController
+from cassette import get_store as cassette_store
+
+# Configure logging: records are written by a background listener, not the request thread
+configure_logging()
 logger = logging.getLogger(__name__)
-if logger.handlers:
-    logger.handlers.clear()
-
-file_handler = logging.FileHandler('app.log')
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
-
-stream_handler = logging.StreamHandler(sys.stdout)
-stream_handler.setFormatter(formatter)
-logger.addHandler(stream_handler)
-logger.setLevel(logging.DEBUG)
 
 logger.info("RAG Assistant Interface starting up")
 
@@ -45,6 +43,73 @@ try:
 except Exception as e:
     logger.error(f"Failed to initialize RAG Assistant: {e}")
 
+# Durable evaluation queue so evaluation stays off the /api/query latency path
+evaluation_queue = None
+if rag_assistant:
+    try:
+        evaluation_queue = EvaluationJobQueue(handler=rag_assistant.run_evaluation_request)
+        evaluation_queue.start()
+        rag_assistant.evaluation_queue = evaluation_queue
+    except Exception as e:
+        logger.error(f"Failed to start evaluation queue: {e}")
+
+@app.before_request
+def bind_request_id():
+    """Tag every log record of this request with the caller's X-Request-ID (or a new one)"""
+    request_id = set_request_id(inbound_request_id(request.headers.get('X-Request-ID')))
+    g.trace = start_trace(f"{request.method} {request.path}", trace_id=request_id)
+
+@app.after_request
+def echo_request_id(response):
+    response.headers['X-Request-ID'] = get_request_id()
+    g.trace.set(status_code=response.status_code)
+    return response
+
+@app.teardown_request
+def finish_trace(exc):
+    # Streamed responses keep the request context open, so this runs after the last event
+    trace = g.pop('trace', None)
+    if trace is not None:
+        trace.finish()
+
+def _is_admin():
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(PROFILING_ADMIN_TOKEN) and hmac.compare_digest(token, PROFILING_ADMIN_TOKEN)
+
+# Profiling hooks are only registered when enabled, so they cost nothing otherwise
+profiler = ProfilingController() if PROFILING_ENABLED else None
+if profiler:
+    @app.before_request
+    def start_profile():
+        if not request.path.startswith('/api/query'):
+            return
+        requested = request.headers.get('X-Profile')
+        if requested and not _is_admin():
+            requested = None
+        g.profile = profiler.begin(requested)
+
+    @app.teardown_request
+    def finish_profile(exc):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            try:
+                profiler.end(profile, get_request_id())
+            except Exception as e:
+                logger.warning(f"Could not write profile reports: {e}")
+
+    @app.route('/api/admin/profiling', methods=['GET', 'POST'])
+    def admin_profiling():
+        """View or change the profiling sample rate/mode; lists recent reports"""
+        if not _is_admin():
+            return jsonify({'error': 'Forbidden'}), 403
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            try:
+                profiler.configure(data.get('sample_rate'), data.get('mode'), data.get('memory'))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        return jsonify({'settings': profiler.settings(), 'reports': profiler.reports()})
+
 @app.route('/')
 def index():
     """Serve the main interface"""
@@ -55,6 +120,93 @@ def system_prompt():
     """Return the default system prompt"""
     return jsonify({'system_prompt': rag_assistant.system_prompt if rag_assistant else ''})
 
+def _format_sources(sources):
+    """Format cited sources for display"""
+    formatted_sources = []
+    for i, source in enumerate(sources or [], 1):
+        content = source.get('content', '') if isinstance(source, dict) else str(source)
+        title = source.get('title', f'Source {i}') if isinstance(source, dict) else f'Source {i}'
+        score = source.get('score', 0) if isinstance(source, dict) else 0
+        tokens = source.get('tokens') if isinstance(source, dict) else None
+        formatted_sources.append({'title': title, 'content': content, 'score': score, 'tokens': tokens})
+    return formatted_sources
+
+def _sse(event, payload):
+    """Encode one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+@app.route('/api/query/stream', methods=['POST'])
+def query_stream():
+    """Stream answer tokens, then cited sources, then the evaluation as SSE events"""
+    data = request.get_json()
+    if not data or 'query' not in data:
+        return jsonify({'error': 'Query is required'}), 400
+    if data.get('evaluation_mode') and data['evaluation_mode'] not in EVALUATION_MODES:
+        return jsonify({'error': f"evaluation_mode must be one of {list(EVALUATION_MODES)}"}), 400
+    if not rag_assistant:
+        return jsonify({'error': 'RAG assistant unavailable'}), 503
+
+    query_text = data['query']
+    model = data.get('model', 'gpt-4o')
+    # Omit temperature and top_p for o3, o4-mini, and gpt-4o
+    if model in ['o3', 'o4-mini', 'gpt-4o']:
+        temperature = None
+        top_p = None
+    else:
+        temperature = data.get('temperature', 0.7)
+        top_p = data.get('top_p', 0.9)
+    settings = rag_assistant.default_settings().with_overrides(
+        deployment=model,
+        temperature=temperature,
+        top_p=top_p,
+        max_tokens=data.get('max_tokens', 1000),
+        top_k=data.get('top_k', 50),
+        casefile_system_prompt=data.get('system_prompt')
+    )
+    evaluation_mode = data.get('evaluation_mode', EVALUATION_MODE)
+    evaluation_async = bool(data.get('evaluation_async', EVALUATION_ASYNC))
+    logger.info(f"Streaming query: {query_text[:100]}...")
+
+    def generate():
+        yield _sse('meta', {'model': model, 'timestamp': datetime.now().isoformat()})
+        items = rag_assistant.stream_rag_response(
+            query_text,
+            appended_prompt=data.get('appended_prompt', ''),
+            settings=settings,
+            evaluation_mode=evaluation_mode,
+            evaluation_async=evaluation_async
+        )
+        # If the client disconnects, the server closes this generator; closing
+        # `items` with it cancels the upstream model stream right away
+        with closing(items):
+            for item in coalesce_tokens(items):
+                if isinstance(item, str):
+                    yield _sse('token', {'text': item})
+                elif 'source' in item:
+                    source = item['source']
+                    yield _sse('source', {'source': dict(_format_sources([source])[0], id=source['id'])})
+                elif 'sources' in item:
+                    yield _sse('sources', {
+                        'sources': _format_sources(item['sources']),
+                        'answer': item.get('answer')
+                    })
+                elif 'evaluation' in item:
+                    evaluation = item['evaluation'] or {}
+                    yield _sse('evaluation', {
+                        'evaluation': EvaluationModel.primary_report(evaluation),
+                        'evaluations': evaluation,
+                        'evaluation_job_id': evaluation.get('job_id')
+                    })
+                elif 'error' in item:
+                    yield _sse('error', {'error': item['error']})
+        yield _sse('done', {'status': 'success', 'timestamp': datetime.now().isoformat()})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/query', methods=['POST'])
 def query():
     try:
@@ -63,8 +215,9 @@ def query():
             return jsonify({'error': 'Query is required'}), 400
 
         query_text = data['query']
+        if data.get('evaluation_mode') and data['evaluation_mode'] not in EVALUATION_MODES:
+            return jsonify({'error': f"evaluation_mode must be one of {list(EVALUATION_MODES)}"}), 400
         model = data.get('model', 'gpt-4o')
-        system_prompt = data.get('system_prompt', rag_assistant.system_prompt)
         appended_prompt = data.get('appended_prompt', '')
         # Omit temperature and top_p for o3, o4-mini, and gpt-4o
         if model in ['o3', 'o4-mini', 'gpt-4o']:
@@ -78,13 +231,20 @@ def query():
 
         logger.info(f"Processing query: {query_text[:100]}...")
 
-        # --- RAG Step ---
+        evaluation_mode = data.get('evaluation_mode', EVALUATION_MODE)
+        evaluation_async = bool(data.get('evaluation_async', EVALUATION_ASYNC))
+
+        # --- RAG + Evaluation Step (evaluators selected by evaluation_mode) ---
         if model in ['o3', 'o4-mini', 'gpt-4o']:
             result = rag_assistant.query(
                 query=query_text,
                 deployment=model,
                 max_tokens=max_tokens,
-                appended_prompt=appended_prompt
+                appended_prompt=appended_prompt,
+                top_k=top_k,
+                evaluation_mode=evaluation_mode,
+                evaluation_async=evaluation_async,
+                casefile_system_prompt=data.get('system_prompt')
             )
         else:
             result = rag_assistant.query(
@@ -93,51 +253,15 @@ def query():
                 temperature=temperature,
                 top_p=top_p,
                 max_tokens=max_tokens,
-                appended_prompt=appended_prompt
+                appended_prompt=appended_prompt,
+                top_k=top_k,
+                evaluation_mode=evaluation_mode,
+                evaluation_async=evaluation_async,
+                casefile_system_prompt=data.get('system_prompt')
             )
-        answer, sources = result[0], result[1]
-
-        # Format full sources/context for display and for evaluator
-        formatted_sources = []
-        full_context = ""
-        if sources:
-            for i, source in enumerate(sources, 1):
-                content = source.get('content', '') if isinstance(source, dict) else str(source)
-                title = source.get('title', f'Source {i}') if isinstance(source, dict) else f'Source {i}'
-                score = source.get('score', 0) if isinstance(source, dict) else 0
-                formatted_sources.append({'title': title, 'content': content, 'score': score})
-                full_context += f"\n### Source {i}: {title}\n{content}\n"
-
-        # --- Casefile for Evaluator LLM ---
-        casefile = f"""
-## Session Information
-- Timestamp: {datetime.now().isoformat()}
-- Model: {model}
-- Parameters: temperature={temperature}, top_k={top_k}, top_p={top_p}, max_tokens={max_tokens}
-
-## Query
-{query_text}
-
-## System Prompt
-{system_prompt}
-
-## Appended Prompt
-{appended_prompt}
-
-## Model Parameters
-temperature={temperature}, top_k={top_k}, top_p={top_p}, max_tokens={max_tokens}
-
-## Response
-{answer}
-
-## Sources
-{full_context}
-"""
-
-        # --- Evaluation Step ---
-        from evaluation_model import EvaluationModel
-        eval_model = EvaluationModel(model=model)
-        diagnostic = eval_model.evaluate_case_file(casefile)
+        answer, sources, evaluation = result
+
+        formatted_sources = _format_sources(sources)
 
         response_data = {
             'answer': answer,
@@ -149,10 +273,13 @@ temperature={temperature}, top_k={top_k}, top_p={top_p}, max_tokens={max_tokens}
             'max_tokens': max_tokens,
             'status': 'success',
             'timestamp': datetime.now().isoformat(),
-            'evaluation': diagnostic
+            'evaluation': EvaluationModel.primary_report(evaluation),
+            'evaluations': evaluation,
+            'evaluation_job_id': evaluation.get('job_id')
         }
         logger.info("Query+Evaluation complete")
-        return jsonify(response_data)
+        with span("serialize", sources=len(formatted_sources)):
+            return jsonify(response_data)
 
     except Exception as e:
         logger.error(f"Error in /api/query: {e}")
@@ -176,7 +303,6 @@ def evaluate():
         if missing:
             return jsonify({'error': 'Missing fields', 'missing_fields': missing}), 400
 
-        from evaluation_model import EvaluationModel
         eval_model = EvaluationModel(model=data.get('model'))
         diagnostic = eval_model.evaluate(
             data['user_query'],
@@ -194,12 +320,60 @@ def evaluate():
             'timestamp': datetime.now().isoformat()
         }), 500
 
+@app.route('/api/evaluations/<job_id>', methods=['GET'])
+def evaluation_job(job_id):
+    """Return the status/result of a queued evaluation job"""
+    if not evaluation_queue:
+        return jsonify({'error': 'Evaluation queue unavailable'}), 503
+    job = evaluation_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Evaluation job not found'}), 404
+    return jsonify({
+        'id': job['id'],
+        'status': job['status'],
+        'attempts': job['attempts'],
+        'error': job['error'],
+        'evaluation': EvaluationModel.primary_report(job['result']),
+        'evaluations': job['result'],
+        'created_at': datetime.fromtimestamp(job['created_at']).isoformat(),
+        'updated_at': datetime.fromtimestamp(job['updated_at']).isoformat()
+    })
+
+@app.route('/api/cache/invalidate', methods=['POST'])
+def invalidate_cache():
+    """Drop cached answers after a system prompt change or index rebuild"""
+    if not _is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    if not rag_assistant:
+        return jsonify({'error': 'RAG assistant not available'}), 500
+    data = request.get_json(silent=True) or {}
+    removed = rag_assistant.invalidate_response_cache(
+        deployment=data.get('deployment'),
+        search_index=data.get('search_index'),
+    )
+    return jsonify({'status': 'success', 'invalidated': removed})
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Per-stage latency, error and token counters in Prometheus text format"""
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/health', methods=['GET'])
 def health():
     """Health check endpoint"""
+    cache = getattr(rag_assistant, 'embedding_cache', None)
+    response_cache = getattr(rag_assistant, 'response_cache', None)
+    diversifier = getattr(rag_assistant, 'diversifier', None)
+    compressor = getattr(rag_assistant, 'compressor', None)
     return jsonify({
         'status': 'healthy',
         'rag_assistant': 'available' if rag_assistant else 'unavailable',
+        'embedding_cache': cache.stats() if cache else None,
+        'response_cache': response_cache.stats() if response_cache else None,
+        'context_dedup': diversifier.stats() if diversifier else None,
+        'context_compression': compressor.stats() if compressor else None,
+        'evaluation_jobs': evaluation_queue.stats() if evaluation_queue else None,
+        'cassette': cassette_store().stats() if cassette_store() else None,
         'timestamp': datetime.now().isoformat()
     })
 
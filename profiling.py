@@ -0,0 +1,220 @@
+"""
+Opt-in CPU and memory profiling of individual requests.
+
+With PROFILING_ENABLED=true, main.py profiles a request when it carries
+``X-Profile: sample|cpu`` together with a valid ``X-Admin-Token``, or when
+it falls in the sample rate set through ``/api/admin/profiling``. Modes:
+
+    sample  a background thread samples the request thread's stack every
+            PROFILE_INTERVAL_MS and writes Brendan Gregg collapsed stacks
+            (<id>.collapsed) for flamegraph.pl / speedscope
+    cpu     deterministic cProfile; writes <id>.prof and a cumulative-time
+            report (<id>.pstats.txt)
+
+Either mode can add tracemalloc, writing the top allocation sites grown
+during the request (<id>.alloc.txt). tracemalloc is process-wide, so only
+one request is profiled at a time; others run unprofiled. Reports go to
+PROFILE_DIR, which is pruned to the newest PROFILE_MAX_FILES files. With
+profiling disabled no hooks are registered at all.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import (
+    PROFILE_DIR,
+    PROFILE_MAX_FILES,
+    PROFILE_SAMPLE_RATE,
+    PROFILE_MODE,
+    PROFILE_INTERVAL_MS,
+    PROFILE_MEMORY,
+)
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("sample", "cpu")
+ALLOC_TOP = 30
+PSTATS_TOP = 40
+_UNSAFE_FILENAME = re.compile(r"[^A-Za-z0-9._-]")
+
+
+class StackSampler:
+    """Samples one thread's stack on an interval; counts collapsed stacks."""
+
+    def __init__(self, thread_id: int, interval: float) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RequestProfiler:
+    """Profiles the calling thread between start() and stop()."""
+
+    def __init__(self, mode: str, memory: bool, interval_ms: float = PROFILE_INTERVAL_MS) -> None:
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"mode must be one of {PROFILE_MODES}, got {mode!r}")
+        self.mode = mode
+        self.memory = memory
+        self.interval = interval_ms / 1000
+        self._profile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[StackSampler] = None
+        self._baseline = None
+        self._started = 0.0
+
+    def start(self) -> None:
+        if self.memory:
+            tracemalloc.start(10)
+            self._baseline = tracemalloc.take_snapshot()
+        if self.mode == "cpu":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = StackSampler(threading.get_ident(), self.interval)
+            self._sampler.start()
+        self._started = time.perf_counter()
+
+    def stop(self, report_id: str, out_dir: str = PROFILE_DIR) -> List[str]:
+        """Stop profiling and write this request's reports; returns their paths."""
+        elapsed_ms = (time.perf_counter() - self._started) * 1000
+        reports: Dict[str, str] = {}
+        if self._profile is not None:
+            self._profile.disable()
+        if self._sampler is not None:
+            self._sampler.stop()
+            reports[".collapsed"] = self._sampler.collapsed()
+        snapshot = None
+        if self.memory:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+
+        os.makedirs(out_dir, exist_ok=True)
+        base = os.path.join(out_dir, report_id)
+        if self._profile is not None:
+            self._profile.dump_stats(base + ".prof")
+            out = io.StringIO()
+            pstats.Stats(self._profile, stream=out).sort_stats("cumulative").print_stats(PSTATS_TOP)
+            reports[".pstats.txt"] = out.getvalue()
+        if snapshot is not None:
+            reports[".alloc.txt"] = _allocation_top(snapshot, self._baseline, elapsed_ms)
+        paths = [base + ".prof"] if self._profile is not None else []
+        for suffix, text in reports.items():
+            with open(base + suffix, "w", encoding="utf-8") as fh:
+                fh.write(text)
+            paths.append(base + suffix)
+        prune(out_dir)
+        return paths
+
+
+def _allocation_top(snapshot, baseline, elapsed_ms: float) -> str:
+    stats = snapshot.compare_to(baseline, "lineno") if baseline is not None else snapshot.statistics("lineno")
+    lines = [f"# top {ALLOC_TOP} allocation sites by growth over {elapsed_ms:.1f} ms"]
+    lines.extend(str(stat) for stat in stats[:ALLOC_TOP])
+    return "\n".join(lines) + "\n"
+
+
+def prune(out_dir: str = PROFILE_DIR, max_files: int = PROFILE_MAX_FILES) -> None:
+    """Keep only the newest ``max_files`` reports."""
+    try:
+        entries = sorted(os.scandir(out_dir), key=lambda e: e.stat().st_mtime, reverse=True)
+    except FileNotFoundError:
+        return
+    for entry in entries[max_files:]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+class ProfilingController:
+    """Decides which requests are profiled; at most one at a time."""
+
+    def __init__(
+        self, sample_rate: float = PROFILE_SAMPLE_RATE, mode: str = PROFILE_MODE,
+        memory: bool = PROFILE_MEMORY, out_dir: str = PROFILE_DIR,
+    ) -> None:
+        self.sample_rate = sample_rate
+        self.mode = mode
+        self.memory = memory
+        self.out_dir = out_dir
+        self._busy = threading.Lock()
+
+    def configure(self, sample_rate: float = None, mode: str = None, memory: bool = None) -> Dict:
+        if mode is not None and mode not in PROFILE_MODES:
+            raise ValueError(f"mode must be one of {PROFILE_MODES}")
+        if sample_rate is not None:
+            self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+        if mode is not None:
+            self.mode = mode
+        if memory is not None:
+            self.memory = bool(memory)
+        return self.settings()
+
+    def settings(self) -> Dict:
+        return {"sample_rate": self.sample_rate, "mode": self.mode, "memory": self.memory}
+
+    def begin(self, requested_mode: Optional[str] = None) -> Optional[RequestProfiler]:
+        """A started profiler if this request should be profiled, else None."""
+        if requested_mode is None and (self.sample_rate <= 0 or random.random() >= self.sample_rate):
+            return None
+        mode = requested_mode if requested_mode in PROFILE_MODES else self.mode
+        if not self._busy.acquire(blocking=False):
+            return None
+        try:
+            profiler = RequestProfiler(mode, self.memory)
+            profiler.start()
+            return profiler
+        except Exception:
+            self._busy.release()
+            raise
+
+    def end(self, profiler: RequestProfiler, request_id: str) -> List[str]:
+        try:
+            # Request ids can come from callers (headers, batch files); never let one pick the path
+            safe_id = _UNSAFE_FILENAME.sub("_", request_id)[:64] or "request"
+            report_id = f"{datetime.now():%Y%m%dT%H%M%S}-{safe_id}-{profiler.mode}"
+            paths = profiler.stop(report_id, self.out_dir)
+            logger.info("Wrote profile reports: %s", ", ".join(paths))
+            return paths
+        finally:
+            self._busy.release()
+
+    def reports(self, limit: int = 20) -> List[str]:
+        try:
+            entries = sorted(os.scandir(self.out_dir), key=lambda e: e.stat().st_mtime, reverse=True)
+        except FileNotFoundError:
+            return []
+        return [e.name for e in entries[:limit]]
@@ -4,15 +4,27 @@ Flask-compatible version of the RAG assistant without Streamlit dependencies
 import logging
 from typing import List, Dict, Tuple, Optional, Any, Generator, Union
 import traceback
-from openai import AzureOpenAI
-from azure.search.documents import SearchClient
-from azure.search.documents.models import VectorizedQuery
-from azure.core.credentials import AzureKeyCredential
-import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
 import sys
 import os
+import time
 import json as _json
-from evaluation_model import EvaluationModel
+from evaluation_model import EvaluationModel, build_case_file, normalize_evaluation_mode
+from embedding_cache import EmbeddingCache, approx_tokens, normalize_text
+import similarity
+from context_packing import pack_context, budget_for, counter_for
+from diversify import ContextDiversifier
+from citations import renumber_citations, StreamingCitationTracker
+from streaming import close_upstream
+from metrics import observe, record_usage
+from tracing import span, current_span, usage_attributes
+from structured_logging import log_payload, set_request_id, get_request_id
+from compression import ExtractiveCompressor
+from semantic_cache import SemanticResponseCache, prompt_hash
+from client_registry import get_openai_client, get_deployment_client
+from retrievers import Retriever, AzureSearchRetriever, HybridRetriever
 
 # Import config but handle the case where it might import streamlit
 try:
@@ -27,6 +39,19 @@ try:
         SEARCH_INDEX,
         SEARCH_KEY,
         VECTOR_FIELD,
+        EMBEDDING_CACHE_ENABLED,
+        EMBEDDING_BATCH_SIZE,
+        EMBEDDING_BATCH_MAX_TOKENS,
+        EMBEDDING_MAX_INPUT_TOKENS,
+        EMBEDDING_BATCH_CONCURRENCY,
+        SEMANTIC_CACHE_ENABLED,
+        RETRIEVER_BACKEND,
+        LOCAL_INDEX_PATH,
+        LEXICAL_FUSION,
+        RRF_VECTOR_WEIGHT,
+        RRF_LEXICAL_WEIGHT,
+        CONTEXT_DEDUP_ENABLED,
+        CONTEXT_COMPRESSION_ENABLED,
     )
 except ImportError as e:
     if 'streamlit' in str(e):
@@ -40,14 +65,83 @@ except ImportError as e:
         SEARCH_INDEX = os.environ.get("SEARCH_INDEX")
         SEARCH_KEY = os.environ.get("SEARCH_KEY")
         VECTOR_FIELD = os.environ.get("VECTOR_FIELD")
+        EMBEDDING_CACHE_ENABLED = os.environ.get("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+        EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "16"))
+        EMBEDDING_BATCH_MAX_TOKENS = int(os.environ.get("EMBEDDING_BATCH_MAX_TOKENS", "32000"))
+        EMBEDDING_MAX_INPUT_TOKENS = int(os.environ.get("EMBEDDING_MAX_INPUT_TOKENS", "8191"))
+        EMBEDDING_BATCH_CONCURRENCY = int(os.environ.get("EMBEDDING_BATCH_CONCURRENCY", "4"))
+        SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+        RETRIEVER_BACKEND = os.environ.get("RETRIEVER_BACKEND", "azure")
+        LOCAL_INDEX_PATH = os.environ.get("LOCAL_INDEX_PATH", "data/local_index")
+        LEXICAL_FUSION = os.environ.get("LEXICAL_FUSION", "false").lower() == "true"
+        RRF_VECTOR_WEIGHT = float(os.environ.get("RRF_VECTOR_WEIGHT", "1.0"))
+        RRF_LEXICAL_WEIGHT = float(os.environ.get("RRF_LEXICAL_WEIGHT", "1.0"))
+        CONTEXT_DEDUP_ENABLED = os.environ.get("CONTEXT_DEDUP_ENABLED", "true").lower() == "true"
+        CONTEXT_COMPRESSION_ENABLED = os.environ.get("CONTEXT_COMPRESSION_ENABLED", "false").lower() == "true"
     else:
         raise
 
 logger = logging.getLogger(__name__)
 
 
-class FlaskRAGAssistant:
-    """Retrieval-Augmented Generation assistant for Azure OpenAI + Search."""
+def _pack_embedding_batches(
+    items: List[Tuple[str, List[int]]], max_items: int, max_tokens: int
+) -> List[List[Tuple[str, List[int]]]]:
+    """Greedily pack (text, indices) items into batches under both limits."""
+    batches, current, current_tokens = [], [], 0
+    for item in items:
+        tokens = approx_tokens(item[0])
+        if current and (len(current) >= max_items or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(item)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+@dataclass(frozen=True)
+class GenerationSettings:
+    """
+    Immutable per-request generation parameters.
+
+    Passed explicitly through the request path so concurrent requests served
+    by one FlaskRAGAssistant never see each other's parameters.
+    """
+    deployment: Optional[str] = None
+    temperature: float = 0.3
+    top_p: float = 1.0
+    max_tokens: int = 1000
+    presence_penalty: float = 0.6
+    frequency_penalty: float = 0.6
+    search_index: Optional[str] = None
+    custom_prompt: str = ""
+    system_prompt: str = ""
+    system_prompt_mode: str = "Append"
+    # UI sampling knob; recorded in evaluation casefiles, not sent to Azure
+    top_k: Optional[int] = None
+    # System prompt the caller reports (API "system_prompt"); recorded in casefiles, not sent to Azure
+    casefile_system_prompt: Optional[str] = None
+
+    def with_overrides(self, **overrides) -> "GenerationSettings":
+        """Return a copy with every non-None override applied."""
+        changes = {k: v for k, v in overrides.items() if v is not None}
+        return replace(self, **changes) if changes else self
+
+
+class RAGAssistantBase:
+    """
+    Configuration and helpers shared by FlaskRAGAssistant and AsyncRAGAssistant.
+
+    Nothing here is overridden with a coroutine: these methods build
+    prompts, parameters, evaluation requests and cache keys without touching
+    the network, plus the two blocking entry points that both assistants run
+    on worker threads (generate_embeddings for the context stages and
+    run_evaluation_request for queued evaluation jobs). The request path
+    itself (embedding, search, chat, evaluation) is defined by each
+    subclass, as plain methods or as coroutines.
+    """
 
     # Default system prompt
     DEFAULT_SYSTEM_PROMPT = """
@@ -91,12 +185,35 @@ class FlaskRAGAssistant:
     # ───────────────────────── setup ─────────────────────────
     def __init__(self, settings=None) -> None:
         self._init_cfg()
-        self.openai_client = AzureOpenAI(
-            azure_endpoint=self.openai_endpoint,
-            api_key=self.openai_key,
-            api_version=self.openai_api_version or "2023-05-15",
+        self.openai_client = get_openai_client(
+            self.openai_endpoint, self.openai_key, self.openai_api_version
         )
         self.eval_model = EvaluationModel(model=self.deployment_name)
+        self._eval_models = {self.deployment_name: self.eval_model}
+        self._eval_models_lock = threading.Lock()
+        # Optional EvaluationJobQueue used when a request asks for async evaluation
+        self.evaluation_queue = None
+        self.embedding_cache = EmbeddingCache() if EMBEDDING_CACHE_ENABLED else None
+        self.response_cache = SemanticResponseCache() if SEMANTIC_CACHE_ENABLED else None
+        # Backend override for search_knowledge_base; None means Azure Search
+        self.retriever: Optional[Retriever] = None
+        if RETRIEVER_BACKEND == "local":
+            from local_index import LocalVectorIndex
+            self.retriever = LocalVectorIndex()
+        # Optional BM25 index fused with the vector retriever by reciprocal rank
+        self.lexical_index: Optional[Retriever] = None
+        if LEXICAL_FUSION:
+            from bm25 import BM25Index
+            records = getattr(self.retriever, "records", None)
+            self.lexical_index = BM25Index.load(LOCAL_INDEX_PATH, records)
+        self.diversifier = (
+            ContextDiversifier(embed=lambda texts: self.generate_embeddings(texts)[0])
+            if CONTEXT_DEDUP_ENABLED else None
+        )
+        self.compressor = (
+            ExtractiveCompressor(embed=lambda texts: self.generate_embeddings(texts)[0])
+            if CONTEXT_COMPRESSION_ENABLED else None
+        )
         
         # Model parameters with defaults
         self.temperature = 0.3
@@ -119,9 +236,9 @@ class FlaskRAGAssistant:
         self.search_index         = SEARCH_INDEX
         self.search_key           = SEARCH_KEY
         self.vector_field         = VECTOR_FIELD
-        
+
     def _load_settings(self) -> None:
-        """Load settings from provided settings dict"""
+        """Load settings from provided settings dict (construction time only)"""
         settings = self.settings
         
         # Update model parameters
@@ -138,313 +255,637 @@ class FlaskRAGAssistant:
         if "search_index" in settings:
             self.search_index = settings["search_index"]
 
-    # ───────────── embeddings ─────────────
-    def generate_embedding(self, text: str) -> Optional[List[float]]:
-        if not text:
-            return None
+    def default_settings(self) -> GenerationSettings:
+        """Snapshot of the assistant-level defaults as GenerationSettings."""
+        return GenerationSettings(
+            deployment=self.deployment_name,
+            temperature=self.temperature,
+            top_p=self.top_p,
+            max_tokens=self.max_tokens,
+            presence_penalty=self.presence_penalty,
+            frequency_penalty=self.frequency_penalty,
+            search_index=self.search_index,
+            custom_prompt=self.settings.get("custom_prompt", ""),
+            system_prompt=self.settings.get("system_prompt", ""),
+            system_prompt_mode=self.settings.get("system_prompt_mode", "Append"),
+        )
+
+    @property
+    def system_prompt(self):
+        return self.DEFAULT_SYSTEM_PROMPT
+
+    # ───────────── batch embeddings (blocking) ─────────────
+    def generate_embeddings(
+        self, texts: List[str], concurrency: int = None
+    ) -> Tuple[List[Optional[List[float]]], Dict[int, str]]:
+        """
+        Embed many texts using batched embeddings requests.
+
+        Inputs are de-duplicated, served from the embedding cache where
+        possible, packed under the per-request item and token limits and sent
+        concurrently. Returns the embeddings in input order (None for failed
+        items) and a mapping of input index -> error message.
+        """
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        errors: Dict[int, str] = {}
+        pending: Dict[str, List[int]] = {}
+        cache = self.embedding_cache
+
+        for idx, text in enumerate(texts):
+            if not text or not text.strip():
+                errors[idx] = "empty input"
+                continue
+            if approx_tokens(text) > EMBEDDING_MAX_INPUT_TOKENS:
+                errors[idx] = f"input exceeds {EMBEDDING_MAX_INPUT_TOKENS} tokens"
+                continue
+            if cache is not None:
+                cached = cache.get(self.embedding_deployment, text)
+                if cached is not None:
+                    results[idx] = cached
+                    continue
+            pending.setdefault(normalize_text(text), []).append(idx)
+
+        batches = _pack_embedding_batches(
+            list(pending.items()), EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_MAX_TOKENS
+        )
+        if not batches:
+            return results, errors
+
+        workers = max(1, min(concurrency or EMBEDDING_BATCH_CONCURRENCY, len(batches)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for batch, (vectors, batch_errors) in zip(batches, pool.map(self._embed_batch, batches)):
+                for (text, indices), vector, error in zip(batch, vectors, batch_errors):
+                    for idx in indices:
+                        if vector is not None:
+                            results[idx] = vector
+                        else:
+                            errors[idx] = error or "embedding failed"
+        return results, errors
+
+    def _embed_batch(
+        self, batch: List[Tuple[str, List[int]]]
+    ) -> Tuple[List[Optional[List[float]]], List[Optional[str]]]:
+        inputs = [text for text, _ in batch]
         try:
-            resp = self.openai_client.embeddings.create(
-                model=self.embedding_deployment,
-                input=text.strip(),
-            )
-            return resp.data[0].embedding
+            started = time.perf_counter()
+            with observe("embedding_batch", self.embedding_deployment):
+                resp = self.openai_client.embeddings.create(
+                    model=self.embedding_deployment,
+                    input=inputs,
+                )
+            elapsed = time.perf_counter() - started
         except Exception as exc:
-            logger.error("Embedding error: %s", exc)
-            return None
+            if len(inputs) == 1:
+                logger.error("Embedding error: %s", exc)
+                return [None], [str(exc)]
+            # Retry items one by one so a single bad input does not sink the batch
+            logger.warning("Embedding batch of %d failed (%s); retrying per item", len(inputs), exc)
+            vectors, errs = [], []
+            for item in batch:
+                v, e = self._embed_batch([item])
+                vectors.extend(v)
+                errs.extend(e)
+            return vectors, errs
+
+        vectors: List[Optional[List[float]]] = [None] * len(inputs)
+        for item in resp.data:
+            vectors[item.index] = item.embedding
+        cache = self.embedding_cache
+        if cache is not None:
+            cache.record_miss_latency(elapsed / len(inputs))
+            for text, vector in zip(inputs, vectors):
+                if vector is not None:
+                    cache.put(self.embedding_deployment, text, vector)
+        return vectors, [None if v is not None else "missing from response" for v in vectors]
 
     @staticmethod
     def cosine_similarity(a: List[float], b: List[float]) -> float:
-        dot = sum(x * y for x, y in zip(a, b))
-        mag = (sum(x * x for x in a) ** 0.5) * (sum(y * y for y in b) ** 0.5)
-        return 0.0 if mag == 0 else dot / mag
+        # Kept for callers of the old API; batch work should use similarity.cosine / top_k
+        return similarity.cosine_pair(a, b)
 
-    # ───────────── Azure Search ───────────
-    def search_knowledge_base(self, query: str) -> List[Dict]:
-        try:
-            client = SearchClient(
-                endpoint=f"https://{self.search_endpoint}.search.windows.net",
-                index_name=self.search_index,
-                credential=AzureKeyCredential(self.search_key),
+    # ───────────── retrieval ───────────
+    def _retriever(self, search_index: str) -> Retriever:
+        retriever = self.retriever or AzureSearchRetriever(
+            self.search_endpoint, search_index, self.search_key, self.vector_field
+        )
+        if self.lexical_index is not None:
+            retriever = HybridRetriever(
+                [retriever, self.lexical_index],
+                weights=[RRF_VECTOR_WEIGHT, RRF_LEXICAL_WEIGHT],
             )
-            q_vec = self.generate_embedding(query)
-            if not q_vec:
-                return []
+        return retriever
 
-            vec_q = VectorizedQuery(
-                vector=q_vec,
-                k_nearest_neighbors=10,
-                fields=self.vector_field,
-            )
-            results = client.search(
-                search_text=query,
-                vector_queries=[vec_q],
-                select=["chunk", "title"],
-                top=10,
-            )
-            return [
-                {
-                    "chunk": r.get("chunk", ""),
-                    "title": r.get("title", "Untitled"),
-                    "relevance": 1.0,
-                }
-                for r in results
-            ]
-        except Exception as exc:
-            logger.error("Search error: %s", exc)
-            return []
-        
     # ───────── context & citations ────────
-    def _prepare_context(self, results: List[Dict]) -> Tuple[str, Dict]:
-        entries, src_map = [], {}
-        sid = 1
-        for res in results[:5]:
-            chunk = res["chunk"].strip()
-            if not chunk:
-                continue
-            entries.append(f'<source id="{sid}">{chunk}</source>')
-            src_map[str(sid)] = {"title": res["title"], "content": chunk}
-            sid += 1
-        return "\n\n".join(entries), src_map
+    def _prepare_context(
+        self, results: List[Dict], settings: GenerationSettings = None, query: str = ""
+    ) -> Tuple[str, Dict]:
+        """
+        Drop near-duplicate hits, order the rest by MMR (see diversify),
+        keep the query-relevant sentences of each (see compression) and
+        pack them into the deployment's context token budget (see
+        context_packing); each source records the tokens it used.
+        """
+        with span("context_build", chunks=len(results)) as sp:
+            deployment = settings.deployment if settings else self.deployment_name
+            counter = counter_for(deployment)
+            ranked = sorted(results, key=lambda r: r.get("relevance", 0.0), reverse=True)
+            if self.diversifier is not None:
+                ranked, dedup = self.diversifier.apply(ranked, query, counter.count)
+                sp.set(duplicates_dropped=dedup["duplicates_dropped"])
+                if dedup["duplicates_dropped"]:
+                    logger.info(
+                        "Dropped %d near-duplicate chunks (~%d tokens saved)",
+                        dedup["duplicates_dropped"], dedup["tokens_saved"],
+                    )
+            if self.compressor is not None:
+                ranked, compression = self.compressor.compress(query, ranked, counter.count)
+                sp.set(compression_tokens_saved=compression["tokens_saved"])
+                logger.info(
+                    "Compressed context %d -> %d tokens in %.1f ms",
+                    compression["tokens_before"], compression["tokens_after"], compression["elapsed_ms"],
+                )
+            context, src_map, report = pack_context(ranked, budget_for(deployment), counter)
+            logger.info(
+                "Context packed: %d sources, %d/%d tokens, %d dropped (%s)",
+                report["sources"], report["context_tokens"], report["budget"],
+                report["dropped"], report["encoding"],
+            )
+            sp.set(sources=report["sources"], context_tokens=report["context_tokens"], budget=report["budget"])
+        return context, src_map
+
+    def _effective_system_prompt(self, settings: GenerationSettings) -> str:
+        if settings.system_prompt:
+            if settings.system_prompt_mode == "Override":
+                return settings.system_prompt
+            return f"{settings.system_prompt}\n\n{self.DEFAULT_SYSTEM_PROMPT}"
+        return self.DEFAULT_SYSTEM_PROMPT
 
-    def _chat_answer(self, query: str, context: str, src_map: Dict, appended_prompt: str = None) -> str:
-        system_prompt = self.DEFAULT_SYSTEM_PROMPT
-        
-        settings = self.settings
-        custom_prompt = settings.get("custom_prompt", "")
-        system_override = settings.get("system_prompt", "")
-        mode = settings.get("system_prompt_mode", "Append")
+    def _build_messages(
+        self, query: str, context: str, settings: GenerationSettings, appended_prompt: str = None
+    ) -> List[Dict[str, str]]:
+        system_prompt = self._effective_system_prompt(settings)
 
-        if custom_prompt:
-            query = f"{custom_prompt}\n\n{query}"
+        if settings.custom_prompt:
+            query = f"{settings.custom_prompt}\n\n{query}"
             logger.info("DEBUG - Applied custom prompt to query.")
-        
-        if system_override:
-            if mode == "Override":
-                system_prompt = system_override
-            else:
-                system_prompt = f"{system_override}\n\n{self.DEFAULT_SYSTEM_PROMPT}"
 
         if appended_prompt:
             system_prompt += f"\n{appended_prompt}"
 
         processed_system = system_prompt.strip()
         processed_user = f"<context>\n{context}\n</context>\n<user_query>\n{query}\n</user_query>"
-        messages = [
+        return [
             {"role": "system", "content": processed_system},
             {"role": "user", "content": processed_user}
         ]
 
-        from config import MODEL_DEPLOYMENTS, MODEL_ENDPOINTS, MODEL_KEYS, MODEL_API_VERSIONS
-        endpoint = self.openai_endpoint
-        api_key = self.openai_key
-        api_version = self.openai_api_version
-        deployment_name = self.deployment_name
-        if deployment_name in MODEL_ENDPOINTS and MODEL_ENDPOINTS[deployment_name]:
-            endpoint = MODEL_ENDPOINTS[deployment_name]
-        if deployment_name in MODEL_KEYS and MODEL_KEYS[deployment_name]:
-            api_key = MODEL_KEYS[deployment_name]
-        if deployment_name in MODEL_API_VERSIONS and MODEL_API_VERSIONS[deployment_name]:
-            api_version = MODEL_API_VERSIONS[deployment_name]
-        if deployment_name in MODEL_DEPLOYMENTS and MODEL_DEPLOYMENTS[deployment_name]:
-            deployment_name = MODEL_DEPLOYMENTS[deployment_name]
-        
-        logger.info("========== OPENAI API REQUEST ==========")
-        logger.info(f"deployment: {deployment_name}, temp: {self.temperature}, tokens: {self.max_tokens}, top_p: {self.top_p}, presence_penalty: {self.presence_penalty}, frequency_penalty: {self.frequency_penalty}")
-
-        logger.info("========== SYSTEM PROMPT ==========")
-        logger.info(processed_system)
-
-        logger.info("========== USER CONTENT ==========")
-        logger.info(processed_user)
-
-        logger.info("========== MESSAGES ARRAY ==========")
-        for i, message in enumerate(messages, 1):
-            logger.info(f"Message {i} - Role: {message['role']}")
-            logger.info(f"Content: {message['content']}")
-
-        payload = {
-            "model": deployment_name,
-            "messages": messages,
-            "max_completion_tokens": self.max_tokens,
-            "temperature": self.temperature,
-            "top_p": self.top_p,
-            "presence_penalty": self.presence_penalty,
-            "frequency_penalty": self.frequency_penalty
-        }
-        logger.info("========== OPENAI RAW PAYLOAD ==========")
-        logger.info(_json.dumps(payload, indent=2))
-
-        client = AzureOpenAI(
-            azure_endpoint=endpoint,
-            api_key=api_key,
-            api_version=api_version or "2023-05-15",
-        )
+    @staticmethod
+    def _completion_params(
+        deployment_name: str, messages: List[Dict[str, str]], settings: GenerationSettings
+    ) -> Dict[str, Any]:
         # Build API request parameters, omitting all optional parameters for o3 and o4-mini
         params = {
             "model": deployment_name,
             "messages": messages,
-            "max_completion_tokens": self.max_tokens
+            "max_completion_tokens": settings.max_tokens
         }
         # Only include optional parameters for standard models (exclude o3, o4-mini, gpt-4o)
         if deployment_name not in ("o3", "o4-mini", "gpt-4o"):
-            params["temperature"] = self.temperature
-            params["top_p"] = self.top_p
-            params["presence_penalty"] = self.presence_penalty
-            params["frequency_penalty"] = self.frequency_penalty
-        resp = client.chat.completions.create(**params)
+            params["temperature"] = settings.temperature
+            params["top_p"] = settings.top_p
+            params["presence_penalty"] = settings.presence_penalty
+            params["frequency_penalty"] = settings.frequency_penalty
+        return params
+
+    def _log_chat_request(
+        self, deployment_name: str, settings: GenerationSettings, messages: List[Dict[str, str]]
+    ) -> None:
+        log_payload(
+            logger, "chat_request",
+            deployment=deployment_name,
+            temperature=settings.temperature,
+            max_tokens=settings.max_tokens,
+            top_p=settings.top_p,
+            presence_penalty=settings.presence_penalty,
+            frequency_penalty=settings.frequency_penalty,
+            system_prompt=messages[0]["content"],
+            user_content=messages[1]["content"],
+        )
+
+    @staticmethod
+    def _record_chat_response(deployment_name: str, answer: str, usage) -> None:
+        record_usage(deployment_name, usage)
+        log_payload(
+            logger, "chat_response",
+            deployment=deployment_name,
+            answer=answer,
+            prompt_tokens=getattr(usage, "prompt_tokens", None),
+            completion_tokens=getattr(usage, "completion_tokens", None),
+        )
+
+    def _renumber_citations(self, answer: str, src_map: Dict) -> Tuple[str, List[Dict]]:
+        """Keep only cited sources, renumber them 1..n and rewrite the answer."""
+        return renumber_citations(answer, src_map)
+
+    @staticmethod
+    def _log_response(query: str, answer: str, cited: List[Dict], context: str) -> None:
+        log_payload(
+            logger, "rag_response",
+            query=query,
+            answer=answer,
+            cited=[f"[{src['id']}] {src['title']}" for src in cited],
+            context=context,
+        )
+
+    @staticmethod
+    def _tracked(fed: Tuple[str, List[Dict]]) -> List[Union[str, Dict]]:
+        """Stream items for one StreamingCitationTracker result: new sources, then text."""
+        text, new_sources = fed
+        items: List[Union[str, Dict]] = [{"source": src} for src in new_sources]
+        if text:
+            items.append(text)
+        return items
+
+    # ───────────── evaluation ─────────────
+    def _evaluator(self, deployment: Optional[str]) -> EvaluationModel:
+        model = self._eval_models.get(deployment)
+        if model is None:
+            with self._eval_models_lock:
+                model = self._eval_models.get(deployment)
+                if model is None:
+                    model = EvaluationModel(model=deployment)
+                    self._eval_models[deployment] = model
+        return model
+
+    def _evaluation_request(
+        self, mode: str, query: str, answer: str, cited: List[Dict], context: str,
+        settings: GenerationSettings, appended_prompt: str = None
+    ) -> Dict[str, Any]:
+        """JSON-serializable description of one evaluation (sync or queued)."""
+        system_prompt = self._effective_system_prompt(settings)
+        casefile = None
+        if mode in ("casefile", "both"):
+            _, deployment_name = get_deployment_client(settings.deployment)
+            params = self._completion_params(deployment_name, [], settings)
+            casefile = build_case_file(
+                query=query,
+                answer=answer,
+                sources=cited,
+                model=settings.deployment,
+                system_prompt=settings.casefile_system_prompt or system_prompt,
+                appended_prompt=appended_prompt,
+                parameters={
+                    "temperature": params.get("temperature"),
+                    "top_k": settings.top_k,
+                    "top_p": params.get("top_p"),
+                    "max_tokens": settings.max_tokens,
+                },
+            )
+        return {
+            "mode": mode,
+            "deployment": settings.deployment,
+            "user_query": query,
+            "system_prompt": system_prompt,
+            "model_response": answer,
+            "sources": context,
+            "casefile": casefile,
+            "request_id": get_request_id(),
+        }
+
+    def run_evaluation_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Execute a request built by _evaluation_request (also used by job workers)."""
+        # Queued jobs run on worker threads; keep them under the originating request id
+        if request.get("request_id"):
+            set_request_id(request["request_id"])
+        self._log_evaluation_request(request)
+        return self._evaluator(request.get("deployment")).run(
+            request["mode"],
+            user_query=request["user_query"],
+            system_prompt=request["system_prompt"],
+            model_response=request["model_response"],
+            sources=request["sources"],
+            casefile=request.get("casefile"),
+        )
+
+    @staticmethod
+    def _log_evaluation_request(request: Dict[str, Any]) -> None:
+        log_payload(
+            logger, "evaluation_request",
+            mode=request["mode"],
+            deployment=request.get("deployment"),
+            user_query=request["user_query"],
+            system_prompt=request["system_prompt"],
+            model_response=request["model_response"],
+            sources=request["sources"],
+        )
+
+    # ───────────── semantic response cache ─────────────
+    def _response_cache_namespace(
+        self, settings: GenerationSettings, appended_prompt: str = None
+    ) -> Tuple[Optional[str], str, Optional[str]]:
+        """(deployment, prompt hash, index); anything else that shapes the answer goes in the hash."""
+        return (
+            settings.deployment,
+            prompt_hash(
+                self._effective_system_prompt(settings), settings.custom_prompt or "",
+                appended_prompt or "", settings.casefile_system_prompt or "",
+                settings.temperature, settings.top_p, settings.max_tokens, settings.top_k,
+                settings.presence_penalty, settings.frequency_penalty,
+            ),
+            settings.search_index or self.search_index,
+        )
+
+    def _lookup_response(self, namespace, q_vec: Optional[List[float]], query: str) -> Optional[Dict]:
+        hit = self.response_cache.get(namespace, q_vec)
+        current_span().set(semantic_cache_hit=hit is not None)
+        if hit is not None:
+            logger.info("Semantic cache hit (similarity=%.4f) for query: %s", hit["similarity"], query)
+        return hit
+
+    @staticmethod
+    def _cached_evaluation(hit: Dict, evaluation_mode: str = None) -> Optional[Dict[str, Any]]:
+        """The cached evaluation if it was produced in the requested mode."""
+        evaluation = hit.get("evaluation") or {}
+        if evaluation.get("mode") == normalize_evaluation_mode(evaluation_mode):
+            return evaluation
+        return None
+
+    def _store_response(
+        self, namespace, q_vec: Optional[List[float]], answer: str, cited: List[Dict],
+        context: str, evaluation: Dict[str, Any]
+    ) -> None:
+        self.response_cache.put(namespace, q_vec, {
+            "answer": answer, "sources": cited, "context": context, "evaluation": evaluation,
+        })
+
+    def invalidate_response_cache(self, deployment: str = None, search_index: str = None) -> int:
+        """Drop cached answers, e.g. after the system prompt changes or an index is rebuilt."""
+        if self.response_cache is None:
+            return 0
+        return self.response_cache.invalidate(deployment=deployment, search_index=search_index)
+
+
+class FlaskRAGAssistant(RAGAssistantBase):
+    """Retrieval-Augmented Generation assistant for Azure OpenAI + Search."""
+
+    # ───────────── embeddings ─────────────
+    def generate_embedding(self, text: str) -> Optional[List[float]]:
+        if not text:
+            return None
+        with span("embedding", deployment=self.embedding_deployment) as sp:
+            cache = self.embedding_cache
+            if cache is not None:
+                cached = cache.get(self.embedding_deployment, text)
+                if cached is not None:
+                    sp.set(cache_hit=True)
+                    return cached
+            sp.set(cache_hit=False)
+            try:
+                started = time.perf_counter()
+                with observe("embedding", self.embedding_deployment):
+                    resp = self.openai_client.embeddings.create(
+                        model=self.embedding_deployment,
+                        input=text.strip(),
+                    )
+                embedding = resp.data[0].embedding
+            except Exception as exc:
+                logger.error("Embedding error: %s", exc)
+                sp.set(error=str(exc))
+                return None
+            if cache is not None:
+                cache.record_miss_latency(time.perf_counter() - started)
+                cache.put(self.embedding_deployment, text, embedding)
+            return embedding
+
+    # ───────────── retrieval ───────────
+    def search_knowledge_base(
+        self, query: str, settings: GenerationSettings = None, q_vec: Optional[List[float]] = None
+    ) -> List[Dict]:
+        """Hits for ``query``; pass ``q_vec`` when the query is already embedded (e.g. for the response cache)."""
+        search_index = (settings.search_index if settings else None) or self.search_index
+        try:
+            retriever = self._retriever(search_index)
+            t0 = time.perf_counter()
+            q_vec = q_vec or self.generate_embedding(query)
+            if not q_vec:
+                return []
+            t1 = time.perf_counter()
+            with observe("search", search_index), span("search", backend=retriever.name, index=search_index) as sp:
+                hits = retriever.search(query, q_vec)
+                sp.set(hits=len(hits))
+            t2 = time.perf_counter()
+            logger.info(
+                "Search timings (ms): embedding=%.1f search=%.1f backend=%s index=%s",
+                (t1 - t0) * 1000, (t2 - t1) * 1000, retriever.name, search_index,
+            )
+            return hits
+        except Exception as exc:
+            logger.error("Search error: %s", exc)
+            return []
+
+    # ───────────── chat ─────────────
+    def _chat_answer(
+        self, query: str, context: str, src_map: Dict, appended_prompt: str = None,
+        settings: GenerationSettings = None
+    ) -> str:
+        settings = settings or self.default_settings()
+        messages = self._build_messages(query, context, settings, appended_prompt)
+        client, deployment_name = get_deployment_client(settings.deployment)
+        self._log_chat_request(deployment_name, settings, messages)
+        params = self._completion_params(deployment_name, messages, settings)
+        with observe("chat", deployment_name), span("chat", deployment=deployment_name) as sp:
+            resp = client.chat.completions.create(**params)
+            usage = getattr(resp, "usage", None)
+            sp.set(**usage_attributes(usage))
         answer = resp.choices[0].message.content
-        logger.info("DEBUG - OpenAI response content: %s", answer)
-        logger.info("========== OPENAI API RESPONSE ==========")
-        logger.info("Response content: %s", answer)
-        if hasattr(resp, "usage"):
-            logger.info("Token usage: prompt=%d, completion=%d", resp.usage.prompt_tokens, resp.usage.completion_tokens)
+        self._record_chat_response(deployment_name, answer, usage)
         return answer
 
-    def _filter_cited(self, answer: str, src_map: Dict) -> List[Dict]:
-        cited = []
-        for sid, sinfo in src_map.items():
-            if f"[{sid}]" in answer:
-                entry = {"id": sid, "title": sinfo["title"], "content": sinfo["content"]}
-                if "url" in sinfo:
-                    entry["url"] = sinfo["url"]
-                cited.append(entry)
-        return cited
+    # ───────────── evaluation ─────────────
+    def _evaluate(
+        self, mode: str, query: str, answer: str, cited: List[Dict], context: str,
+        settings: GenerationSettings, appended_prompt: str = None, evaluate_async: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Run the evaluators selected by ``mode`` once, in one place. With
+        ``evaluate_async`` the request is queued on ``self.evaluation_queue``
+        and only the job id is returned.
+        """
+        mode = normalize_evaluation_mode(mode)
+        if mode == "none":
+            return {"mode": mode}
+        request = self._evaluation_request(
+            mode, query, answer, cited, context, settings, appended_prompt
+        )
+        if evaluate_async and self.evaluation_queue is not None:
+            job_id = self.evaluation_queue.enqueue(request)
+            logger.info("Queued %s evaluation job %s", mode, job_id)
+            return {"mode": mode, "job_id": job_id, "status": "queued"}
+        return self.run_evaluation_request(request)
 
     # ─────────── public API ───────────────
-    @property
-    def system_prompt(self):
-        return self.DEFAULT_SYSTEM_PROMPT
-
     def query(
         self, query: str, deployment: str = None, temperature: float = None, 
-        top_p: float = None, max_tokens: int = None, appended_prompt: str = None
-    ) -> Tuple[str, List[Dict]]:
+        top_p: float = None, max_tokens: int = None, appended_prompt: str = None,
+        top_k: int = None, evaluation_mode: str = None, evaluation_async: bool = False,
+        casefile_system_prompt: str = None
+    ) -> Tuple[str, List[Dict], Dict[str, Any]]:
         """
         Query method called by app.py - wrapper around generate_rag_response
-        Returns just the answer and sources for simplicity
+        Returns the answer, cited sources and the evaluation result.
+
+        Per-call parameters are layered over the assistant defaults in a new
+        GenerationSettings; the shared assistant itself is never mutated.
         """
-        # Update settings if provided
-        if deployment:
-            self.deployment_name = deployment
-        if temperature is not None:
-            self.temperature = temperature
-        if top_p is not None:
-            self.top_p = top_p
-        if max_tokens is not None:
-            self.max_tokens = max_tokens
-            
-        # Call the main response generation method
-        answer, sources, _, _, _ = self.generate_rag_response(query, appended_prompt=appended_prompt)
-        return answer, sources
-        
+        settings = self.default_settings().with_overrides(
+            deployment=deployment or None,
+            temperature=temperature,
+            top_p=top_p,
+            max_tokens=max_tokens,
+            top_k=top_k,
+            casefile_system_prompt=casefile_system_prompt,
+        )
+        answer, sources, _, evaluation, _ = self.generate_rag_response(
+            query, appended_prompt=appended_prompt, settings=settings,
+            evaluation_mode=evaluation_mode, evaluation_async=evaluation_async,
+        )
+        return answer, sources, evaluation
+
     def generate_rag_response(
-        self, query: str, appended_prompt: str = None
+        self, query: str, appended_prompt: str = None, settings: GenerationSettings = None,
+        evaluation_mode: str = None, evaluation_async: bool = False
     ) -> Tuple[str, List[Dict], List[Dict], Dict[str, Any], str]:
-        self._load_settings()
-        kb_results = self.search_knowledge_base(query)
+        """
+        Retrieve, answer and evaluate. ``evaluation_mode`` selects which
+        evaluators run (none / inline / casefile / both; default from
+        EVALUATION_MODE) and their results come back as the fourth element.
+        With ``evaluation_async`` the fourth element carries a queued job id
+        instead (see evaluation_jobs). When the semantic response cache is
+        enabled, a close enough earlier query short-circuits retrieval and chat.
+        """
+        settings = settings or self.default_settings()
+        cache_ns = q_vec = None
+        if self.response_cache is not None:
+            cache_ns = self._response_cache_namespace(settings, appended_prompt)
+            q_vec = self.generate_embedding(query)
+            hit = self._lookup_response(cache_ns, q_vec, query)
+            if hit is not None:
+                evaluation = self._cached_evaluation(hit, evaluation_mode)
+                if evaluation is None:
+                    evaluation = self._evaluate(
+                        evaluation_mode, query, hit["answer"], hit["sources"], hit["context"],
+                        settings, appended_prompt, evaluate_async=evaluation_async,
+                    )
+                return hit["answer"], hit["sources"], [], evaluation, hit["context"]
+        kb_results = self.search_knowledge_base(query, settings=settings, q_vec=q_vec)
         if not kb_results:
-            ans = self._chat_answer(query, "", {}, appended_prompt=appended_prompt)
-            return ans, [], [], {}, ""
-        context, src_map = self._prepare_context(kb_results)
-        # Logging full context chunks before generating answer
-        for src_id, src_data in src_map.items():
-            logger.info(f"=== Source {src_id}: {src_data['title']} ===")
-            logger.info(src_data['content'])
-        ans = self._chat_answer(query, context, src_map, appended_prompt=appended_prompt)
-        raw = self._filter_cited(ans, src_map)
-        renum, cited = {}, []
-        for i, src in enumerate(raw, 1):
-            renum[src["id"]] = str(i)
-            entry = {"id": str(i), "title": src["title"], "content": src["content"]}
-            if "url" in src:
-                entry["url"] = src["url"]
-            cited.append(entry)
-        for old, new in renum.items():
-            ans = re.sub(rf"\[{old}\]", f"[{new}]", ans)
-        logger.info("EvaluationModel invoked with user_query=%s", query)
-        logger.info("EvaluationModel invoked with system_prompt=%s", self.DEFAULT_SYSTEM_PROMPT)
-        logger.info("EvaluationModel invoked with model_response=%s", ans)
-        logger.info("EvaluationModel invoked with sources/context=%s", context)
-        logger.info("EvaluationModel invoked with user_query=%s", query)
-        logger.info("EvaluationModel invoked with system_prompt=%s", self.DEFAULT_SYSTEM_PROMPT)
-        logger.info("EvaluationModel invoked with model_response=%s", ans)
-        logger.info("EvaluationModel invoked with sources/context=%s", context)
-        eval = self.eval_model.evaluate(
-            user_query=query,
-            system_prompt=self.DEFAULT_SYSTEM_PROMPT,
-            model_response=ans,
-            sources=context
+            ans = self._chat_answer(query, "", {}, appended_prompt=appended_prompt, settings=settings)
+            evaluation = self._evaluate(
+                evaluation_mode, query, ans, [], "", settings, appended_prompt,
+                evaluate_async=evaluation_async,
+            )
+            return ans, [], [], evaluation, ""
+        context, src_map = self._prepare_context(kb_results, settings, query)
+        ans = self._chat_answer(
+            query, context, src_map, appended_prompt=appended_prompt, settings=settings
         )
+        ans, cited = self._renumber_citations(ans, src_map)
+        evaluation = self._evaluate(
+            evaluation_mode, query, ans, cited, context, settings, appended_prompt,
+            evaluate_async=evaluation_async,
+        )
+        if cache_ns is not None:
+            self._store_response(cache_ns, q_vec, ans, cited, context, evaluation)
         
-        # ─── RESPONSE LOGGING ──────────────────────────────────────────────────────────────────
-        logger.info("=" * 80)
-        logger.info("Final Response and Sources")
-        logger.info("=" * 80)
-        logger.info(f"Query: {query}")
-        logger.info(f"Answer: {ans}")
-        logger.info(f"Cited Sources: {_json.dumps(cited, indent=2)}")
-        logger.info(f"Context Used: {context}")
-        logger.info("=" * 80)
-        
-        return ans, cited, [], eval, context
+        self._log_response(query, ans, cited, context)
+        return ans, cited, [], evaluation, context
 
-    def stream_rag_response(self, query: str) -> Generator[Union[str, Dict], None, None]:
+    def stream_rag_response(
+        self, query: str, appended_prompt: str = None, settings: GenerationSettings = None,
+        evaluation_mode: str = None, evaluation_async: bool = False
+    ) -> Generator[Union[str, Dict], None, None]:
+        """
+        Stream an answer. Yields answer text pieces (str) as they arrive,
+        with citations already renumbered; {"source": {...}} precedes the
+        piece that first cites it. Then {"sources": [...], "answer": <answer>}
+        and finally {"evaluation": {...}}. Errors are reported as {"error": "..."}.
+        """
+        settings = settings or self.default_settings()
         try:
             logger.info("========== START STREAM ==========")
-            kb_results = self.search_knowledge_base(query)
+            cache_ns = q_vec = None
+            if self.response_cache is not None:
+                cache_ns = self._response_cache_namespace(settings, appended_prompt)
+                q_vec = self.generate_embedding(query)
+                hit = self._lookup_response(cache_ns, q_vec, query)
+                if hit is not None:
+                    yield hit["answer"]
+                    yield {"sources": hit["sources"], "answer": hit["answer"]}
+                    evaluation = self._cached_evaluation(hit, evaluation_mode)
+                    if evaluation is None:
+                        evaluation = self._evaluate(
+                            evaluation_mode, query, hit["answer"], hit["sources"], hit["context"],
+                            settings, appended_prompt, evaluate_async=evaluation_async,
+                        )
+                    yield {"evaluation": evaluation}
+                    return
+            kb_results = self.search_knowledge_base(query, settings=settings, q_vec=q_vec)
             if not kb_results:
-                yield "No relevant information found in the knowledge base."
-                yield {"sources": [], "evaluation": {}}
+                # Same answer and evaluation as generate_rag_response without context
+                ans = self._chat_answer(query, "", {}, appended_prompt=appended_prompt, settings=settings)
+                yield ans
+                yield {"sources": [], "answer": ans}
+                yield {"evaluation": self._evaluate(
+                    evaluation_mode, query, ans, [], "", settings, appended_prompt,
+                    evaluate_async=evaluation_async,
+                )}
                 return
-            context, src_map = self._prepare_context(kb_results)
-            # Logging full context chunks before constructing stream messages
-            for src_id, src_data in src_map.items():
-                logger.info(f"=== Source {src_id}: {src_data['title']} ===")
-                logger.info(src_data['content'])
-            processed_system = self.DEFAULT_SYSTEM_PROMPT.strip()
-            processed_user = f"<context>\n{context}\n</context>\n<user_query>\n{query}\n</user_query>"
-            messages = [
-                {"role": "system", "content": processed_system},
-                {"role": "user", "content": processed_user}
-            ]
-            stream = self.openai_client.chat.completions.create(
-                model=self.deployment_name,
-                messages=messages,
-                max_completion_tokens=self.max_tokens,
-                temperature=self.temperature,
-                top_p=self.top_p,
-                presence_penalty=self.presence_penalty,
-                frequency_penalty=self.frequency_penalty,
-                stream=True
-            )
-            collected = ""
-            for chunk in stream:
-                if chunk.choices and chunk.choices[0].delta.content:
-                    piece = chunk.choices[0].delta.content
-                    collected += piece
-                    yield piece
-            raw = self._filter_cited(collected, src_map)
-            renum, cited = {}, []
-            for i, src in enumerate(raw, 1):
-                renum[src["id"]] = str(i)
-                entry = {"id": str(i), "title": src["title"], "content": src["content"]}
-                if "url" in src: entry["url"] = src["url"]
-                cited.append(entry)
-            for old, new in renum.items():
-                collected = re.sub(rf"\[{old}\]", f"[{new}]", collected)
-            logger.info("EvaluationModel invoked with user_query=%s", query)
-            logger.info("EvaluationModel invoked with system_prompt=%s", self.DEFAULT_SYSTEM_PROMPT)
-            logger.info("EvaluationModel invoked with model_response=%s", collected)
-            logger.info("EvaluationModel invoked with sources/context=%s", context)
-            eval = self.eval_model.evaluate(
-                user_query=query,
-                system_prompt=self.DEFAULT_SYSTEM_PROMPT,
-                model_response=collected,
-                sources=context
+            context, src_map = self._prepare_context(kb_results, settings, query)
+            messages = self._build_messages(query, context, settings, appended_prompt)
+            client, deployment_name = get_deployment_client(settings.deployment)
+            params = self._completion_params(deployment_name, messages, settings)
+            # Not entered: the generator yields inside it, so it must not become the current span
+            stream_span = span("chat_stream", deployment=deployment_name)
+            tracker = StreamingCitationTracker(src_map)
+            usage = None
+            # The chat stage lasts until the stream is drained (or abandoned)
+            with observe("chat", deployment_name):
+                try:
+                    # The last chunk then carries token usage, with no choices
+                    stream = client.chat.completions.create(
+                        stream=True, stream_options={"include_usage": True}, **params
+                    )
+                except Exception as exc:
+                    stream_span.fail(exc).finish()
+                    raise
+                try:
+                    for chunk in stream:
+                        usage = getattr(chunk, "usage", None) or usage
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            yield from self._tracked(tracker.feed(chunk.choices[0].delta.content))
+                except GeneratorExit:
+                    logger.info("Stream consumer went away after %d chars; closing upstream", len(tracker.answer))
+                    raise
+                finally:
+                    # Closing the HTTP response stops the deployment generating unread tokens
+                    close_upstream(stream)
+                    stream_span.set(
+                        chars=len(tracker.answer), cited=len(tracker.cited), **usage_attributes(usage)
+                    ).finish()
+            record_usage(deployment_name, usage)
+            yield from self._tracked(tracker.flush())
+            collected, cited = tracker.answer, tracker.cited
+            self._log_response(query, collected, cited, context)
+            # Sources go out before evaluation so the UI can render them immediately
+            yield {"sources": cited, "answer": collected}
+            evaluation = self._evaluate(
+                evaluation_mode, query, collected, cited, context, settings, appended_prompt,
+                evaluate_async=evaluation_async,
             )
-            yield {"sources": cited, "evaluation": eval}
+            if cache_ns is not None:
+                self._store_response(cache_ns, q_vec, collected, cited, context, evaluation)
+            yield {"evaluation": evaluation}
         except Exception as exc:
             logger.error("RAG stream error: %s", exc)
             yield "I encountered an error while streaming the response."
-            yield {"sources": [], "evaluation": {}, "error": str(exc)}
-
+            yield {"error": str(exc)}
@@ -0,0 +1,118 @@
+"""
+Retriever backends for search_knowledge_base.
+
+A retriever turns (query text, query embedding) into the hit records the
+rest of the pipeline consumes — ``{"chunk", "title", "relevance"}``, best
+first. AzureSearchRetriever is the production backend; LocalVectorIndex
+(local_index.py) answers from an on-disk bundle without the network, and
+BM25Index (bm25.py) lexically. HybridRetriever fuses any of them with
+reciprocal-rank fusion.
+"""
+import asyncio
+from typing import Any, Dict, List, Optional, Sequence
+
+from azure.search.documents.models import VectorizedQuery
+
+from client_registry import get_search_client, get_async_search_client
+from config import RRF_K, RRF_CANDIDATES
+
+
+class Retriever:
+    """Interface for knowledge-base backends."""
+
+    name = "base"
+
+    def search(self, query: str, q_vec: List[float], top: int = 10) -> List[Dict]:
+        raise NotImplementedError
+
+    async def asearch(self, query: str, q_vec: List[float], top: int = 10) -> List[Dict]:
+        """Async variant; backends without native async I/O run on a worker thread."""
+        return await asyncio.to_thread(self.search, query, q_vec, top)
+
+
+class AzureSearchRetriever(Retriever):
+    """Hybrid (keyword + vector) query against an Azure AI Search index."""
+
+    name = "azure"
+
+    def __init__(
+        self, search_endpoint: str, index_name: str, api_key: Optional[str], vector_field: str
+    ) -> None:
+        # A service name, or a full URL (e.g. the local mock used by benchmarks/bench_server.py)
+        if search_endpoint.startswith(("http://", "https://")):
+            self.endpoint = search_endpoint.rstrip("/")
+        else:
+            self.endpoint = f"https://{search_endpoint}.search.windows.net"
+        self.index_name = index_name
+        self.api_key = api_key
+        self.vector_field = vector_field
+
+    def request(self, query: str, q_vec: List[float], top: int = 10) -> Dict[str, Any]:
+        vec_q = VectorizedQuery(
+            vector=q_vec,
+            k_nearest_neighbors=top,
+            fields=self.vector_field,
+        )
+        return {
+            "search_text": query,
+            "vector_queries": [vec_q],
+            "select": ["chunk", "title"],
+            "top": top,
+        }
+
+    @staticmethod
+    def hit(r: Dict) -> Dict:
+        return {
+            "chunk": r.get("chunk", ""),
+            "title": r.get("title", "Untitled"),
+            "relevance": float(r.get("@search.score") or 0.0),
+        }
+
+    def search(self, query: str, q_vec: List[float], top: int = 10) -> List[Dict]:
+        client = get_search_client(self.endpoint, self.index_name, self.api_key)
+        return [self.hit(r) for r in client.search(**self.request(query, q_vec, top))]
+
+    async def asearch(self, query: str, q_vec: List[float], top: int = 10) -> List[Dict]:
+        client = get_async_search_client(self.endpoint, self.index_name, self.api_key)
+        results = await client.search(**self.request(query, q_vec, top))
+        return [self.hit(r) async for r in results]
+
+
+class HybridRetriever(Retriever):
+    """
+    Reciprocal-rank fusion: each hit scores sum(weight / (k + rank)) over
+    the retrievers that returned it. The fused score becomes "relevance";
+    each backend's own score is kept under "scores".
+    """
+
+    def __init__(
+        self, retrievers: Sequence[Retriever], weights: Optional[Sequence[float]] = None,
+        k: int = RRF_K, candidates: int = RRF_CANDIDATES
+    ) -> None:
+        self.retrievers = list(retrievers)
+        self.weights = list(weights) if weights else [1.0] * len(self.retrievers)
+        self.k = k
+        self.candidates = candidates
+        self.name = "+".join(r.name for r in self.retrievers)
+
+    def search(self, query: str, q_vec: List[float], top: int = 10) -> List[Dict]:
+        ranked = [r.search(query, q_vec, max(top, self.candidates)) for r in self.retrievers]
+        return self.fuse(ranked, top)
+
+    async def asearch(self, query: str, q_vec: List[float], top: int = 10) -> List[Dict]:
+        ranked = await asyncio.gather(
+            *(r.asearch(query, q_vec, max(top, self.candidates)) for r in self.retrievers)
+        )
+        return self.fuse(ranked, top)
+
+    def fuse(self, ranked: Sequence[List[Dict]], top: int = 10) -> List[Dict]:
+        fused: Dict[tuple, Dict] = {}
+        for retriever, weight, hits in zip(self.retrievers, self.weights, ranked):
+            for rank, hit in enumerate(hits, 1):
+                key = (hit["title"], hit["chunk"])
+                entry = fused.get(key)
+                if entry is None:
+                    entry = fused[key] = dict(hit, relevance=0.0, scores={})
+                entry["relevance"] += weight / (self.k + rank)
+                entry["scores"][retriever.name] = hit["relevance"]
+        return sorted(fused.values(), key=lambda h: h["relevance"], reverse=True)[:top]
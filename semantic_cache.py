@@ -0,0 +1,201 @@
+"""
+Semantic response cache.
+
+Answers are stored with the embedding of the query that produced them and
+looked up by nearest neighbour, so paraphrases ("how do I add a fund to a
+lab" / "adding a new fund to a lab") are served without another retrieval
+and chat round trip. Entries are partitioned by namespace — (deployment,
+prompt hash, search index) — and all vectors live in one preallocated
+float32 matrix, so a lookup is a single matrix-vector product.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import similarity
+from config import (
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_TTL,
+)
+
+logger = logging.getLogger(__name__)
+
+Namespace = Tuple[Optional[str], str, Optional[str]]
+
+# Re-storing a query this close to an existing entry replaces it in place
+_DUPLICATE_SIMILARITY = 0.9999
+
+
+def prompt_hash(*parts: Any) -> str:
+    """Stable hash of everything besides the query that shapes an answer."""
+    raw = json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()[:16]
+
+
+class SemanticResponseCache:
+    """Thread-safe nearest-neighbour answer cache with LRU and TTL eviction."""
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = SEMANTIC_CACHE_TTL,
+    ) -> None:
+        self.threshold = threshold
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None  # allocated on first put
+        self._slot_ns = np.full(self.max_entries, -1, dtype=np.int64)
+        self._created = np.zeros(self.max_entries, dtype=np.float64)
+        self._last_used = np.zeros(self.max_entries, dtype=np.float64)
+        self._payloads: List[Optional[Dict[str, Any]]] = [None] * self.max_entries
+        # Namespace <-> id for namespaces that still own a slot; ids are never reused
+        self._ns_ids: Dict[Namespace, int] = {}
+        self._ns_names: Dict[int, Namespace] = {}
+        self._next_ns_id = 0
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidated": 0}
+
+    # ───────────── lookup / store ─────────────
+    def get(self, namespace: Namespace, vector: List[float]) -> Optional[Dict[str, Any]]:
+        """Return the closest cached payload (plus "similarity") or None."""
+        query = self._unit(vector)
+        if query is None:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            idx = self._live_slots(namespace, now, query.shape[0])
+            if idx.size:
+                sims = similarity.dot(query, self._vectors[idx])
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    slot = int(idx[best])
+                    self._last_used[slot] = now
+                    self._counters["hits"] += 1
+                    return dict(self._payloads[slot], similarity=float(sims[best]))
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, namespace: Namespace, vector: List[float], payload: Dict[str, Any]) -> None:
+        unit = self._unit(vector)
+        if unit is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self._vectors is None or self._vectors.shape[1] != unit.shape[0]:
+                self._vectors = np.zeros((self.max_entries, unit.shape[0]), dtype=np.float32)
+                self._slot_ns.fill(-1)
+                self._payloads = [None] * self.max_entries
+                self._ns_ids.clear()
+                self._ns_names.clear()
+            slot = self._slot_for(namespace, unit, now)
+            previous = int(self._slot_ns[slot])
+            self._vectors[slot] = unit
+            self._slot_ns[slot] = self._ns_id(namespace)
+            self._forget_if_empty(previous)
+            self._created[slot] = now
+            self._last_used[slot] = now
+            self._payloads[slot] = dict(payload)
+            self._counters["stores"] += 1
+
+    def invalidate(
+        self, deployment: Optional[str] = None, search_index: Optional[str] = None,
+        prompt_hash: Optional[str] = None
+    ) -> int:
+        """
+        Drop every entry whose namespace matches all given fields (no
+        arguments clears the cache). Returns the number of entries removed.
+        """
+        with self._lock:
+            doomed = [
+                ns_id for (dep, ph, index), ns_id in self._ns_ids.items()
+                if (deployment is None or dep == deployment)
+                and (search_index is None or index == search_index)
+                and (prompt_hash is None or ph == prompt_hash)
+            ]
+            mask = np.isin(self._slot_ns, doomed)
+            for slot in np.flatnonzero(mask):
+                self._payloads[slot] = None
+            self._slot_ns[mask] = -1
+            for ns_id in doomed:
+                del self._ns_ids[self._ns_names.pop(ns_id)]
+            removed = int(mask.sum())
+            self._counters["invalidated"] += removed
+        if removed:
+            logger.info(
+                "Invalidated %d semantic cache entries (deployment=%s, index=%s)",
+                removed, deployment, search_index,
+            )
+        return removed
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._counters)
+            lookups = stats["hits"] + stats["misses"]
+            stats.update(
+                {
+                    "entries": int((self._slot_ns >= 0).sum()),
+                    "namespaces": len(self._ns_ids),
+                    "hit_rate": round(stats["hits"] / lookups, 4) if lookups else 0.0,
+                    "threshold": self.threshold,
+                }
+            )
+            return stats
+
+    # ───────────── internals (lock held) ─────────────
+    @staticmethod
+    def _unit(vector: Optional[List[float]]) -> Optional[np.ndarray]:
+        if not vector:
+            return None
+        unit = similarity.normalize(vector)[0]
+        return unit if unit.any() else None
+
+    def _ns_id(self, namespace: Namespace) -> int:
+        ns_id = self._ns_ids.get(namespace)
+        if ns_id is None:
+            ns_id = self._ns_ids[namespace] = self._next_ns_id
+            self._ns_names[ns_id] = namespace
+            self._next_ns_id += 1
+        return ns_id
+
+    def _forget_if_empty(self, ns_id: int) -> None:
+        # Namespaces embed prompt hashes, so without this every prompt edit would leak one
+        if ns_id in self._ns_names and not (self._slot_ns == ns_id).any():
+            del self._ns_ids[self._ns_names.pop(ns_id)]
+
+    def _live_slots(self, namespace: Namespace, now: float, dim: int) -> np.ndarray:
+        ns_id = self._ns_ids.get(namespace)
+        if ns_id is None or self._vectors is None or self._vectors.shape[1] != dim:
+            return np.empty(0, dtype=np.int64)
+        live = self._slot_ns == ns_id
+        if self.ttl_seconds:
+            expired = live & (now - self._created > self.ttl_seconds)
+            if expired.any():
+                for slot in np.flatnonzero(expired):
+                    self._payloads[slot] = None
+                self._slot_ns[expired] = -1
+                live &= ~expired
+                self._forget_if_empty(ns_id)
+        return np.flatnonzero(live)
+
+    def _slot_for(self, namespace: Namespace, unit: np.ndarray, now: float) -> int:
+        idx = self._live_slots(namespace, now, unit.shape[0])
+        if idx.size:
+            sims = similarity.dot(unit, self._vectors[idx])
+            best = int(np.argmax(sims))
+            if sims[best] >= _DUPLICATE_SIMILARITY:
+                return int(idx[best])
+        reusable = self._slot_ns < 0
+        if self.ttl_seconds:
+            reusable |= now - self._created > self.ttl_seconds
+        free = np.flatnonzero(reusable)
+        if free.size:
+            return int(free[0])
+        self._counters["evictions"] += 1
+        return int(np.argmin(self._last_used))
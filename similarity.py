@@ -0,0 +1,120 @@
+"""
+Vectorized similarity over contiguous float32 matrices.
+
+Everything that compares embeddings locally (response cache lookups,
+reranking, dedupe, the local vector index) goes through here instead of
+looping over Python lists. Rows can be normalized once at insert time
+(NormalizedMatrix) so cosine similarity reduces to a single matrix product.
+"""
+from typing import Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+ArrayLike = Union[np.ndarray, Sequence[float], Sequence[Sequence[float]]]
+
+
+def as_matrix(vectors: ArrayLike) -> np.ndarray:
+    """Return vectors as a C-contiguous 2-D float32 array (one row per vector)."""
+    matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    return matrix
+
+
+def normalize(vectors: ArrayLike) -> np.ndarray:
+    """L2-normalize each row; all-zero rows stay zero."""
+    matrix = as_matrix(vectors)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.maximum(norms, np.finfo(np.float32).tiny, out=norms)
+    return matrix / norms
+
+
+def dot(query: ArrayLike, candidates: ArrayLike) -> np.ndarray:
+    """One-to-many (1-D query → shape (n,)) or many-to-many (→ shape (m, n)) dot products."""
+    scores = as_matrix(query) @ as_matrix(candidates).T
+    return scores[0] if np.ndim(query) == 1 else scores
+
+
+def cosine(query: ArrayLike, candidates: ArrayLike, normalized: bool = False) -> np.ndarray:
+    """
+    Cosine similarity with the same shape rules as dot(). Pass
+    ``normalized=True`` when both sides already have unit rows.
+    """
+    if normalized:
+        return dot(query, candidates)
+    scores = normalize(query) @ normalize(candidates).T
+    return scores[0] if np.ndim(query) == 1 else scores
+
+
+def cosine_pair(a: Sequence[float], b: Sequence[float]) -> float:
+    """Cosine similarity of two vectors (0.0 if either is all zeros)."""
+    return float(cosine(np.asarray(a), np.asarray(b).reshape(1, -1))[0])
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Indices and values of the k highest scores, best first. Uses
+    argpartition, so only the k winners are sorted.
+    """
+    scores = np.asarray(scores)
+    k = min(int(k), scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=scores.dtype)
+    if k < scores.shape[0]:
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(scores.shape[0])
+    idx = idx[np.argsort(-scores[idx], kind="stable")]
+    return idx, scores[idx]
+
+
+class NormalizedMatrix:
+    """Append-only store of unit-length float32 rows for repeated cosine queries."""
+
+    def __init__(self, dim: int, capacity: int = 1024) -> None:
+        self.dim = int(dim)
+        self._rows = np.zeros((max(1, int(capacity)), self.dim), dtype=np.float32)
+        self._size = 0
+
+    @classmethod
+    def from_vectors(cls, vectors: ArrayLike) -> "NormalizedMatrix":
+        unit = normalize(vectors)
+        store = cls(unit.shape[1], capacity=unit.shape[0])
+        store._rows[: unit.shape[0]] = unit
+        store._size = unit.shape[0]
+        return store
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def rows(self) -> np.ndarray:
+        return self._rows[: self._size]
+
+    def add(self, vectors: ArrayLike) -> np.ndarray:
+        """Append vectors; returns their row indices."""
+        unit = normalize(vectors)
+        needed = self._size + unit.shape[0]
+        if needed > self._rows.shape[0]:
+            grown = np.zeros((max(needed, 2 * self._rows.shape[0]), self.dim), dtype=np.float32)
+            grown[: self._size] = self.rows
+            self._rows = grown
+        self._rows[self._size:needed] = unit
+        ids = np.arange(self._size, needed)
+        self._size = needed
+        return ids
+
+    def set(self, index: int, vector: ArrayLike) -> None:
+        self._rows[index] = normalize(vector)[0]
+
+    def scores(self, query: ArrayLike) -> np.ndarray:
+        return dot(normalize(query)[0], self.rows)
+
+    def search(self, query: ArrayLike, k: int, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k (indices, cosine scores); ``mask`` restricts the candidate rows."""
+        scores = self.scores(query)
+        if mask is not None:
+            scores = np.where(mask[: self._size], scores, -np.inf)
+        idx, best = top_k(scores, k)
+        keep = np.isfinite(best)
+        return idx[keep], best[keep]
@@ -0,0 +1,98 @@
+"""
+Helpers for the streaming answer path.
+
+stream_rag_response yields answer text pieces (str) interleaved with
+metadata dicts. ``coalesce_tokens`` / ``acoalesce_tokens`` merge runs of
+text pieces so the routes write one SSE event per flush window instead of
+one per model token; metadata items flush pending text first, so event
+order is preserved. ``close_upstream`` / ``aclose_upstream`` close an OpenAI
+stream so an abandoned request stops consuming completion tokens.
+"""
+import logging
+import time
+from typing import AsyncIterator, Dict, Iterator, List, Union
+
+from config import STREAM_COALESCE_MS, STREAM_COALESCE_CHARS
+
+logger = logging.getLogger(__name__)
+
+StreamItem = Union[str, Dict]
+
+
+class _Coalescer:
+    def __init__(self, interval_ms: float, max_chars: int) -> None:
+        self.interval = interval_ms / 1000
+        self.max_chars = max_chars
+        self.parts: List[str] = []
+        self.size = 0
+        self.last_flush = time.monotonic()
+
+    def add(self, piece: str) -> bool:
+        """Buffer a piece; True when the buffer should be flushed now."""
+        self.parts.append(piece)
+        self.size += len(piece)
+        if self.interval <= 0 or (self.max_chars > 0 and self.size >= self.max_chars):
+            return True
+        return time.monotonic() - self.last_flush >= self.interval
+
+    def flush(self) -> str:
+        text = "".join(self.parts)
+        self.parts, self.size = [], 0
+        self.last_flush = time.monotonic()
+        return text
+
+
+def coalesce_tokens(
+    items: Iterator[StreamItem],
+    interval_ms: float = STREAM_COALESCE_MS,
+    max_chars: int = STREAM_COALESCE_CHARS,
+) -> Iterator[StreamItem]:
+    """Merge text pieces arriving within ``interval_ms`` (or until ``max_chars``)."""
+    buf = _Coalescer(interval_ms, max_chars)
+    for item in items:
+        if isinstance(item, str):
+            if buf.add(item):
+                yield buf.flush()
+            continue
+        if buf.parts:
+            yield buf.flush()
+        yield item
+    if buf.parts:
+        yield buf.flush()
+
+
+async def acoalesce_tokens(
+    items: AsyncIterator[StreamItem],
+    interval_ms: float = STREAM_COALESCE_MS,
+    max_chars: int = STREAM_COALESCE_CHARS,
+) -> AsyncIterator[StreamItem]:
+    """Async variant of coalesce_tokens."""
+    buf = _Coalescer(interval_ms, max_chars)
+    async for item in items:
+        if isinstance(item, str):
+            if buf.add(item):
+                yield buf.flush()
+            continue
+        if buf.parts:
+            yield buf.flush()
+        yield item
+    if buf.parts:
+        yield buf.flush()
+
+
+def close_upstream(stream) -> None:
+    close = getattr(stream, "close", None)
+    if close is not None:
+        try:
+            close()
+        except Exception as exc:
+            logger.warning("Error closing upstream stream: %s", exc)
+
+
+async def aclose_upstream(stream) -> None:
+    close = getattr(stream, "close", None)
+    if close is not None:
+        try:
+            await close()
+        except Exception as exc:
+            logger.warning("Error closing upstream stream: %s", exc)
@@ -0,0 +1,167 @@
+"""
+Non-blocking, structured application logging.
+
+``configure_logging`` installs a QueueHandler on the root logger; records
+are formatted and written (to a size-rotated LOG_FILE and stdout) by a
+QueueListener thread, so file I/O never runs on a request thread. Records
+are JSON lines carrying the current request id, set per request with
+``set_request_id``.
+
+Large request/response payloads go through ``log_payload``: string fields
+longer than LOG_FIELD_MAX_CHARS are truncated or replaced by a SHA-256
+digest (LOG_FIELD_MODE), except for the LOG_PAYLOAD_SAMPLE_RATE fraction of
+requests whose payloads are captured in full.
+"""
+import atexit
+import contextvars
+import hashlib
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from config import (
+    LOG_FORMAT,
+    LOG_FILE,
+    LOG_LEVEL,
+    LOG_JSON,
+    LOG_MAX_BYTES,
+    LOG_BACKUP_COUNT,
+    LOG_FIELD_MAX_CHARS,
+    LOG_FIELD_MODE,
+    LOG_PAYLOAD_SAMPLE_RATE,
+)
+
+FIELD_MODES = ("truncate", "hash", "full")
+
+_request_id: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+_listener: Optional[logging.handlers.QueueListener] = None
+
+# Attributes every LogRecord has; anything else was passed via extra=
+_RESERVED = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+# ───────────── request id ─────────────
+# Caller-supplied ids end up in log lines, trace files and profile filenames
+_REQUEST_ID = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def inbound_request_id(value: Optional[str]) -> Optional[str]:
+    """An X-Request-ID header value if it is safe to reuse, else None (so a new id is generated)."""
+    if value and _REQUEST_ID.fullmatch(value):
+        return value
+    return None
+
+
+def set_request_id(request_id: Optional[str] = None) -> str:
+    """Bind a request id (generated if not given) to the current context."""
+    request_id = request_id or new_request_id()
+    _request_id.set(request_id)
+    return request_id
+
+
+def get_request_id() -> str:
+    return _request_id.get()
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the request id of the context that emitted them."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = _request_id.get()
+        return True
+
+
+# ───────────── formatting ─────────────
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; fields passed with extra= are included."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def shrink(value: Any, mode: str = LOG_FIELD_MODE, max_chars: int = LOG_FIELD_MAX_CHARS) -> Any:
+    """Truncate or hash a large string field; other values pass through."""
+    if mode == "full" or not isinstance(value, str) or len(value) <= max_chars:
+        return value
+    digest = hashlib.sha256(value.encode("utf-8")).hexdigest()[:16]
+    if mode == "hash":
+        return {"sha256": digest, "chars": len(value)}
+    return f"{value[:max_chars]}…[+{len(value) - max_chars} chars, sha256:{digest}]"
+
+
+def payload_sampled(request_id: Optional[str] = None, rate: float = LOG_PAYLOAD_SAMPLE_RATE) -> bool:
+    """Deterministic per-request sampling, so a request is captured whole or not at all."""
+    if rate <= 0:
+        return False
+    if rate >= 1:
+        return True
+    key = (request_id or _request_id.get()).encode("utf-8")
+    return int(hashlib.blake2b(key, digest_size=4).hexdigest(), 16) / 0xFFFFFFFF < rate
+
+
+def log_payload(logger: logging.Logger, event: str, level: int = logging.INFO, **fields: Any) -> None:
+    """Log one structured event whose large fields are size-capped unless sampled."""
+    if not logger.isEnabledFor(level):
+        return
+    full = payload_sampled()
+    fields = {k: v if full else shrink(v) for k, v in fields.items()}
+    logger.log(level, event, extra={"event": event, "payload": fields, "payload_full": full})
+
+
+# ───────────── setup ─────────────
+def configure_logging(level: str = LOG_LEVEL, log_file: str = LOG_FILE, json_lines: bool = LOG_JSON) -> None:
+    """Route all logging through a queue to rotating-file and stdout handlers (idempotent)."""
+    global _listener
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, level.upper(), logging.INFO))
+    if _listener is not None:
+        return
+    formatter = JsonFormatter() if json_lines else logging.Formatter(LOG_FORMAT)
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+    )
+    stream_handler = logging.StreamHandler(sys.stdout)
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # The request id lives in a contextvar, so it must be read on the emitting thread
+    queue_handler.addFilter(RequestIdFilter())
+    root.addHandler(queue_handler)
+    _listener = logging.handlers.QueueListener(
+        log_queue, file_handler, stream_handler, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
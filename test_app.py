@@ -80,6 +80,22 @@ def test_html_file():
         print(f"✗ HTML file error: {e}")
         return False
 
+def test_query_stream_emits_typed_events(monkeypatch):
+    """The SSE endpoint sends tokens, then sources, then the evaluation"""
+    import main
+
+    def fake_stream(query, appended_prompt=None, settings=None, evaluation_mode=None, evaluation_async=False):
+        yield "Add funds "
+        yield "in the grid [1]."
+        yield {"sources": [{"id": "1", "title": "Funds", "content": "grid"}], "answer": "Add funds in the grid [1]."}
+        yield {"evaluation": {"mode": "casefile", "casefile": "## Overall Assessment"}}
+
+    monkeypatch.setattr(main.rag_assistant, "stream_rag_response", fake_stream)
+    resp = main.app.test_client().post('/api/query/stream', json={'query': 'add a fund?', 'evaluation_async': False})
+    assert resp.mimetype == 'text/event-stream'
+    events = [block.split('\n')[0][len('event: '):] for block in resp.get_data(as_text=True).strip().split('\n\n')]
+    assert events == ['meta', 'token', 'token', 'sources', 'evaluation', 'done']
+
 if __name__ == '__main__':
     print("=== RAG Interface Test Suite ===\n")
     
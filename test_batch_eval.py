@@ -0,0 +1,110 @@
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from batch_eval import CALLS_PER_ITEM, DeploymentLimits, RateLimiter, completed_ids, load_questions, run_batch
+from rag_assistant import GenerationSettings
+
+
+class FakeAssistant:
+    system_prompt = "\n    ### Task:\n    Answer from context.\n"
+
+    def __init__(self, fail_on=(), no_context=()):
+        self.fail_on = set(fail_on)
+        self.no_context = set(no_context)
+        self.searches = []
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def default_settings(self):
+        return GenerationSettings(deployment="gpt-4o", top_k=50)
+
+    def search_knowledge_base(self, query, settings=None, q_vec=None):
+        with self.lock:
+            self.searches.append(query)
+        return [] if query in self.no_context else [{"chunk": "Edit funds in the grid.", "title": "Funding grid"}]
+
+    def generate_rag_response(self, query, appended_prompt=None, settings=None, evaluation_mode=None, evaluation_async=False):
+        with self.lock:
+            self.calls.append((query, settings.deployment, evaluation_mode, evaluation_async))
+        if query in self.fail_on:
+            raise RuntimeError("throttled")
+        sources = [{"title": "Funding grid", "content": "Edit funds in the grid."}]
+        report = "## Evaluation Metrics\n- **Overall Score**: 80\n\nLooks fine."
+        return f"Answer to {query} [1]", sources, [], {"mode": "casefile", "casefile": report}, "ctx"
+
+
+def test_load_questions_jsonl_and_csv(tmp_path):
+    jsonl = tmp_path / "q.jsonl"
+    jsonl.write_text(
+        '{"query": "How do I edit funds?", "top_k": "5"}\n\n'
+        '{"question": "Who approves?", "id": "q2", "model": "o3"}\n'
+        '{"query": "How do I edit funds?", "top_k": 5}\n'  # duplicate -> same derived id
+        '{"query": "How do I edit funds?", "top_k": 10}\n'  # differs by settings -> kept
+    )
+    items = load_questions(str(jsonl))
+    assert [i["query"] for i in items] == ["How do I edit funds?", "Who approves?", "How do I edit funds?"]
+    assert items[0]["id"] != items[2]["id"]
+    assert items[0]["top_k"] == 5 and len(items[0]["id"]) == 12 and items[1]["id"] == "q2"
+
+    csv_path = tmp_path / "q.csv"
+    csv_path.write_text("id,question,model\na,How do I edit funds?,\nb,,gpt-4o\n")
+    assert load_questions(str(csv_path)) == [{"id": "a", "query": "How do I edit funds?"}]
+
+
+def test_run_batch_checkpoints_and_resumes(tmp_path):
+    items = [{"id": f"q{i}", "query": f"question {i}"} for i in range(5)]
+    out = str(tmp_path / "out")
+    assistant = FakeAssistant(fail_on={"question 3"}, no_context={"question 4"})
+
+    counts = run_batch(items, assistant, out, workers=3, retries=0, progress_every=0)
+    assert counts == {"total": 5, "skipped": 0, "ok": 3, "failed": 2}
+    assert all(c[2:] == ("casefile", False) for c in assistant.calls)
+    # Empty retrieval fails before any chat or evaluator call
+    assert "question 4" in assistant.searches and "question 4" not in [c[0] for c in assistant.calls]
+    assert len(completed_ids(os.path.join(out, "results.jsonl"))) == 3
+
+    markdown = sorted(os.listdir(os.path.join(out, "markdown")))
+    assert len(markdown) == 3 and markdown[0].startswith("rag-session-")
+    text = open(os.path.join(out, "markdown", markdown[0]), encoding="utf-8").read()
+    assert "## System Prompt\n```\n### Task:\nAnswer from context.\n```" in text
+    assert "## Evaluation Metrics\n\n- **Overall Score**: 80" in text and "## Full Evaluation" in text
+
+    # Resume: only the failed items run again
+    retry = FakeAssistant()
+    counts = run_batch(items, retry, out, workers=2, progress_every=0)
+    assert counts == {"total": 5, "skipped": 3, "ok": 2, "failed": 0}
+    assert sorted(c[0] for c in retry.calls) == ["question 3", "question 4"]
+    with open(os.path.join(out, "results.jsonl"), encoding="utf-8") as fh:
+        statuses = [json.loads(line)["status"] for line in fh]
+    assert statuses.count("ok") == 5 and statuses.count("error") == 2
+
+    # Changed defaults are a different run, so nothing is skipped
+    counts = run_batch(items, FakeAssistant(), out, workers=2, progress_every=0, defaults={"model": "o3", "top_k": 5})
+    assert counts["skipped"] == 0 and counts["ok"] == 5
+
+
+def test_rate_limiter_spaces_calls():
+    limiter = RateLimiter(per_minute=600, burst=2)  # 10 per second after a burst of 2
+    started = time.monotonic()
+    for _ in range(4):
+        limiter.acquire()
+    assert 0.15 <= time.monotonic() - started < 1.0
+
+
+def test_rate_limiter_below_two_requests_per_second():
+    with pytest.raises(ValueError):
+        RateLimiter(per_minute=60).acquire(CALLS_PER_ITEM)
+
+    limits = DeploymentLimits({"gpt-4o": 100})  # < 120 rpm used to leave the bucket below CALLS_PER_ITEM
+    started = time.monotonic()
+    limits.acquire("gpt-4o", CALLS_PER_ITEM)
+    assert time.monotonic() - started < 0.1
+    limits.acquire("gpt-4o", CALLS_PER_ITEM)
+    assert 1.0 <= time.monotonic() - started < 2.0
@@ -0,0 +1,55 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bm25 import BM25Index
+from retrievers import HybridRetriever, Retriever
+
+RECORDS = [
+    {"title": "Funds", "chunk": "To add a fund to a lab, open the fund grid and click New Fund."},
+    {"title": "Users", "chunk": "Lab managers can invite users from the lab settings page."},
+    {"title": "Orders", "chunk": "Orders are charged to the fund selected on the order form."},
+]
+
+
+def test_bm25_ranks_and_roundtrips(tmp_path):
+    index = BM25Index.from_records(RECORDS)
+    hits = index.search("add fund to lab")
+    assert hits[0]["title"] == "Funds" and len(hits) == 3
+    assert hits[0]["relevance"] > hits[1]["relevance"] >= hits[2]["relevance"] > 0
+    assert index.search("zebra") == []
+    index.save(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path), RECORDS)
+    assert np.allclose(loaded.scores("fund grid"), index.scores("fund grid"))
+
+
+class _Fixed(Retriever):
+    def __init__(self, name, titles):
+        self.name, self.titles = name, titles
+
+    def search(self, query, q_vec, top=10):
+        return [{"title": t, "chunk": t.lower(), "relevance": 10.0 - i} for i, t in enumerate(self.titles)]
+
+
+def test_rrf_prefers_documents_both_retrievers_agree_on():
+    hybrid = HybridRetriever([_Fixed("vec", ["A", "B", "C"]), _Fixed("bm25", ["C", "B", "D"])], k=60)
+    hits = hybrid.search("q", [1.0], top=3)
+    assert [h["title"] for h in hits] == ["C", "B", "A"]
+    assert hits[1]["scores"] == {"vec": 9.0, "bm25": 9.0}
+    assert abs(hits[1]["relevance"] - 2 / 62) < 1e-9
+    weighted = HybridRetriever([_Fixed("vec", ["A", "B"]), _Fixed("bm25", ["B", "A"])], weights=[3, 1])
+    assert weighted.search("q", [1.0])[0]["title"] == "A"
+
+
+def test_scores_flow_into_context_and_citations():
+    from rag_assistant import FlaskRAGAssistant
+
+    assistant = FlaskRAGAssistant()
+    hits = [{"title": "low", "chunk": "x", "relevance": 0.1}, {"title": "high", "chunk": "y", "relevance": 0.9}]
+    context, src_map = assistant._prepare_context(hits)
+    assert src_map["1"]["title"] == "high" and src_map["1"]["score"] == 0.9
+    _, cited = assistant._renumber_citations("see [2]", src_map)
+    assert cited[0]["id"] == "1" and cited[0]["title"] == "low" and cited[0]["score"] == 0.1
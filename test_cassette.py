@@ -0,0 +1,121 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+
+import httpx
+import pytest
+import requests
+from azure.core.credentials import AzureKeyCredential
+from azure.core.pipeline.transport import RequestsTransport
+from azure.search.documents import SearchClient
+from openai import AzureOpenAI, APIConnectionError
+from requests.adapters import HTTPAdapter
+
+from cassette import CassetteAdapter, CassetteStore, CassetteTransport, request_key
+from mock_azure import ANSWER, Latency, MockAzureServer
+import rag_assistant
+from rag_assistant import FlaskRAGAssistant
+from retrievers import AzureSearchRetriever
+
+
+def _openai(url, store):
+    http_client = httpx.Client(transport=CassetteTransport(httpx.HTTPTransport(), store))
+    return AzureOpenAI(azure_endpoint=url, api_key="k", api_version="2024-06-01", http_client=http_client, max_retries=0)
+
+
+def _search(url, store):
+    session = requests.Session()
+    session.mount("http://", CassetteAdapter(HTTPAdapter(), store))
+    transport = RequestsTransport(session=session, session_owner=False)
+    return SearchClient(url, "idx", AzureKeyCredential("k"), transport=transport)
+
+
+class _Retriever(AzureSearchRetriever):
+    def __init__(self, client):
+        super().__init__("http://unused", "idx", None, "vector")
+        self.client = client
+
+    def search(self, query, q_vec, top=10):
+        return [self.hit(r) for r in self.client.search(**self.request(query, q_vec, top))]
+
+
+def _rag(url, store, monkeypatch):
+    assistant = FlaskRAGAssistant()
+    assistant.embedding_cache = assistant.response_cache = None
+    assistant.openai_client = _openai(url, store)
+    monkeypatch.setattr(rag_assistant, "get_deployment_client", lambda model: (assistant.openai_client, model))
+    assistant.retriever = _Retriever(_search(url, store))
+    settings = assistant.default_settings()
+    assistant._evaluator(settings.deployment).client = assistant.openai_client
+    answer, _, _, evaluation, context = assistant.generate_rag_response(
+        "How do I edit funds?", settings=settings, evaluation_mode="casefile",
+    )
+    return answer, context, evaluation
+
+
+def _calls(url, store):
+    client = _openai(url, store)
+    answer = client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": "hi"}])
+    stream = client.chat.completions.create(model="gpt-4o", messages=[], stream=True)
+    streamed = [c.choices[0].delta.content for c in stream if c.choices and c.choices[0].delta.content]
+    vector = client.embeddings.create(model="emb", input="funds").data[0].embedding
+    titles = [r["title"] for r in _search(url, store).search(search_text="funds", top=2)]
+    return answer.choices[0].message.content, streamed, vector, titles
+
+
+def test_record_then_replay_without_the_service(tmp_path):
+    mock = MockAzureServer(
+        chat_latency=Latency(0), embedding_latency=Latency(0), search_latency=Latency(0),
+        tokens_per_second=0, dim=8,
+    )
+    mock.start()
+    recorded = _calls(mock.url, CassetteStore(str(tmp_path), "record"))
+    mock.stop()
+    assert recorded[0] == ANSWER and "".join(recorded[1]) == ANSWER
+
+    store = CassetteStore(str(tmp_path), "replay")
+    # Different host: the key ignores it, and nothing listens there
+    assert _calls("http://127.0.0.1:9", store) == recorded
+    assert store.stats() == {"mode": "replay", "hits": 4, "misses": 0, "recorded": 0}
+
+    with pytest.raises(APIConnectionError) as exc:
+        _openai("http://127.0.0.1:9", store).embeddings.create(model="emb", input="never recorded")
+    assert "No recording" in str(exc.value.__cause__)
+
+
+def test_rag_response_with_casefile_evaluation_replays(tmp_path, monkeypatch):
+    mock = MockAzureServer(
+        chat_latency=Latency(0), embedding_latency=Latency(0), search_latency=Latency(0),
+        tokens_per_second=0, dim=8,
+    )
+    mock.start()
+    recorded = _rag(mock.url, CassetteStore(str(tmp_path), "record"), monkeypatch)
+    mock.stop()
+    assert recorded[1] and recorded[2]["casefile"] == ANSWER
+
+    # The casefile is stamped with the current time; that must not change its key
+    store = CassetteStore(str(tmp_path), "replay")
+    assert _rag("http://127.0.0.1:9", store, monkeypatch) == recorded
+    assert store.stats()["misses"] == 0 and store.stats()["hits"] == 4
+
+
+def test_request_key_is_canonical():
+    a = request_key("POST", "https://a.example/x?b=2&a=1", b'{"model": "m", "input": "q"}')
+    b = request_key("post", "http://b.example/x?a=1&b=2", b'{"input":"q","model":"m"}')
+    assert a == b
+    assert a != request_key("POST", "https://a.example/x?a=1&b=2", b'{"input":"other","model":"m"}')
+    stamped = '{"content": "## Session Information\\n- Timestamp: %s\\n- Model: gpt-4o"}'
+    assert request_key("POST", "/c", (stamped % "2026-01-01T10:00:00.123456").encode()) == \
+        request_key("POST", "/c", (stamped % "2026-10-17T23:59:59.000001").encode())
+
+
+def test_identical_bodies_share_a_blob(tmp_path):
+    store = CassetteStore(str(tmp_path), "record")
+    store.save("k1", {}, 200, [("content-type", "application/json")], b'{"same": true}')
+    store.save("k2", {}, 200, [("Set-Cookie", "secret")], b'{"same": true}')
+    blobs = [f for _, _, files in os.walk(tmp_path / "blobs") for f in files]
+    assert len(blobs) == 1
+    entry, body = store.load("k2")
+    assert body == b'{"same": true}' and entry["headers"] == []
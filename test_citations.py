@@ -0,0 +1,27 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from citations import StreamingCitationTracker, renumber_citations
+
+SRC_MAP = {str(i): {"title": f"doc{i}", "content": f"c{i}"} for i in range(1, 4)}
+
+
+def test_single_pass_does_not_chain():
+    answer, cited = renumber_citations("Use [3] then [1], again [3]; ignore [9].", SRC_MAP)
+    assert answer == "Use [1] then [2], again [1]; ignore [9]."
+    assert [(s["id"], s["title"]) for s in cited] == [("1", "doc3"), ("2", "doc1")]
+
+
+def test_stream_tracker_handles_split_citations():
+    tracker = StreamingCitationTracker(SRC_MAP)
+    items = []
+    for piece in ["Funds [", "2", "] and budgets [", "3][2", "]", " done [1"]:
+        text, new = tracker.feed(piece)
+        items += [s["title"] for s in new] + ([text] if text else [])
+    text, new = tracker.flush()
+    items += [text]
+    assert items == ["Funds ", "doc2", "[1] and budgets ", "doc3", "[2]", "[1]", " done ", "[1"]
+    assert tracker.answer == "Funds [1] and budgets [2][1] done [1"
+    assert (tracker.answer, tracker.cited) == renumber_citations("Funds [2] and budgets [3][2] done [1", SRC_MAP)
@@ -0,0 +1,55 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from compression import ExtractiveCompressor
+from context_packing import pack_context, TokenCounter
+
+CHUNK = ("The lab portal was redesigned in 2023. "
+         "To add a fund, open the fund grid and click New Fund. "
+         "The portal supports dark mode. "
+         "Each fund needs a budget and a cost center before it can be saved. "
+         "Support hours are nine to five.")
+
+
+def words(text):
+    return len(text.split())
+
+
+def test_keeps_relevant_sentences_in_order():
+    compressor = ExtractiveCompressor(ratio=0.6)
+    results = [{"title": "Funds", "chunk": CHUNK, "relevance": 1.0}]
+    compressed, report = compressor.compress("how do I add a fund budget", results, words)
+    assert compressed[0]["chunk"] == (
+        "To add a fund, open the fund grid and click New Fund. "
+        "Each fund needs a budget and a cost center before it can be saved."
+    )
+    assert compressed[0]["original_tokens"] == words(CHUNK)
+    assert report["tokens_saved"] == words(CHUNK) - words(compressed[0]["chunk"]) > 0
+    assert compressor.stats()["tokens_saved"] == report["tokens_saved"]
+
+
+def test_short_or_unmatched_chunks_left_whole_and_citations_intact():
+    compressor = ExtractiveCompressor(ratio=0.3)
+    results = [
+        {"title": "Funds", "chunk": CHUNK, "relevance": 2.0},
+        {"title": "Short", "chunk": "Funds are archived yearly.", "relevance": 1.5},
+        {"title": "Other", "chunk": "Orders ship Tuesday. Returns take a week. Labels are free.", "relevance": 1.0},
+    ]
+    compressed, _ = compressor.compress("add fund", results, words)
+    assert compressed[1] is results[1] and compressed[2] is results[2]
+    context, src_map, _ = pack_context(compressed, 1000, TokenCounter())
+    assert [src_map[sid]["title"] for sid in ("1", "2", "3")] == ["Funds", "Short", "Other"]
+    assert f'<source id="1">{compressed[0]["chunk"]}</source>' in context
+
+
+def test_embedding_scores():
+    sentences = {"Alpha one.": [1.0, 0.1], "Beta two.": [0.0, 1.0], "Gamma three.": [0.9, 0.2]}
+    vectors = {"q": [1.0, 0.0], **sentences}
+    compressor = ExtractiveCompressor(
+        method="embedding", ratio=0.7, embed=lambda texts: [vectors[t] for t in texts]
+    )
+    results = [{"title": "t", "chunk": " ".join(sentences), "relevance": 1.0}]
+    compressed, _ = compressor.compress("q", results, words)
+    assert compressed[0]["chunk"] == "Alpha one. Gamma three."
@@ -0,0 +1,57 @@
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import context_packing
+from context_packing import TokenCounter, counter_for, pack_context, truncate_to_tokens
+
+
+def _hit(title, sentences, relevance=1.0):
+    return {"title": title, "chunk": " ".join(sentences), "relevance": relevance}
+
+
+def test_packing_respects_budget_and_reports_tokens():
+    counter = TokenCounter()
+    long_doc = [f"Sentence number {i} explains how lab funds are configured." for i in range(40)]
+    results = [_hit("a", long_doc[:5]), _hit("b", long_doc), _hit("c", long_doc[:2])]
+    context, src_map, report = pack_context(results, budget=200, counter=counter)
+    assert report["context_tokens"] <= 200
+    assert sum(s["tokens"] for s in src_map.values()) < report["context_tokens"]
+    assert not src_map["1"]["truncated"] and src_map["2"]["truncated"]
+    # Truncated at a sentence boundary
+    assert src_map["2"]["content"].endswith("configured.")
+    assert context.startswith('<source id="1">')
+
+
+def test_packing_caps_sources_and_caches_counts():
+    counter = TokenCounter()
+    results = [_hit(str(i), ["Short chunk."]) for i in range(8)]
+    _, src_map, report = pack_context(results, budget=10_000, counter=counter, max_sources=3)
+    assert list(src_map) == ["1", "2", "3"] and report["dropped"] == 5
+    pack_context(results, budget=10_000, counter=counter, max_sources=3)
+    assert counter.cache_info().hits > 0
+    assert truncate_to_tokens("One. Two.", 1, counter.count) == ""
+
+
+def test_counter_for_memoizes_model_lookups(monkeypatch):
+    lookups = []
+
+    def encoding_name_for_model(model):
+        lookups.append(model)
+        if model == "my-finetune":
+            raise KeyError(model)
+        return "o200k_base"
+
+    def get_encoding(name):
+        raise ValueError("offline")
+
+    fake = SimpleNamespace(encoding_name_for_model=encoding_name_for_model, get_encoding=get_encoding)
+    monkeypatch.setattr(context_packing, "tiktoken", fake)
+    monkeypatch.setattr(context_packing, "_counters", {})
+    monkeypatch.setattr(context_packing, "_model_counters", {})
+
+    counters = [counter_for(m) for m in ("gpt-4o", "my-finetune", "gpt-4o", "my-finetune")]
+    assert lookups == ["gpt-4o", "my-finetune"]  # failures are remembered too
+    assert len({id(c) for c in counters}) == 1 and counters[0].encoding_name == "approx"
@@ -0,0 +1,46 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from diversify import ContextDiversifier, MinHasher, mmr_order
+
+BASE = ("To add a fund to a lab open the fund grid select the lab and click the New Fund "
+        "button then enter the fund name budget and cost center before saving the record")
+
+
+def test_minhash_estimates_jaccard():
+    hasher = MinHasher()
+    sim = hasher.similarity_matrix([BASE, BASE + " today", "Orders ship every Tuesday from the east warehouse"])
+    assert sim[0, 1] > 0.8 and sim[0, 2] < 0.1
+    assert np.allclose(np.diag(sim), 1.0)
+
+
+def test_near_duplicates_dropped_and_tokens_counted():
+    results = [
+        {"title": "a", "chunk": BASE, "relevance": 3.0},
+        {"title": "b", "chunk": "Users are invited from the lab settings page by a lab manager", "relevance": 2.0},
+        {"title": "a2", "chunk": BASE + " today", "relevance": 1.0},
+    ]
+    diversifier = ContextDiversifier(threshold=0.8)
+    kept, report = diversifier.apply(results, count_tokens=lambda text: len(text.split()))
+    assert [r["title"] for r in kept] == ["a", "b"]
+    assert report["duplicates_dropped"] == 1 and report["tokens_saved"] == len(BASE.split()) + 1
+    assert diversifier.stats()["tokens_saved"] == report["tokens_saved"]
+
+
+def test_mmr_and_embedding_mode():
+    sim = np.array([[1.0, 0.9, 0.1], [0.9, 1.0, 0.1], [0.1, 0.1, 1.0]])
+    assert mmr_order(np.array([1.0, 0.95, 0.8]), sim, lam=0.5) == [0, 2, 1]
+    assert mmr_order(np.array([1.0, 0.95, 0.8]), sim, lam=1.0) == [0, 1, 2]
+
+    vectors = {"q": [1.0, 0.0], "x": [1.0, 0.1], "y": [1.0, 0.12], "z": [0.0, 1.0]}
+    diversifier = ContextDiversifier(
+        method="embedding", threshold=0.99, mmr_lambda=1.0,
+        embed=lambda texts: [vectors[t] for t in texts],
+    )
+    results = [{"title": t, "chunk": t, "relevance": 0.0} for t in ("z", "y", "x")]
+    kept, report = diversifier.apply(results, query="q")
+    assert [r["title"] for r in kept] == ["x", "z"] and report["duplicates_dropped"] == 1
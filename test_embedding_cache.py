@@ -0,0 +1,51 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from embedding_cache import EmbeddingCache, cache_key
+
+
+def test_normalized_key_shared():
+    assert cache_key("ada", "  hello\n world ") == cache_key("ada", "hello world")
+    assert cache_key("ada", "hello") != cache_key("large", "hello")
+
+
+def test_memory_lru_eviction():
+    cache = EmbeddingCache(path=None, max_entries=2, ttl_seconds=0)
+    cache.put("ada", "a", [1.0, 0.0])
+    cache.put("ada", "b", [0.0, 1.0])
+    assert cache.get("ada", "a") == [1.0, 0.0]
+    cache.put("ada", "c", [0.5, 0.5])
+    assert cache.get("ada", "b") is None
+    stats = cache.stats()
+    assert stats["memory_hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["evictions"] == 1
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "emb.sqlite3")
+    first = EmbeddingCache(path=path, max_entries=4, ttl_seconds=60)
+    first.put("ada", "how do I add a fund", [0.25, -0.5, 1.0])
+
+    second = EmbeddingCache(path=path, max_entries=4, ttl_seconds=60)
+    assert second.get("ada", "how do I add a fund") == [0.25, -0.5, 1.0]
+    assert second.stats()["disk_hits"] == 1
+    assert second.get("ada", "how do I add a fund") == [0.25, -0.5, 1.0]
+    assert second.stats()["memory_hits"] == 1
+
+
+def test_disk_tier_expires_and_caps_rows(tmp_path):
+    path = str(tmp_path / "emb.sqlite3")
+    cache = EmbeddingCache(path=path, max_entries=8, ttl_seconds=0, disk_ttl_seconds=60, disk_max_rows=3)
+    for i in range(5):
+        cache.put("ada", f"text {i}", [float(i)])
+    # Age the newest row past the disk TTL
+    cache._db.execute("UPDATE embeddings SET created_at = created_at - 120 WHERE key = ?", (cache_key("ada", "text 4"),))
+    cache._db.commit()
+
+    reopened = EmbeddingCache(path=path, max_entries=8, ttl_seconds=0, disk_ttl_seconds=60, disk_max_rows=3)
+    assert reopened.stats()["disk_pruned"] == 2  # one expired, one over the cap
+    assert reopened.get("ada", "text 4") is None and reopened.get("ada", "text 0") is None
+    assert [reopened.get("ada", f"text {i}") for i in (1, 2, 3)] == [[1.0], [2.0], [3.0]]
@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from evaluation_jobs import EvaluationJobQueue
+
+
+def test_job_retries_then_succeeds(tmp_path):
+    attempts = []
+
+    def flaky(payload):
+        attempts.append(payload["n"])
+        if len(attempts) < 2:
+            raise RuntimeError("rate limited")
+        return {"mode": "casefile", "casefile": f"report {payload['n']}"}
+
+    queue = EvaluationJobQueue(flaky, path=str(tmp_path / "jobs.db"), max_attempts=3, retry_backoff=0)
+    job_id = queue.enqueue({"n": 7})
+    assert queue.get(job_id)["status"] == "queued"
+    assert queue.run_pending() == 2
+    job = queue.get(job_id)
+    assert job["status"] == "done"
+    assert job["attempts"] == 2
+    assert job["result"]["casefile"] == "report 7"
+
+
+def test_job_fails_after_max_attempts(tmp_path):
+    def broken(payload):
+        raise ValueError("bad casefile")
+
+    queue = EvaluationJobQueue(broken, path=str(tmp_path / "jobs.db"), max_attempts=2, retry_backoff=0)
+    job_id = queue.enqueue({})
+    queue.run_pending()
+    job = queue.get(job_id)
+    assert job["status"] == "failed"
+    assert job["error"] == "bad casefile"
+
+
+def test_worker_threads_drain_queue_and_survive_restart(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    first = EvaluationJobQueue(lambda p: p, path=path)
+    ids = [first.enqueue({"i": i}) for i in range(10)]
+
+    second = EvaluationJobQueue(lambda p: {"echo": p["i"]}, path=path, workers=3, poll_interval=0.01)
+    second.start()
+    deadline = time.time() + 5
+    while time.time() < deadline and second.stats().get("done", 0) < 10:
+        time.sleep(0.02)
+    second.stop()
+    assert [second.get(i)["result"]["echo"] for i in ids] == list(range(10))
+
+
+def test_expired_lease_on_last_attempt_fails_and_unserializable_result_is_retried(tmp_path):
+    queue = EvaluationJobQueue(lambda p: {"bad": object()}, path=str(tmp_path / "jobs.db"),
+                               max_attempts=1, retry_backoff=0, lease_seconds=0)
+    hung = queue.enqueue({})
+    queue._claim()  # worker died while running the only attempt
+    time.sleep(0.01)
+    unserializable = queue.enqueue({})
+    queue.run_pending()
+    assert queue.get(hung)["status"] == "failed"
+    assert queue.get(hung)["error"] == "lease expired on final attempt"
+    assert queue.get(unserializable)["status"] == "failed"
+    assert "not JSON serializable" in queue.get(unserializable)["error"]
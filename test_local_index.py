@@ -0,0 +1,52 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from local_index import LocalVectorIndex, write_bundle
+
+
+def _bundle(tmp_path, n=400, dim=32, graph_degree=0):
+    rng = np.random.default_rng(7)
+    centers = rng.standard_normal((8, dim))
+    vectors = centers[rng.integers(0, 8, n)] + 0.3 * rng.standard_normal((n, dim))
+    records = [{"chunk": f"chunk {i}", "title": f"Doc {i}"} for i in range(n)]
+    path = str(tmp_path / "bundle")
+    write_bundle(path, records, vectors, graph_degree=graph_degree)
+    return path, vectors, rng
+
+
+def test_exact_search_returns_pipeline_records(tmp_path):
+    path, vectors, _ = _bundle(tmp_path)
+    index = LocalVectorIndex(path, mode="exact")
+    assert isinstance(index.rows, np.memmap)
+    hits = index.search("q", list(vectors[42]), top=3)
+    assert hits[0] == {"chunk": "chunk 42", "title": "Doc 42", "relevance": hits[0]["relevance"]}
+    assert abs(hits[0]["relevance"] - 1.0) < 1e-5
+    assert hits[0]["relevance"] >= hits[1]["relevance"] >= hits[2]["relevance"]
+
+
+def test_graph_search_recall(tmp_path):
+    path, vectors, rng = _bundle(tmp_path, graph_degree=12)
+    exact = LocalVectorIndex(path, mode="exact")
+    graph = LocalVectorIndex(path, mode="graph", ef=48)
+    assert graph.mode == "graph"
+    found = total = 0
+    for q in rng.standard_normal((20, vectors.shape[1])):
+        want = {h["chunk"] for h in exact.search("q", list(q), top=10)}
+        got = {h["chunk"] for h in graph.search("q", list(q), top=10)}
+        found, total = found + len(want & got), total + len(want)
+    assert found / total >= 0.9
+
+
+def test_assistant_uses_local_retriever(tmp_path):
+    from rag_assistant import FlaskRAGAssistant
+
+    path, vectors, _ = _bundle(tmp_path, n=20)
+    assistant = FlaskRAGAssistant()
+    assistant.retriever = LocalVectorIndex(path)
+    assistant.generate_embedding = lambda text: list(vectors[5])
+    hits = assistant.search_knowledge_base("anything")
+    assert hits[0]["title"] == "Doc 5" and len(hits) == 10
@@ -0,0 +1,90 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from metrics import Registry, STAGE_ERRORS, STAGE_LATENCY, TOKENS, observe
+
+
+def test_histogram_and_counter_render_prometheus_text():
+    registry = Registry()
+    hist = registry.histogram("lat_seconds", "Latency.", ("stage",), buckets=(0.1, 1.0))
+    counter = registry.counter("errors_total", "Errors.", ("stage",))
+    for value in (0.05, 0.5, 5.0):
+        hist.observe(value, "chat")
+    counter.inc("chat", amount=2)
+    text = registry.render()
+    assert '# TYPE lat_seconds histogram' in text
+    assert 'lat_seconds_bucket{stage="chat",le="0.1"} 1' in text
+    assert 'lat_seconds_bucket{stage="chat",le="1"} 2' in text
+    assert 'lat_seconds_bucket{stage="chat",le="+Inf"} 3' in text
+    assert 'lat_seconds_sum{stage="chat"} 5.55' in text
+    assert 'errors_total{stage="chat"} 2' in text
+
+
+def test_observe_counts_errors():
+    before = STAGE_ERRORS.value("search", "idx-test")
+    with pytest.raises(RuntimeError):
+        with observe("search", "idx-test"):
+            raise RuntimeError("down")
+    assert STAGE_ERRORS.value("search", "idx-test") == before + 1
+    assert STAGE_LATENCY.count("search", "idx-test") >= 1
+
+
+def test_chat_stage_and_tokens_exposed_on_endpoint(monkeypatch):
+    import main
+    import rag_assistant
+
+    class Completions:
+        def create(self, **params):
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))],
+                usage=SimpleNamespace(prompt_tokens=7, completion_tokens=3),
+            )
+
+    chat = SimpleNamespace(chat=SimpleNamespace(completions=Completions()))
+    monkeypatch.setattr(rag_assistant, "get_deployment_client", lambda model: (chat, model))
+    assistant = rag_assistant.FlaskRAGAssistant()
+    monkeypatch.setattr(assistant, "search_knowledge_base", lambda query, settings=None, q_vec=None: [])
+    before = STAGE_LATENCY.count("chat", "metrics-dep")
+    assistant.query("q", deployment="metrics-dep", evaluation_mode="none")
+    assert STAGE_LATENCY.count("chat", "metrics-dep") == before + 1
+    assert TOKENS.value("metrics-dep", "prompt") >= 7
+
+    body = main.app.test_client().get('/api/metrics').get_data(as_text=True)
+    assert 'rag_stage_latency_seconds_count{stage="chat",deployment="metrics-dep"}' in body
+    assert 'rag_tokens_total{deployment="metrics-dep",kind="completion"}' in body
+
+
+def test_streamed_chat_is_timed_and_counts_final_usage_chunk(monkeypatch):
+    import rag_assistant
+
+    def delta(text):
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None)
+
+    seen = {}
+
+    def create(**params):
+        seen.update(params)
+        usage = SimpleNamespace(prompt_tokens=11, completion_tokens=4)
+        return iter([delta("Use the "), delta("grid [1]."), SimpleNamespace(choices=[], usage=usage)])
+
+    chat = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(rag_assistant, "get_deployment_client", lambda model: (chat, model))
+    assistant = rag_assistant.FlaskRAGAssistant()
+    assistant.response_cache = None
+    monkeypatch.setattr(assistant, "search_knowledge_base", lambda query, settings=None, q_vec=None: [
+        {"chunk": "Funds live in the grid.", "title": "Funds", "relevance": 1.0}
+    ])
+    before = STAGE_LATENCY.count("chat", "stream-dep")
+    prompt_before = TOKENS.value("stream-dep", "prompt")
+    settings = assistant.default_settings().with_overrides(deployment="stream-dep")
+    items = list(assistant.stream_rag_response("q", settings=settings, evaluation_mode="none"))
+
+    assert seen["stream_options"] == {"include_usage": True}
+    assert items[-2]["answer"] == "Use the grid [1]."
+    assert STAGE_LATENCY.count("chat", "stream-dep") == before + 1
+    assert TOKENS.value("stream-dep", "prompt") == prompt_before + 11
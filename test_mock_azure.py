@@ -0,0 +1,66 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+
+import pytest
+from openai import AzureOpenAI, RateLimitError
+
+from bench_server import compare, percentile
+from mock_azure import ANSWER, Latency, MockAzureServer
+from retrievers import AzureSearchRetriever
+
+
+@pytest.fixture
+def mock():
+    server = MockAzureServer(
+        chat_latency=Latency(0), embedding_latency=Latency(0), search_latency=Latency(0),
+        tokens_per_second=0, dim=8,
+    )
+    server.start()
+    yield server
+    server.stop()
+
+
+def test_openai_and_search_clients_talk_to_mock(mock):
+    client = AzureOpenAI(azure_endpoint=mock.url, api_key="k", api_version="2024-06-01", max_retries=0)
+    resp = client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": "hi"}])
+    assert resp.choices[0].message.content == ANSWER and resp.usage.completion_tokens > 0
+
+    stream = client.chat.completions.create(
+        model="gpt-4o", messages=[], stream=True, stream_options={"include_usage": True}
+    )
+    chunks = list(stream)
+    assert "".join(c.choices[0].delta.content or "" for c in chunks if c.choices) == ANSWER
+    assert chunks[-1].usage is not None
+
+    vectors = client.embeddings.create(model="emb", input=["a", "b", "a"]).data
+    assert len(vectors[0].embedding) == 8 and vectors[0].embedding == vectors[2].embedding
+
+    hits = AzureSearchRetriever(mock.url, "idx", "k", "vector").search("funds", [0.0] * 8, top=3)
+    assert [h["title"] for h in hits] == ["Funding grid", "Approvals", "Allocations"]
+    assert mock.stats()["requests"] == {"chat": 2, "embeddings": 1, "search": 1}
+
+
+def test_error_injection(mock):
+    mock.error_rate = 1.0
+    client = AzureOpenAI(azure_endpoint=mock.url, api_key="k", api_version="2024-06-01", max_retries=0)
+    with pytest.raises(RateLimitError):
+        client.chat.completions.create(model="gpt-4o", messages=[])
+    assert mock.stats()["errors"] == {"chat": 1}
+
+
+def test_percentile_and_regression_compare():
+    assert percentile([], 50) is None
+    assert percentile([10, 20, 30, 40], 50) == 25
+    assert percentile([1, 2, 3], 100) == 3
+
+    def result(p95, rps):
+        return {"scenario": "query", "concurrency": 8, "throughput_rps": rps,
+                "latency_ms": {"p50": 100, "p95": p95, "p99": p95}}
+
+    baseline = {"results": [result(200, 10.0)]}
+    assert compare([result(210, 9.5)], baseline, threshold=0.1) == []
+    regressions = compare([result(260, 7.0)], baseline, threshold=0.1)
+    assert len(regressions) == 3  # p95, p99 and throughput
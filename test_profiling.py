@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from profiling import ProfilingController, prune
+
+
+def _busy_work(seconds=0.05):
+    end = time.perf_counter() + seconds
+    data = []
+    while time.perf_counter() < end:
+        data.append("x" * 100)
+    return data
+
+
+def test_sampling_profile_writes_collapsed_and_alloc_reports(tmp_path):
+    controller = ProfilingController(sample_rate=0, mode="sample", memory=True, out_dir=str(tmp_path))
+    profile = controller.begin("sample")
+    profile._sampler.interval = 0.001
+    _busy_work()
+    paths = controller.end(profile, "req-1")
+
+    names = sorted(os.path.basename(p) for p in paths)
+    assert [n.split("-req-1-sample")[1] for n in names] == [".alloc.txt", ".collapsed"]
+    collapsed = open(next(p for p in paths if p.endswith(".collapsed"))).read()
+    assert "test_profiling.py:_busy_work" in collapsed
+    stack, count = collapsed.splitlines()[0].rsplit(" ", 1)
+    assert int(count) >= 1 and ";" in stack
+    assert "allocation sites" in open(next(p for p in paths if p.endswith(".alloc.txt"))).read()
+
+
+def test_cpu_profile_and_one_request_at_a_time(tmp_path):
+    controller = ProfilingController(sample_rate=0, mode="sample", memory=False, out_dir=str(tmp_path))
+    assert controller.begin() is None  # sample rate 0: only explicit requests
+
+    profile = controller.begin("cpu")
+    assert controller.begin("cpu") is None  # busy
+    _busy_work(0.01)
+    paths = controller.end(profile, "req-2")
+    assert sorted(os.path.splitext(p)[1] for p in paths) == [".prof", ".txt"]
+    assert "_busy_work" in open(next(p for p in paths if p.endswith(".pstats.txt"))).read()
+
+    controller.configure(sample_rate=1.0)
+    again = controller.begin()
+    assert again is not None and again.mode == "sample"
+    paths = controller.end(again, "../../etc/passwd")
+    assert all(os.path.dirname(p) == str(tmp_path) for p in paths)
+    assert all(".._.._etc_passwd" in os.path.basename(p) for p in paths)
+
+
+def test_prune_keeps_newest_files(tmp_path):
+    for i in range(5):
+        path = tmp_path / f"r{i}.txt"
+        path.write_text("x")
+        os.utime(path, (1000 + i, 1000 + i))
+    prune(str(tmp_path), max_files=2)
+    assert sorted(os.listdir(tmp_path)) == ["r3.txt", "r4.txt"]
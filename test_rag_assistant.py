@@ -0,0 +1,181 @@
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rag_assistant import FlaskRAGAssistant
+
+
+class FakeEmbeddings:
+    def __init__(self, fail_on=None):
+        self.calls = []
+        self.fail_on = fail_on
+
+    def create(self, model, input):
+        inputs = input if isinstance(input, list) else [input]
+        self.calls.append(list(inputs))
+        if self.fail_on and any(self.fail_on in t for t in inputs):
+            raise RuntimeError("bad input")
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=[float(len(t))]) for i, t in enumerate(inputs)
+        ])
+
+
+def _assistant(embeddings):
+    assistant = FlaskRAGAssistant()
+    assistant.embedding_cache = None
+    assistant.openai_client = SimpleNamespace(embeddings=embeddings)
+    return assistant
+
+
+def test_generate_embeddings_preserves_order_and_dedupes():
+    fake = FakeEmbeddings()
+    assistant = _assistant(fake)
+    texts = ["a", "bbb", "a", "", "cc"]
+    vectors, errors = assistant.generate_embeddings(texts)
+    assert vectors == [[1.0], [3.0], [1.0], None, [2.0]]
+    assert errors == {3: "empty input"}
+    assert sum(len(c) for c in fake.calls) == 3
+
+
+def test_generate_embeddings_reports_per_item_failures():
+    fake = FakeEmbeddings(fail_on="poison")
+    assistant = _assistant(fake)
+    vectors, errors = assistant.generate_embeddings(["ok", "poison", "fine"])
+    assert vectors[0] == [2.0] and vectors[2] == [4.0]
+    assert vectors[1] is None
+    assert errors == {1: "bad input"}
+
+
+def test_clients_are_shared_per_deployment():
+    from concurrent.futures import ThreadPoolExecutor
+    from client_registry import get_deployment_client
+    from evaluation_model import EvaluationModel
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        clients = list(pool.map(lambda _: get_deployment_client("o3")[0], range(32)))
+    assert all(c is clients[0] for c in clients)
+    assert EvaluationModel(model="o3").client is clients[0]
+
+
+def test_search_clients_are_pooled_per_index():
+    from client_registry import get_search_client
+
+    a = get_search_client("https://svc.search.windows.net", "idx-a", "key")
+    assert get_search_client("https://svc.search.windows.net", "idx-a", "key") is a
+    b = get_search_client("https://svc.search.windows.net", "idx-b", "key")
+    assert b is not a
+
+
+class _EchoCompletions:
+    """Fake chat client that answers with the parameters it was called with."""
+
+    def create(self, model, messages, max_completion_tokens, **params):
+        import time
+        time.sleep(0.001)
+        content = f"{model}|{max_completion_tokens}|{params.get('temperature')}"
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=1, completion_tokens=1),
+        )
+
+
+def test_concurrent_queries_keep_parameters_isolated(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    import rag_assistant
+
+    chat = SimpleNamespace(chat=SimpleNamespace(completions=_EchoCompletions()))
+    monkeypatch.setattr(rag_assistant, "get_deployment_client", lambda model: (chat, model))
+    assistant = FlaskRAGAssistant()
+    monkeypatch.setattr(assistant, "search_knowledge_base", lambda query, settings=None, q_vec=None: [])
+    defaults = assistant.default_settings()
+
+    def run(i):
+        deployment = f"dep-{i % 7}"
+        answer, _, _ = assistant.query(
+            f"q{i}", deployment=deployment, temperature=i / 100, max_tokens=100 + i,
+            evaluation_mode="none",
+        )
+        return answer == f"{deployment}|{100 + i}|{i / 100}"
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(run, range(200)))
+    assert all(results)
+    # The shared assistant's defaults are never written by a request
+    assert assistant.default_settings() == defaults
+
+
+def test_evaluation_mode_runs_only_requested_evaluators(monkeypatch):
+    import evaluation_model
+    import rag_assistant
+
+    calls = []
+
+    class Counting(_EchoCompletions):
+        def create(self, model, messages, max_completion_tokens, **params):
+            calls.append(messages[0]["content"][:40])
+            return super().create(model, messages, max_completion_tokens, **params)
+
+    chat = SimpleNamespace(chat=SimpleNamespace(completions=Counting()))
+    monkeypatch.setattr(rag_assistant, "get_deployment_client", lambda model: (chat, model))
+    monkeypatch.setattr(evaluation_model, "get_deployment_client", lambda model: (chat, model))
+    assistant = FlaskRAGAssistant()
+    monkeypatch.setattr(
+        assistant, "search_knowledge_base",
+        lambda query, settings=None, q_vec=None: [{"chunk": "Funds live in the grid.", "title": "Funds"}],
+    )
+
+    expected = {"none": (1, set()), "inline": (2, {"inline"}),
+                "casefile": (2, {"casefile"}), "both": (3, {"inline", "casefile"})}
+    for mode, (n_calls, keys) in expected.items():
+        calls.clear()
+        _, _, evaluation = assistant.query("add a fund?", deployment="dep", evaluation_mode=mode)
+        assert len(calls) == n_calls, mode
+        assert set(evaluation) - {"mode"} == keys
+
+
+def test_async_pipeline_matches_sync_protocol(monkeypatch):
+    import asyncio
+    import async_rag_assistant
+
+    class _AsyncEcho(_EchoCompletions):
+        async def create(self, model, messages, max_completion_tokens, **params):
+            await asyncio.sleep(0.001)
+            return _EchoCompletions.create(self, model, messages, max_completion_tokens, **params)
+
+    chat = SimpleNamespace(chat=SimpleNamespace(completions=_AsyncEcho()))
+    monkeypatch.setattr(async_rag_assistant, "get_async_deployment_client", lambda model: (chat, model))
+    assistant = async_rag_assistant.AsyncRAGAssistant()
+    # Shares helpers with the sync assistant, but no request-path method changes colour
+    assert not isinstance(assistant, FlaskRAGAssistant)
+    for name in ("generate_embedding", "search_knowledge_base", "_chat_answer", "_evaluate", "generate_rag_response"):
+        assert asyncio.iscoroutinefunction(getattr(assistant, name))
+
+    async def no_results(query, settings=None, q_vec=None):
+        return []
+
+    monkeypatch.setattr(assistant, "search_knowledge_base", no_results)
+
+    async def run():
+        return await asyncio.gather(*[
+            assistant.query(f"q{i}", deployment=f"dep-{i % 5}", max_tokens=100 + i,
+                            temperature=i / 100, evaluation_mode="none")
+            for i in range(50)
+        ])
+
+    results = asyncio.run(run())
+    for i, (answer, sources, evaluation) in enumerate(results):
+        assert answer == f"dep-{i % 5}|{100 + i}|{i / 100}"
+        assert sources == [] and evaluation == {"mode": "none"}
+
+
+def test_casefile_records_the_callers_system_prompt():
+    assistant = FlaskRAGAssistant()
+    settings = assistant.default_settings().with_overrides(casefile_system_prompt="You are the lab-funds bot.")
+    request = assistant._evaluation_request("casefile", "q", "a", [], "", settings)
+    assert "## System Prompt\nYou are the lab-funds bot.\n" in request["casefile"]
+    # Only recorded: the model still gets the assistant's own prompt
+    assert assistant._build_messages("q", "", settings)[0]["content"] == assistant.system_prompt.strip()
+    default = assistant._evaluation_request("casefile", "q", "a", [], "", assistant.default_settings())
+    assert assistant.system_prompt in default["casefile"]
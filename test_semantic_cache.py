@@ -0,0 +1,80 @@
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from semantic_cache import SemanticResponseCache
+
+NS = ("gpt-4o", "prompt-a", "idx")
+
+
+def test_paraphrase_hits_within_namespace_only():
+    cache = SemanticResponseCache(threshold=0.95, max_entries=8, ttl_seconds=0)
+    cache.put(NS, [1.0, 0.0, 0.1], {"answer": "grid"})
+    hit = cache.get(NS, [0.98, 0.02, 0.1])
+    assert hit["answer"] == "grid" and hit["similarity"] > 0.95
+    assert cache.get(NS, [0.0, 1.0, 0.0]) is None
+    assert cache.get(("gpt-4o", "prompt-b", "idx"), [1.0, 0.0, 0.1]) is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2
+
+
+def test_lru_eviction_and_invalidation():
+    cache = SemanticResponseCache(threshold=0.99, max_entries=2, ttl_seconds=0)
+    cache.put(NS, [1.0, 0.0], {"answer": "a"})
+    cache.put(("o3", "prompt-a", "other"), [0.0, 1.0], {"answer": "b"})
+    assert cache.get(NS, [1.0, 0.0])["answer"] == "a"
+    cache.put(NS, [0.7, 0.7], {"answer": "c"})  # evicts "b", the least recently used
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["namespaces"] == 1  # "b" was the last entry of its namespace
+    assert cache.get(("o3", "prompt-a", "other"), [0.0, 1.0]) is None
+    assert cache.invalidate(search_index="idx") == 2
+    assert cache.get(NS, [1.0, 0.0]) is None
+    assert cache.stats()["namespaces"] == 0
+
+
+def test_assistant_serves_paraphrase_from_cache(monkeypatch):
+    import rag_assistant
+
+    calls = []
+
+    def create(model, messages, max_completion_tokens, **params):
+        calls.append(model)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="Use the grid [1]."))],
+            usage=SimpleNamespace(prompt_tokens=1, completion_tokens=1),
+        )
+
+    chat = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(rag_assistant, "get_deployment_client", lambda model: (chat, model))
+    assistant = rag_assistant.FlaskRAGAssistant()
+    assistant.response_cache = SemanticResponseCache(threshold=0.9, max_entries=8, ttl_seconds=60)
+    vectors = {"how do I add a fund to a lab": [1.0, 0.1], "adding a new fund to a lab": [0.95, 0.12]}
+    embedded = []
+    monkeypatch.setattr(assistant, "generate_embedding", lambda text: embedded.append(text) or vectors[text])
+    assistant.retriever = SimpleNamespace(
+        name="stub", search=lambda query, q_vec: [{"chunk": "Funds live in the grid.", "title": "Funds"}],
+    )
+
+    first = assistant.query("how do I add a fund to a lab", evaluation_mode="none")
+    assert embedded == ["how do I add a fund to a lab"]  # the cache lookup's vector is reused for search
+    second = assistant.query("adding a new fund to a lab", evaluation_mode="none")
+    assert second == first and len(calls) == 1
+    assistant.query("adding a new fund to a lab", max_tokens=50, evaluation_mode="none")
+    assert len(calls) == 2  # different generation settings, different namespace
+    assistant.query("adding a new fund to a lab", casefile_system_prompt="Be strict.", evaluation_mode="none")
+    assert len(calls) == 3  # the casefile prompt shapes the cached evaluation
+    assert assistant.invalidate_response_cache() == 3
+
+
+def test_cache_invalidation_requires_admin_token(monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "PROFILING_ADMIN_TOKEN", "s3cret")
+    client = main.app.test_client()
+    assert client.post('/api/cache/invalidate', json={}).status_code == 403
+    denied = client.post('/api/cache/invalidate', json={}, headers={'X-Admin-Token': 'wrong'})
+    assert denied.status_code == 403
+    allowed = client.post('/api/cache/invalidate', json={}, headers={'X-Admin-Token': 's3cret'})
+    assert allowed.status_code != 403
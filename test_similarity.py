@@ -0,0 +1,39 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import similarity
+from rag_assistant import FlaskRAGAssistant
+
+
+def test_cosine_shapes_and_compat_wrapper():
+    a, b = [1.0, 2.0, 3.0], [3.0, -1.0, 0.5]
+    expected = np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+    assert abs(FlaskRAGAssistant.cosine_similarity(a, b) - expected) < 1e-6
+    assert FlaskRAGAssistant.cosine_similarity(a, [0.0, 0.0, 0.0]) == 0.0
+    assert similarity.cosine(a, [a, b]).shape == (2,)
+    assert similarity.cosine([a, b], [a, b, a]).shape == (2, 3)
+    assert np.allclose(np.diag(similarity.cosine([a, b], [a, b])), 1.0)
+
+
+def test_top_k_matches_full_sort():
+    rng = np.random.default_rng(1)
+    scores = rng.standard_normal(500).astype(np.float32)
+    idx, best = similarity.top_k(scores, 7)
+    assert list(idx) == list(np.argsort(-scores)[:7])
+    assert np.all(np.diff(best) <= 0)
+    assert len(similarity.top_k(scores[:3], 10)[0]) == 3
+
+
+def test_normalized_matrix_grows_and_masks():
+    store = similarity.NormalizedMatrix(dim=2, capacity=1)
+    store.add([[1.0, 0.0], [0.0, 2.0]])
+    store.add([0.6, 0.8])
+    assert len(store) == 3
+    idx, scores = store.search([0.0, 1.0], k=2)
+    assert list(idx) == [1, 2] and abs(scores[0] - 1.0) < 1e-6
+    idx, _ = store.search([0.0, 1.0], k=3, mask=np.array([True, False, True]))
+    assert list(idx) == [2, 0]
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from streaming import coalesce_tokens
+
+HITS = [{"chunk": "Funds live in the grid.", "title": "Funds", "relevance": 1.0}]
+
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+class _EndlessStream:
+    """Upstream that never finishes on its own; records how far it was read."""
+
+    def __init__(self):
+        self.sent = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self.sent += 1
+        return _chunk(f"t{self.sent} ")
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await asyncio.sleep(0.001)
+        return next(self)
+
+
+def test_coalesce_merges_text_and_keeps_event_order():
+    items = ["a", "b", {"source": 1}, "c", "d", "e", {"sources": []}]
+    assert list(coalesce_tokens(items, interval_ms=10_000, max_chars=0)) == [
+        "ab", {"source": 1}, "cde", {"sources": []}
+    ]
+    assert list(coalesce_tokens(iter("abcde"), interval_ms=10_000, max_chars=2)) == ["ab", "cd", "e"]
+    assert list(coalesce_tokens(iter("abc"), interval_ms=0)) == ["a", "b", "c"]
+
+
+def test_closing_sync_stream_closes_upstream(monkeypatch):
+    import rag_assistant
+
+    upstream = _EndlessStream()
+    upstream.close = lambda: setattr(upstream, "closed", True)
+    chat = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **kw: upstream)))
+    monkeypatch.setattr(rag_assistant, "get_deployment_client", lambda model: (chat, model))
+    assistant = rag_assistant.FlaskRAGAssistant()
+    monkeypatch.setattr(assistant, "search_knowledge_base", lambda query, settings=None, q_vec=None: HITS)
+
+    items = assistant.stream_rag_response("q", evaluation_mode="none")
+    assert [next(items) for _ in range(3)] == ["t1 ", "t2 ", "t3 "]
+    items.close()
+    assert upstream.closed and upstream.sent == 3
+
+
+def test_asgi_disconnect_cancels_upstream(monkeypatch):
+    import asgi_app
+    import async_rag_assistant
+
+    upstream = _EndlessStream()
+
+    async def close():
+        upstream.closed = True
+
+    async def create(**kw):
+        return upstream
+
+    upstream.close = close
+    chat = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(async_rag_assistant, "get_async_deployment_client", lambda model: (chat, model))
+    assistant = async_rag_assistant.AsyncRAGAssistant()
+
+    async def search(query, settings=None, q_vec=None):
+        return HITS
+
+    monkeypatch.setattr(assistant, "search_knowledge_base", search)
+    monkeypatch.setattr(asgi_app, "rag_assistant", assistant)
+
+    async def run():
+        messages = [{"type": "http.request", "body": json.dumps({"query": "q", "evaluation_mode": "none"}).encode()}]
+        tokens = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            while len(tokens) < 5:
+                await asyncio.sleep(0.001)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if b"event: token" in message.get("body", b""):
+                tokens.append(message)
+
+        await asyncio.wait_for(asgi_app.query_stream(receive, send), timeout=5)
+        return len(tokens)
+
+    assert asyncio.run(run()) >= 5
+    assert upstream.closed
+
+
+def test_stream_without_hits_matches_non_stream_answer(monkeypatch):
+    import rag_assistant
+    import async_rag_assistant
+
+    def reply():
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="Not in the docs."))], usage=None
+        )
+
+    async def acreate(**kw):
+        return reply()
+
+    chat = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **kw: reply())))
+    achat = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=acreate)))
+    monkeypatch.setattr(rag_assistant, "get_deployment_client", lambda model: (chat, model))
+    monkeypatch.setattr(async_rag_assistant, "get_async_deployment_client", lambda model: (achat, model))
+    assistant = rag_assistant.FlaskRAGAssistant()
+    assistant.response_cache = None
+    monkeypatch.setattr(assistant, "search_knowledge_base", lambda query, settings=None, q_vec=None: [])
+    aassistant = async_rag_assistant.AsyncRAGAssistant()
+    aassistant.response_cache = None
+
+    async def search(query, settings=None, q_vec=None):
+        return []
+
+    monkeypatch.setattr(aassistant, "search_knowledge_base", search)
+
+    async def drain():
+        return [item async for item in aassistant.stream_rag_response("q", evaluation_mode="none")]
+
+    expected = [
+        "Not in the docs.", {"sources": [], "answer": "Not in the docs."}, {"evaluation": {"mode": "none"}}
+    ]
+    assert list(assistant.stream_rag_response("q", evaluation_mode="none")) == expected
+    assert asyncio.run(drain()) == expected
+    answer, sources, _, evaluation, _ = assistant.generate_rag_response("q", evaluation_mode="none")
+    assert (answer, sources, evaluation) == ("Not in the docs.", [], {"mode": "none"})
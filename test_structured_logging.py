@@ -0,0 +1,58 @@
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from structured_logging import (
+    JsonFormatter, RequestIdFilter, inbound_request_id, log_payload, payload_sampled, set_request_id, shrink,
+)
+
+
+class _Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.addFilter(RequestIdFilter())
+        self.setFormatter(JsonFormatter())
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(json.loads(self.format(record)))
+
+
+def test_shrink_modes():
+    text = "x" * 50
+    assert shrink(text, "truncate", 10).startswith("x" * 10 + "…[+40 chars, sha256:")
+    hashed = shrink(text, "hash", 10)
+    assert hashed["chars"] == 50 and len(hashed["sha256"]) == 16
+    assert shrink(text, "full", 10) == text and shrink(42, "truncate", 1) == 42
+
+
+def test_payload_records_are_json_with_request_id():
+    logger = logging.getLogger("test_structured_logging.payload")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    capture = _Capture()
+    logger.addHandler(capture)
+
+    rid = set_request_id("req-1")
+    log_payload(logger, "chat_request", deployment="o3", system_prompt="p" * 5000)
+    record = capture.lines[-1]
+    assert record["request_id"] == rid and record["event"] == "chat_request"
+    assert record["payload"]["deployment"] == "o3"
+    assert len(record["payload"]["system_prompt"]) < 2100 and not record["payload_full"]
+
+
+def test_sampling_is_per_request():
+    decisions = {rid: payload_sampled(rid, 0.5) for rid in (f"r{i}" for i in range(400))}
+    assert all(payload_sampled(rid, 0.5) == d for rid, d in decisions.items())
+    assert 120 < sum(decisions.values()) < 280
+    assert payload_sampled("r1", 1.0) and not payload_sampled("r1", 0.0)
+
+
+def test_inbound_request_id_is_validated():
+    assert inbound_request_id("req-1.retry_2") == "req-1.retry_2"
+    for bad in (None, "", "../../etc/passwd", "a b", "x" * 65, "id\nforged log line"):
+        assert inbound_request_id(bad) is None
+    assert len(set_request_id(inbound_request_id("../evil"))) == 16
@@ -0,0 +1,113 @@
+import os
+import time
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import tracing
+from tracing import JsonlSpanExporter, load_trace, render_waterfall, span, start_trace
+
+
+def _enable(monkeypatch, tmp_path):
+    path = str(tmp_path / "traces.jsonl")
+    exporter = JsonlSpanExporter(path, batch_size=4, flush_seconds=0.05)
+    monkeypatch.setattr(tracing, "TRACING_ENABLED", True)
+    monkeypatch.setattr(tracing, "_exporter", exporter)
+    return exporter, path
+
+
+def test_spans_nest_and_export(monkeypatch, tmp_path):
+    exporter, path = _enable(monkeypatch, tmp_path)
+    root = start_trace("POST /api/query", trace_id="req-nest")
+    with span("search", index="idx") as sp:
+        sp.set(hits=3)
+        with span("embedding", cache_hit=True):
+            pass
+    try:
+        with span("chat"):
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+    root.finish()
+    exporter.flush()
+
+    spans = {s["name"]: s for s in load_trace("req-nest", path)}
+    assert set(spans) == {"POST /api/query", "search", "embedding", "chat"}
+    assert spans["embedding"]["parent_id"] == spans["search"]["span_id"]
+    assert spans["search"]["parent_id"] == spans["POST /api/query"]["span_id"]
+    assert spans["search"]["attributes"] == {"index": "idx", "hits": 3}
+    assert spans["chat"]["status"] == "error"
+    lines = render_waterfall(list(spans.values())).splitlines()
+    assert lines[0].startswith("trace req-nest")
+    assert [line.split("|")[-1].strip().split()[0] for line in lines[1:]] == [
+        "POST", "search", "embedding", "chat"
+    ]
+
+
+def test_flask_request_is_traced_under_its_request_id(monkeypatch, tmp_path):
+    import main
+    import rag_assistant
+
+    exporter, path = _enable(monkeypatch, tmp_path)
+
+    class Completions:
+        def create(self, **params):
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))],
+                usage=SimpleNamespace(prompt_tokens=5, completion_tokens=2),
+            )
+
+    chat = SimpleNamespace(chat=SimpleNamespace(completions=Completions()))
+    monkeypatch.setattr(rag_assistant, "get_deployment_client", lambda model: (chat, model))
+    monkeypatch.setattr(main.rag_assistant, "search_knowledge_base", lambda query, settings=None, q_vec=None: [])
+    resp = main.app.test_client().post(
+        "/api/query", json={"query": "q", "evaluation_mode": "none"}, headers={"X-Request-ID": "req-flask"}
+    )
+    assert resp.headers["X-Request-ID"] == "req-flask"
+    exporter.flush()
+
+    spans = {s["name"]: s for s in load_trace("req-flask", path)}
+    root = spans["POST /api/query"]
+    assert root["attributes"]["status_code"] == 200
+    assert spans["chat"]["parent_id"] == root["span_id"]
+    assert spans["chat"]["attributes"] == {"deployment": "gpt-4o", "prompt_tokens": 5, "completion_tokens": 2}
+    assert spans["serialize"]["parent_id"] == root["span_id"]
+
+
+def test_failed_stream_create_still_exports_its_span(monkeypatch, tmp_path):
+    import rag_assistant
+
+    exporter, path = _enable(monkeypatch, tmp_path)
+
+    class Completions:
+        def create(self, **params):
+            raise RuntimeError("429 throttled")
+
+    chat = SimpleNamespace(chat=SimpleNamespace(completions=Completions()))
+    monkeypatch.setattr(rag_assistant, "get_deployment_client", lambda model: (chat, model))
+    assistant = rag_assistant.FlaskRAGAssistant()
+    assistant.response_cache = None
+    monkeypatch.setattr(assistant, "search_knowledge_base", lambda query, settings=None, q_vec=None: [
+        {"chunk": "Edit funds in the grid.", "title": "Funds", "relevance": 1.0}
+    ])
+    root = start_trace("POST /api/query/stream", trace_id="req-stream-fail")
+    events = list(assistant.stream_rag_response("q", evaluation_mode="none"))
+    root.finish()
+    exporter.flush()
+
+    assert {"error": "429 throttled"} in events
+    spans = {s["name"]: s for s in load_trace("req-stream-fail", path)}
+    assert spans["chat_stream"]["status"] == "error"
+    assert spans["chat_stream"]["parent_id"] == spans["POST /api/query/stream"]["span_id"]
+
+
+def test_exporter_batches_until_size_or_deadline(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    exporter = JsonlSpanExporter(str(path), batch_size=100, flush_seconds=30)
+    for i in range(3):
+        exporter.export({"trace_id": "t", "name": f"s{i}"})
+    time.sleep(0.1)
+    assert not path.exists()  # an idle queue alone does not trigger a write
+    exporter.flush()
+    assert len(path.read_text().splitlines()) == 3
@@ -0,0 +1,281 @@
+"""
+Lightweight per-request tracing.
+
+Every request gets a root span whose trace id is the request id (see
+structured_logging); stages open nested spans with ``span(name, **attrs)``.
+Parentage follows a contextvar, so spans nest correctly across function
+calls, asyncio tasks and ``asyncio.to_thread``. Finished spans are queued to
+a background JsonlSpanExporter that appends them to TRACE_FILE in batches.
+With TRACING_ENABLED=false, ``span`` returns a shared no-op object.
+
+Print one request as a waterfall:
+
+    python tracing.py waterfall <request_id> [--file traces.jsonl]
+"""
+import argparse
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from config import TRACING_ENABLED, TRACE_FILE, TRACE_BATCH_SIZE, TRACE_FLUSH_SECONDS
+from structured_logging import get_request_id
+
+logger = logging.getLogger(__name__)
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed operation; use as a context manager or call finish()."""
+
+    __slots__ = ("trace_id", "span_id", "parent", "name", "start", "_t0", "duration_ms", "attributes", "status")
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, trace_id: Optional[str] = None, **attributes: Any):
+        self.name = name
+        self.parent = parent
+        self.trace_id = trace_id or (parent.trace_id if parent else None) or _trace_id()
+        self.span_id = uuid.uuid4().hex[:16]
+        self.attributes = attributes
+        self.status = "ok"
+        self.duration_ms: Optional[float] = None
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+
+    def set(self, **attributes: Any) -> "Span":
+        self.attributes.update(attributes)
+        return self
+
+    def __enter__(self) -> "Span":
+        _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if exc_type is not None and issubclass(exc_type, Exception):
+            self.fail(exc)
+        self.finish()
+        return False
+
+    def fail(self, exc: BaseException) -> "Span":
+        self.status = "error"
+        self.attributes["error"] = repr(exc)
+        return self
+
+    def finish(self) -> None:
+        if self.duration_ms is not None:
+            return
+        self.duration_ms = (time.perf_counter() - self._t0) * 1000
+        if _current.get() is self:
+            _current.set(self.parent)
+        exporter = get_exporter()
+        if exporter is not None:
+            exporter.export(self.to_dict())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration_ms or 0.0, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attributes: Any) -> "_NoopSpan":
+        return self
+
+    def fail(self, exc: BaseException) -> "_NoopSpan":
+        return self
+
+    def finish(self) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _trace_id() -> str:
+    request_id = get_request_id()
+    return request_id if request_id != "-" else uuid.uuid4().hex[:16]
+
+
+def span(name: str, **attributes: Any):
+    """Child span of the current one (a root span if there is none)."""
+    if not TRACING_ENABLED:
+        return NOOP_SPAN
+    return Span(name, parent=_current.get(), **attributes)
+
+
+def start_trace(name: str, trace_id: Optional[str] = None, **attributes: Any):
+    """Root span made current until finish(); for request hooks that cannot use ``with``."""
+    if not TRACING_ENABLED:
+        return NOOP_SPAN
+    root = Span(name, trace_id=trace_id, **attributes)
+    _current.set(root)
+    return root
+
+
+def current_span():
+    return _current.get() or NOOP_SPAN
+
+
+def usage_attributes(usage) -> Dict[str, Any]:
+    """Span attributes from an OpenAI ``usage`` object (None when absent)."""
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+    }
+
+
+# ───────────── export ─────────────
+_FLUSH: Dict[str, Any] = {}
+
+
+class JsonlSpanExporter:
+    """Appends finished spans to a JSONL file from a background thread, in batches."""
+
+    def __init__(
+        self, path: str = TRACE_FILE, batch_size: int = TRACE_BATCH_SIZE,
+        flush_seconds: float = TRACE_FLUSH_SECONDS, max_queue: int = 10000,
+    ) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.dropped = 0
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(max_queue)
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, record: Dict[str, Any]) -> None:
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            # Never block a request on trace export
+            self.dropped += 1
+
+    def flush(self) -> None:
+        """Block until every span exported so far is on disk."""
+        # The marker wakes the writer and makes it write whatever it holds
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def _run(self) -> None:
+        batch: List[Dict[str, Any]] = []
+        deadline = time.monotonic() + self.flush_seconds
+        while True:
+            flush_now = False
+            try:
+                record = self._queue.get(timeout=max(deadline - time.monotonic(), 0.01))
+                if record is _FLUSH:
+                    flush_now = True
+                    self._queue.task_done()
+                else:
+                    batch.append(record)
+            except queue.Empty:
+                pass
+            # Flush on size or on the timer; flush() asks for an early write
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline or flush_now):
+                self._write(batch)
+                for _ in batch:
+                    self._queue.task_done()
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_seconds
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as fh:
+                fh.write("".join(json.dumps(r, default=str) + "\n" for r in batch))
+        except OSError as exc:
+            logger.warning("Could not write %d spans to %s: %s", len(batch), self.path, exc)
+
+
+_exporter: Optional[JsonlSpanExporter] = None
+_exporter_lock = threading.Lock()
+
+
+def get_exporter() -> Optional[JsonlSpanExporter]:
+    global _exporter
+    if _exporter is None and TRACING_ENABLED:
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = JsonlSpanExporter()
+                atexit.register(_exporter.flush)
+    return _exporter
+
+
+# ───────────── waterfall ─────────────
+def load_trace(trace_id: str, path: str = TRACE_FILE) -> List[Dict[str, Any]]:
+    spans = []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            if trace_id in line:
+                record = json.loads(line)
+                if record["trace_id"] == trace_id:
+                    spans.append(record)
+    return spans
+
+
+def render_waterfall(spans: List[Dict[str, Any]], width: int = 40) -> str:
+    """Text waterfall: one row per span, indented by depth, bar placed on the request timeline."""
+    if not spans:
+        return "no spans"
+    by_id = {s["span_id"]: s for s in spans}
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    for s in spans:
+        parent = s["parent_id"] if s["parent_id"] in by_id else None
+        children.setdefault(parent, []).append(s)
+    t0 = min(s["start"] for s in spans)
+    total_ms = max((s["start"] - t0) * 1000 + s["duration_ms"] for s in spans) or 1.0
+    rows = [f"trace {spans[0]['trace_id']}  {total_ms:.1f} ms  {len(spans)} spans"]
+
+    def walk(parent_id: Optional[str], depth: int) -> None:
+        for s in sorted(children.get(parent_id, []), key=lambda x: x["start"]):
+            offset_ms = (s["start"] - t0) * 1000
+            lead = int(offset_ms / total_ms * width)
+            bar = "#" * max(1, round(s["duration_ms"] / total_ms * width))
+            attrs = " ".join(f"{k}={v}" for k, v in s["attributes"].items())
+            flag = " !" if s["status"] != "ok" else ""
+            rows.append(
+                f"{offset_ms:9.1f} {s['duration_ms']:9.1f} ms  "
+                f"|{(' ' * lead + bar).ljust(width)[:width]}|  {'  ' * depth}{s['name']}{flag}  {attrs}".rstrip()
+            )
+            walk(s["span_id"], depth + 1)
+
+    walk(None, 0)
+    return "\n".join(rows)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Inspect exported request traces")
+    sub = parser.add_subparsers(dest="command", required=True)
+    waterfall = sub.add_parser("waterfall", help="print the spans of one request")
+    waterfall.add_argument("request_id")
+    waterfall.add_argument("--file", default=TRACE_FILE)
+    args = parser.parse_args(argv)
+    print(render_waterfall(load_trace(args.request_id, args.file)))
+
+
+if __name__ == "__main__":
+    main()